@@ -1,23 +1,494 @@
+import asyncio
+import copy
 import os
+import random
 import re
 import json
-from openai import OpenAI
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+    AsyncOpenAI,
+    OpenAI,
+)
 from dotenv import load_dotenv
-from price_fetcher import estimate_component_price
+
+import metrics
+from local_analysis import analyze_locally
+from preprocess import DEFAULT_TOKEN_BUDGET, compact_listing_text
+from seen_listings import content_hash
+from price_fetcher import estimate_component_price, write_behind
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# OpenAI-compatible endpoint (e.g. stub_openai_server.py); None is the OpenAI API
+ANALYSIS_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+
+
+def _api_key(base_url=None):
+    """OPENAI_API_KEY; another endpoint (e.g. the local stub) may not need one, so a placeholder is used."""
+    return os.getenv("OPENAI_API_KEY") or ("unused" if base_url else None)
+
+
+# Clients, created on first use: importing this module needs no API key (async retries are handled by the analyzer)
+client = None
+_async_client = None
+
+ANALYSIS_MODEL = "gpt-4o"
+ANALYSIS_MAX_CONCURRENCY = 4
+ANALYSIS_MAX_RETRIES = 4
+ANALYSIS_TIMEOUT_SECONDS = 60.0
+ANALYSIS_BACKOFF_BASE_SECONDS = 0.5
+ANALYSIS_BACKOFF_MAX_SECONDS = 20.0
+
+# Listings packed into one request by analyze_batch_async
+ANALYSIS_BATCH_SIZE = 5
+
+ANALYSIS_CACHE_FILE = "analysis_cache.json"
+ANALYSIS_CACHE_TTL_SECONDS = 7 * 24 * 3600
+ANALYSIS_CACHE_MAX_ENTRIES = 2000
+# Compact the cache journal once superseded lines exceed max(this, live entries)
+ANALYSIS_CACHE_COMPACT_MIN_SUPERSEDED = 100
+
+# Prompt blocks shared by the single-listing and batched prompts
+APPRAISAL_TASK = """
+Task:
+1. Identify the specific PC components (CPU, GPU, RAM, SSD/HDD, Motherboard, PSU).
+2. Estimate the current USED market price in France (in EUR) for each part separately. Be CONSERVATIVE (undervalue slightly).
+3. Ignore peripherals (keyboard/mouse) unless they are high-end.
+4. CRITICAL: Value "Cases", "Fans", and "PSUs" at 0 EUR unless they are clearly high-end brands (Corsair, Seasonic, Lian Li, etc) AND models. Standard/Generic = 0.
+5. If the description mentions "HS", "H.S", "Panne", "Broken", "Pour pièces", set verdict to "TRASH".
+""".strip()
+
+APPRAISAL_RESULT_FIELDS = """
+"parts": [
+    { "component": "Name (e.g. RTX 3060)", "estimated_price": 150, "notes": "optional" }
+],
+"total_estimated_value": 0,
+"profit_potential": 0,
+"profit_percentage": 0,
+"verdict": "BUY" or "PASS" or "TRASH",
+"reasoning": "Short explanation of the verdict"
+""".strip()
+
+VERDICT_LOGIC = """
+Logic for Verdict:
+- TRASH if broken/HS.
+- BUY if (Total Estimated - Listing Price) / Listing Price > 0.50 (50% margin).
+- PASS otherwise.
+""".strip()
+
+
+def get_client():
+    """The shared OpenAI client (built lazily)."""
+    global client
+    if client is None:
+        client = OpenAI(api_key=_api_key(ANALYSIS_BASE_URL), base_url=ANALYSIS_BASE_URL)
+    return client
+
+
+def get_async_client():
+    """The shared AsyncOpenAI client (built lazily, without SDK-level retries)."""
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(api_key=_api_key(ANALYSIS_BASE_URL), base_url=ANALYSIS_BASE_URL, max_retries=0)
+    return _async_client
+
+
+def make_clients(base_url, api_key=None):
+    """(OpenAI, AsyncOpenAI) clients for another OpenAI-compatible endpoint (async: no SDK-level retries)."""
+    api_key = api_key or _api_key(base_url)
+    return (OpenAI(api_key=api_key, base_url=base_url),
+            AsyncOpenAI(api_key=api_key, base_url=base_url, max_retries=0))
+
+
+def _record_usage(response):
+    """Counts a completed request and the tokens it used (when the response reports them)."""
+    metrics.incr("openai.requests")
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    metrics.incr("openai.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    metrics.incr("openai.completion_tokens", getattr(usage, "completion_tokens", 0) or 0)
+
+
+def _is_retryable(error):
+    """Rate limits, server errors, timeouts and dropped connections are worth retrying."""
+    if isinstance(error, (APITimeoutError, APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after_seconds(error):
+    """Server-requested delay (Retry-After header) of a rate-limited response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return 0.0
+    try:
+        return float(response.headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _parse_price_string(s: str) -> float:
+    """Parses a cleaned numeric price string (NBSP/thin spaces, comma decimals)."""
+    if not s:
+        return 0.0
+    s2 = s.replace('\u00A0', ' ').replace('\u202F', ' ').replace('\u2009', ' ')
+    s2 = s2.replace(' ', '').replace(',', '.')
+    m = re.search(r"(\d+\.?\d*)", s2)
+    if not m:
+        return 0.0
+    try:
+        return float(m.group(1))
+    except Exception:
+        return 0.0
+
+
+class AnalysisCache:
+    """
+    Persistent LRU cache of model answers, keyed by a hash of the listing content.
+
+    Re-scanning an unchanged listing reuses the stored answer instead of sending
+    a new GPT-4o request. Entries expire after ttl_seconds and the least recently
+    used ones are evicted past max_entries.
+
+    The file is an append-only journal, one JSON line per stored answer (the
+    last line for a key wins), so a put costs one appended line; it is
+    compacted with an atomic temp file + rename once superseded lines pile up.
+    Files in the former single-object format are still read.
+    """
+
+    def __init__(self, path=ANALYSIS_CACHE_FILE, ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+                 max_entries=ANALYSIS_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Lines in the journal, superseded or evicted ones included
+        self._file_lines = 0
+        self._load()
+
+    @staticmethod
+    def key_for(listing_data):
+        """Content hash of a listing, the same one the seen-listings index compares (seen_listings.content_hash)."""
+        return content_hash(listing_data)
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    self._file_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue # A torn last line from an interrupted append
+                    # Former format: one object, entries stored least recently used first
+                    records = record["entries"] if "entries" in record else [(record["key"], record)]
+                    # Journal order is put order, which restores the LRU order
+                    for key, entry in records:
+                        self._entries[key] = {"stored_at": entry["stored_at"], "result": entry["result"]}
+                        self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        except Exception as e:
+            print(f"[Warning] Could not read analysis cache: {e}")
+            self._entries = OrderedDict()
+
+    def _append(self, key, entry):
+        if not self.path:
+            return
+        try:
+            with open(self.path, "a+b") as f:
+                # Never glue the line onto a torn (or former-format) last line
+                f.seek(0, os.SEEK_END)
+                if f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n")
+                f.write((json.dumps({"key": key, **entry}) + "\n").encode("utf-8"))
+            self._file_lines += 1
+            if self._file_lines - len(self._entries) > max(ANALYSIS_CACHE_COMPACT_MIN_SUPERSEDED, len(self._entries)):
+                self._compact()
+        except Exception as e:
+            print(f"[Warning] Could not save analysis cache: {e}")
+
+    def _compact(self):
+        """Rewrites the journal with one line per live entry, atomically (temp file + rename)."""
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".analysis_cache.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                for key, entry in self._entries.items():
+                    f.write(json.dumps({"key": key, **entry}) + "\n")
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._file_lines = len(self._entries)
+
+    def get(self, key):
+        """A copy of the cached model answer, or None if missing/expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry["stored_at"] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                metrics.incr("analysis_cache.misses")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            metrics.incr("analysis_cache.hits")
+            return copy.deepcopy(entry["result"])
+
+    def put(self, key, result):
+        """Stores a model answer: one line appended to the journal (async callers run it in a thread)."""
+        with self._lock:
+            entry = {"stored_at": time.time(), "result": copy.deepcopy(result)}
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._append(key, entry)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
 
 class AntigravityAnalyzer:
     """
     The 'Brain' of the operation. Uses OpenAI to parse unstructured text and estimate value.
     """
+
+    def __init__(self, cache=None, async_client=None, max_concurrency=ANALYSIS_MAX_CONCURRENCY,
+                 max_retries=ANALYSIS_MAX_RETRIES, timeout=ANALYSIS_TIMEOUT_SECONDS,
+                 backoff_base=ANALYSIS_BACKOFF_BASE_SECONDS, backoff_max=ANALYSIS_BACKOFF_MAX_SECONDS,
+                 token_budget=DEFAULT_TOKEN_BUDGET, local_threshold=None, client=None, base_url=None):
+        # Clients: injected, built for base_url, or else the module's shared ones
+        if base_url:
+            default_client, default_async_client = make_clients(base_url)
+            client = client or default_client
+            async_client = async_client or default_async_client
+        self.client = client
+        # Optional AnalysisCache: unchanged listings skip the OpenAI call
+        self.cache = cache
+        # Listings whose local extraction reaches this confidence skip the model (None: always ask it)
+        self.local_threshold = local_threshold
+        # How each listing was resolved: local extraction, cached answer or a model call
+        self.resolved = {"local": 0, "cache": 0, "model": 0}
+        # Listing text is compacted to this many tokens before prompting (None sends it as is)
+        self.token_budget = token_budget
+        self.tokens_saved = 0
+        # Async path settings (analyze_profitability_async)
+        self.async_client = async_client
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retries = 0
+        self.batch_requests = 0
+        self.batch_item_retries = 0
+        self._semaphore = None
     
     def analyze_profitability(self, listing_data):
         """Sends text to the AI Oracle to appraise parts."""
         print("[bold purple]>> Vibing with the data (AI Analysis)...[/bold purple]")
-        
-        raw_text = listing_data.get('raw_text', '')
+
+        result, cache_key = self._resolve_without_model(listing_data)
+        if result is None:
+            prompt = self._build_prompt(listing_data)
+            with metrics.span("openai.completion"):
+                response = (self.client or get_client()).chat.completions.create(
+                    model=ANALYSIS_MODEL,
+                    response_format={ "type": "json_object" },
+                    messages=[{"role": "user", "content": prompt}]
+                )
+            _record_usage(response)
+            result = self._accept_model_output(response, cache_key)
+
+        return self._finalize_result(result, listing_data)
+
+    async def analyze_profitability_async(self, listing_data):
+        """Async analyze_profitability: at most max_concurrency requests in flight, with retries."""
+        print("[bold purple]>> Vibing with the data (AI Analysis)...[/bold purple]")
+
+        result, cache_key = self._resolve_without_model(listing_data)
+        if result is None:
+            response = await self._create_completion_async(self._build_prompt(listing_data))
+            result = await self._accept_model_output_async(response, cache_key)
+
+        return await self._finalize_result_async(result, listing_data)
+
+    def _resolve_without_model(self, listing_data):
+        """(result or None, cache key): a confident local extraction first, then a cached answer."""
+        if self.local_threshold is not None:
+            listing_price = _parse_price_string(listing_data.get('price_str', ''))
+            result, confidence = analyze_locally(listing_data, listing_price)
+            if result is not None and confidence >= self.local_threshold:
+                self.resolved["local"] += 1
+                metrics.incr("analyzer.resolved_local")
+                print(f"[dim]>> Resolved locally (confidence {confidence:.2f}), skipping the model[/dim]")
+                return result, None
+
+        cache_key = self.cache.key_for(listing_data) if self.cache is not None else None
+        result = self.cache.get(cache_key) if cache_key else None
+        if result is not None:
+            self.resolved["cache"] += 1
+        return result, cache_key
+
+    def _accept_model_output(self, response, cache_key):
+        """Parses a model answer, caching it when well-formed."""
+        self.resolved["model"] += 1
+        result, parsed = self._parse_model_output(response)
+        # Only well-formed answers are worth replaying
+        if parsed and cache_key:
+            self.cache.put(cache_key, result)
+        return result
+
+    async def _accept_model_output_async(self, response, cache_key):
+        """_accept_model_output with the cache write off the event loop."""
+        self.resolved["model"] += 1
+        result, parsed = self._parse_model_output(response)
+        if parsed and cache_key:
+            await asyncio.to_thread(self.cache.put, cache_key, result)
+        return result
+
+    def resolution_stats(self):
+        """Listings resolved locally / from the cache / by the model, and the local fraction."""
+        total = sum(self.resolved.values())
+        return dict(self.resolved, local_fraction=round(self.resolved["local"] / total, 3) if total else 0.0)
+
+    async def analyze_many_async(self, listings):
+        """
+        Analyzes listings concurrently, in input order.
+        A listing whose analysis failed gets the exception in its slot instead of a result.
+        """
+        return await asyncio.gather(
+            *(self.analyze_profitability_async(listing) for listing in listings),
+            return_exceptions=True,
+        )
+
+    async def analyze_batch_async(self, listings, batch_size=ANALYSIS_BATCH_SIZE):
+        """
+        Like analyze_many_async, but packs up to batch_size listings into each request,
+        so the instruction block is sent once per batch instead of once per listing.
+        Listings missing or malformed in a batch answer are retried on their own.
+        """
+        results = [None] * len(listings)
+        pending = []
+        for index, listing_data in enumerate(listings):
+            try:
+                result, cache_key = self._resolve_without_model(listing_data)
+                if result is None:
+                    pending.append((index, cache_key))
+                else:
+                    results[index] = await self._finalize_result_async(result, listing_data)
+            except Exception as e:
+                results[index] = e
+
+        if pending:
+            print(f"[bold purple]>> Vibing with {len(pending)} listings (batched AI Analysis)...[/bold purple]")
+        # A size below 1 would make empty chunks and leave these listings without a result
+        batch_size = max(1, batch_size)
+        chunks = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        await asyncio.gather(*(self._analyze_chunk_async(listings, chunk, results) for chunk in chunks))
+        return results
+
+    async def _analyze_chunk_async(self, listings, chunk, results):
+        """One batched request for a chunk of (index, cache_key), then per-listing fallbacks."""
+        answers = {}
+        ids = [f"L{n}" for n in range(1, len(chunk) + 1)]
+        if len(chunk) > 1:
+            try:
+                self.batch_requests += 1
+                response = await self._create_completion_async(
+                    self._build_batch_prompt([listings[index] for index, _ in chunk], ids))
+                answers = self._split_batch_output(response, ids)
+            except Exception as e:
+                print(f"[yellow]Batched analysis failed ({type(e).__name__}), analyzing {len(chunk)} listings one by one[/yellow]")
+
+        async def finish(item_id, index, cache_key):
+            listing_data = listings[index]
+            try:
+                if item_id in answers:
+                    self.resolved["model"] += 1
+                    result = answers[item_id]
+                    if cache_key:
+                        await asyncio.to_thread(self.cache.put, cache_key, result)
+                else:
+                    if len(chunk) > 1:
+                        self.batch_item_retries += 1
+                    response = await self._create_completion_async(self._build_prompt(listing_data))
+                    result = await self._accept_model_output_async(response, cache_key)
+                results[index] = await self._finalize_result_async(result, listing_data)
+            except Exception as e:
+                results[index] = e
+
+        await asyncio.gather(*(finish(item_id, index, cache_key) for item_id, (index, cache_key) in zip(ids, chunk)))
+
+    async def _create_completion_async(self, prompt):
+        """One chat completion, retried with jittered exponential backoff on 429/5xx/timeouts."""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        client_ = self.async_client or get_async_client()
+
+        attempt = 0
+        while True:
+            try:
+                async with self._semaphore:
+                    # Timed inside the semaphore: queueing for a slot is not API latency
+                    with metrics.span("openai.completion"):
+                        response = await asyncio.wait_for(
+                            client_.chat.completions.create(
+                                model=ANALYSIS_MODEL,
+                                response_format={ "type": "json_object" },
+                                messages=[{"role": "user", "content": prompt}],
+                                timeout=self.timeout,
+                            ),
+                            timeout=self.timeout,
+                        )
+                _record_usage(response)
+                return response
+            except Exception as e:
+                if attempt >= self.max_retries or not _is_retryable(e):
+                    raise
+                # Full jitter, but never sooner than the server asked for
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                delay = max(delay, min(_retry_after_seconds(e), self.backoff_max))
+                attempt += 1
+                self.retries += 1
+                metrics.incr("openai.retries")
+                print(f"[yellow]OpenAI call failed ({type(e).__name__}), retry {attempt}/{self.max_retries} in {delay:.1f}s[/yellow]")
+                await asyncio.sleep(delay)
+
+    def _build_prompt(self, listing_data):
+        """The appraisal prompt for one listing."""
+        raw_text = self._compact_text(listing_data.get('raw_text', ''))
         title = listing_data.get('title', '')
         price_str = listing_data.get('price_str', '0')
         
@@ -33,49 +504,96 @@ class AntigravityAnalyzer:
         Listing Title: {title}
         Listing Price (extracted): {listing_price} EUR (If 0, try to find it in the text).
         
-        Task:
-        1. Identify the specific PC components (CPU, GPU, RAM, SSD/HDD, Motherboard, PSU).
-        2. Estimate the current USED market price in France (in EUR) for each part separately. Be CONSERVATIVE (undervalue slightly).
-        3. Ignore peripherals (keyboard/mouse) unless they are high-end.
-        4. CRITICAL: Value "Cases", "Fans", and "PSUs" at 0 EUR unless they are clearly high-end brands (Corsair, Seasonic, Lian Li, etc) AND models. Standard/Generic = 0.
-        5. If the description mentions "HS", "H.S", "Panne", "Broken", "Pour pièces", set verdict to "TRASH".
+        {APPRAISAL_TASK}
         
         Return ONLY valid JSON with this structure:
         {{
             "is_gaming_pc": boolean,
             "listing_price": {listing_price if listing_price > 0 else "number found in text"},
-            "parts": [
-                {{ "component": "Name (e.g. RTX 3060)", "estimated_price": 150, "notes": "optional" }}
-            ],
-            "total_estimated_value": 0,
-            "profit_potential": 0,
-            "profit_percentage": 0,
-            "verdict": "BUY" or "PASS" or "TRASH",
-            "reasoning": "Short explanation of the verdict"
+            {APPRAISAL_RESULT_FIELDS}
         }}
 
-        Logic for Verdict:
-        - TRASH if broken/HS.
-        - BUY if (Total Estimated - Listing Price) / Listing Price > 0.50 (50% margin).
-        - PASS otherwise.
+        {VERDICT_LOGIC}
 
         Listing Text:
         {raw_text}
         """
+        # The source indentation is not worth paying tokens for
+        return "\n".join(line.strip() for line in prompt.strip().splitlines())
 
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            response_format={ "type": "json_object" },
-            messages=[{"role": "user", "content": prompt}]
-        )
+    def _build_batch_prompt(self, listings, ids):
+        """One appraisal prompt for several listings, each tagged with its id."""
+        sections = []
+        for item_id, listing_data in zip(ids, listings):
+            listing_price = _parse_price_string(listing_data.get('price_str', ''))
+            sections.append(
+                f"### Listing {item_id}\n"
+                f"Title: {listing_data.get('title', '')}\n"
+                f"Price (extracted): {listing_price} EUR (If 0, try to find it in the text).\n"
+                f"Text:\n{self._compact_text(listing_data.get('raw_text', ''))}"
+            )
+
+        prompt = f"""
+        You are an expert PC hardware reseller in France. 
+        Analyze each of the following Leboncoin listings independently.
 
-        # Parse model output safely
+        {APPRAISAL_TASK}
+
+        Return ONLY valid JSON with this structure, with exactly one entry per listing:
+        {{
+            "results": [
+                {{
+                    "id": "the listing id (e.g. {ids[0]})",
+                    "is_gaming_pc": boolean,
+                    "listing_price": number (the extracted price, or the one found in its text),
+                    {APPRAISAL_RESULT_FIELDS}
+                }}
+            ]
+        }}
+
+        {VERDICT_LOGIC}
+        """
+        prompt = "\n".join(line.strip() for line in prompt.strip().splitlines())
+        return prompt + "\n\nListings:\n\n" + "\n\n".join(sections)
+
+    def _split_batch_output(self, response, ids):
+        """{id: result} for the well-formed entries of a batched answer (unknown/duplicate ids dropped)."""
+        try:
+            payload = json.loads(response.choices[0].message.content)
+        except Exception:
+            return {}
+        entries = payload.get("results") if isinstance(payload, dict) else payload
+        answers = {}
+        for entry in entries if isinstance(entries, list) else []:
+            if not isinstance(entry, dict):
+                continue
+            item_id = str(entry.pop("id", ""))
+            if item_id in ids and item_id not in answers and isinstance(entry.get("parts", []), (list, type(None))):
+                answers[item_id] = entry
+        return answers
+
+    def _compact_text(self, raw_text):
+        """Listing text stripped of page boilerplate and cut to the token budget."""
+        if self.token_budget is None:
+            return raw_text
+        text, stats = compact_listing_text(raw_text, self.token_budget)
+        self.tokens_saved += stats['tokens_saved']
+        metrics.incr("preprocess.tokens_saved", stats['tokens_saved'])
+        print(f"[dim]>> Prompt text: {stats['tokens_before']} -> {stats['tokens_after']} tokens "
+              f"({stats['tokens_saved']} saved)[/dim]")
+        return text
+
+    def _parse_model_output(self, response):
+        """(result, parsed) from a chat completion; a minimal PASS result if unparseable."""
         try:
             model_text = response.choices[0].message.content
             result = json.loads(model_text)
+            if not isinstance(result, dict):
+                raise ValueError("model output is not a JSON object")
+            return result, True
         except Exception:
             # If parsing fails, return a minimal structure
-            result = {
+            return {
                 "is_gaming_pc": False,
                 "listing_price": 0,
                 "parts": [],
@@ -84,47 +602,41 @@ class AntigravityAnalyzer:
                 "profit_percentage": 0,
                 "verdict": "PASS",
                 "reasoning": "Model output could not be parsed."
-            }
-
-        # Helper to parse a cleaned numeric price string
-        def parse_price_string(s: str) -> float:
-            if not s:
-                return 0.0
-            s2 = s.replace('\u00A0', ' ').replace('\u202F', ' ').replace('\u2009', ' ')
-            s2 = s2.replace(' ', '').replace(',', '.')
-            m = re.search(r"(\d+\.?\d*)", s2)
-            if not m:
-                return 0.0
-            try:
-                return float(m.group(1))
-            except Exception:
-                return 0.0
+            }, False
+
+    async def _finalize_result_async(self, result, listing_data):
+        """_finalize_result in a thread: part pricing reads and appends to the price cache on disk."""
+        return await asyncio.to_thread(self._finalize_result, result, listing_data)
 
+    def _finalize_result(self, result, listing_data):
+        """Deterministic pass over the model answer: part prices, totals, profit and verdict."""
         # Ensure parts is a list and compute total estimated value deterministically
         parts = result.get('parts') or []
         
         # Fetch prices from cache or estimate for each part
         enriched_parts = []
-        for part in parts:
-            component_name = part.get('component', '')
-            model_price = part.get('estimated_price', 0)
+        # New cache entries for this listing are written in one batch
+        with write_behind():
+            for part in parts:
+                component_name = part.get('component', '')
+                model_price = part.get('estimated_price', 0)
             
-            # Query the price fetcher for cached/estimated used price
-            price_info = estimate_component_price(component_name)
+                # Query the price fetcher for cached/estimated used price
+                price_info = estimate_component_price(component_name)
             
-            # Use cached used price if available and reasonable; otherwise use model's estimate
-            cached_used_price = float(price_info.get('estimated_used_price_eur', model_price))
-            final_price = cached_used_price if cached_used_price > 0 else model_price
+                # Use cached used price if available and reasonable; otherwise use model's estimate
+                cached_used_price = float(price_info.get('estimated_used_price_eur', model_price))
+                final_price = cached_used_price if cached_used_price > 0 else model_price
             
-            enriched_part = {
-                'component': component_name,
-                'estimated_price': final_price,
-                'estimated_price_new': price_info.get('estimated_new_price_eur', final_price),
-                'cached': price_info.get('cached', False),
-                'category': price_info.get('category', 'Other'),
-                'notes': part.get('notes', '')
-            }
-            enriched_parts.append(enriched_part)
+                enriched_part = {
+                    'component': component_name,
+                    'estimated_price': final_price,
+                    'estimated_price_new': price_info.get('estimated_new_price_eur', final_price),
+                    'cached': price_info.get('cached', False),
+                    'category': price_info.get('category', 'Other'),
+                    'notes': part.get('notes', '')
+                }
+                enriched_parts.append(enriched_part)
         
         result['parts'] = enriched_parts
         
@@ -141,17 +653,17 @@ class AntigravityAnalyzer:
             if isinstance(lp, (int, float)) and lp > 0:
                 listing_price = float(lp)
             elif isinstance(lp, str) and lp.strip():
-                listing_price = parse_price_string(lp)
+                listing_price = _parse_price_string(lp)
         except Exception:
             listing_price = 0.0
 
         # Fallback to scraped price string
         if listing_price == 0.0:
-            listing_price = parse_price_string(listing_data.get('price_str', '') )
+            listing_price = _parse_price_string(listing_data.get('price_str', '') )
 
         # Another fallback: try to find a price in raw_text
         if listing_price == 0.0:
-            listing_price = parse_price_string(listing_data.get('raw_text', ''))
+            listing_price = _parse_price_string(listing_data.get('raw_text', ''))
 
         result['listing_price'] = listing_price
 
@@ -0,0 +1,82 @@
+"""
+bench_parser.py
+Micro-benchmark of listing extraction (listing_parser.py) on the saved pages
+in fixtures/: embedded-JSON extraction vs. the BeautifulSoup DOM parse.
+
+    python bench_parser.py [--page-kb 600] [--repeat 20]
+
+Real ad pages are several hundred KB of markup, so each fixture is padded
+with filler markup (similar-ad cards, inline styles) up to --page-kb before
+timing. Both paths are first checked to agree on title and price.
+"""
+
+import argparse
+import glob
+import os
+import time
+
+from listing_parser import parse_listing_html, parse_listing_soup
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+_FILLER_CARD = (
+    '<li class="styles_adCard"><a href="/ad/ordinateurs/{n}" data-qa-id="aditem_container">'
+    '<div class="styles_thumb"><img src="https://img.leboncoin.fr/api/v1/lbcpb1/images/{n}.jpg" alt=""></div>'
+    '<p class="styles_title">Annonce similaire {n}</p><p class="styles_price"><span>{price}&nbsp;€</span></p>'
+    '<p class="styles_location">Lyon 6900{d}</p></a></li>\n'
+)
+
+
+def load_fixtures(page_kb=0):
+    """{fixture name: html}, padded with filler markup up to page_kb kilobytes."""
+    pages = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "listing_*.html"))):
+        with open(path, "r", encoding="utf-8") as f:
+            html = f.read()
+        filler = []
+        size = len(html)
+        n = 0
+        while size < page_kb * 1024:
+            card = _FILLER_CARD.format(n=n, price=100 + n % 900, d=n % 10)
+            filler.append(card)
+            size += len(card)
+            n += 1
+        if filler:
+            html = html.replace("</main>", "<ul>\n" + "".join(filler) + "</ul>\n</main>", 1)
+        pages[os.path.splitext(os.path.basename(path))[0]] = html
+    return pages
+
+
+def timeit(fn, html, repeat):
+    """Best-of-3 mean time of fn(html), in milliseconds."""
+    best = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            fn(html)
+        best = min(best, (time.perf_counter() - started) / repeat)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--page-kb", type=int, default=600, help="Pad each fixture to this size (default: 600)")
+    parser.add_argument("--repeat", type=int, default=20, help="Parses per timing run (default: 20)")
+    args = parser.parse_args()
+
+    pages = load_fixtures(args.page_kb)
+    print(f"{len(pages)} fixtures padded to ~{args.page_kb} KB, {args.repeat} parses per run")
+    for name, html in pages.items():
+        fast = parse_listing_html(html)
+        slow = parse_listing_soup(html)
+        assert (fast["title"], fast["price_str"]) == (slow["title"], slow["price_str"]), name
+
+        fast_ms = timeit(parse_listing_html, html, args.repeat)
+        soup_ms = timeit(parse_listing_soup, html, args.repeat)
+        print(f"  {name:<20} [{fast['source']:<9}] parse_listing_html: {fast_ms:8.2f} ms"
+              f"   BeautifulSoup: {soup_ms:8.2f} ms  ({soup_ms / fast_ms:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
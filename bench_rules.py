@@ -0,0 +1,257 @@
+"""
+bench_rules.py
+Micro-benchmark of the compiled component rules (component_rules.py) against
+the former if/elif chains of price_fetcher.
+
+    python bench_rules.py [--names 5000] [--synthetic-rules 1000]
+
+1. Checks that the compiled rules give the same price/category as the old
+   chains on a corpus of names, then times both.
+2. Times a table of 1,000+ synthetic model rules, compiled vs. evaluated as a
+   linear chain of `in` checks (what a 1,000-branch if/elif would do).
+"""
+
+import argparse
+import json
+import random
+import time
+
+from component_rules import DEFAULT_RULES_FILE, RuleEngine
+
+
+def legacy_estimate_price_from_name(component_name: str) -> float:
+    """The former hand-written if/elif chain of price_fetcher._estimate_price_from_name."""
+    name_lower = component_name.lower()
+
+    # GPU estimates (very rough)
+    if "rtx 4090" in name_lower:
+        return 1800
+    elif "rtx 4080" in name_lower:
+        return 1200
+    elif "rtx 4070" in name_lower:
+        return 700
+    elif "rtx 4060" in name_lower:
+        return 320
+    elif "rtx 3090" in name_lower:
+        return 1000
+    elif "rtx 3080" in name_lower:
+        return 700
+    elif "rtx 3070" in name_lower:
+        return 500
+    elif "rtx 3060" in name_lower:
+        return 350
+    elif "rx 6800" in name_lower:
+        return 500
+    elif "rx 6700" in name_lower:
+        return 380
+    elif "rx 6600" in name_lower:
+        return 250
+    elif "rx 7900" in name_lower:
+        return 750
+    elif "rx 7800" in name_lower:
+        return 400
+    elif "gpu" in name_lower or "graphics" in name_lower or "gtx" in name_lower or "radeon" in name_lower:
+        return 400  # Generic GPU estimate
+
+    # CPU estimates
+    elif "ryzen 9 7950x" in name_lower:
+        return 500
+    elif "ryzen 9 7900x" in name_lower:
+        return 400
+    elif "ryzen 7 7700x" in name_lower:
+        return 300
+    elif "ryzen 5 7600x" in name_lower:
+        return 230
+    elif "i9-13900k" in name_lower:
+        return 580
+    elif "i7-13700k" in name_lower:
+        return 420
+    elif "i5-13600k" in name_lower:
+        return 280
+    elif "cpu" in name_lower or "processor" in name_lower or "ryzen" in name_lower or "core i" in name_lower:
+        return 250  # Generic CPU estimate
+
+    # RAM estimates
+    elif "32gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
+        return 150
+    elif "16gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
+        return 80
+    elif "8gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
+        return 40
+    elif "ram" in name_lower or "memory" in name_lower or "ddr" in name_lower:
+        return 60  # Generic RAM estimate
+
+    # SSD/Storage estimates
+    elif "2tb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
+        return 150
+    elif "1tb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
+        return 80
+    elif "500gb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
+        return 50
+    elif "ssd" in name_lower or "nvme" in name_lower or "storage" in name_lower:
+        return 70  # Generic SSD estimate
+
+    # Motherboard estimates
+    elif "motherboard" in name_lower or "mobo" in name_lower or "x870" in name_lower or "z790" in name_lower:
+        return 250
+
+    # PSU estimates (only valued if premium brand)
+    elif ("corsair" in name_lower or "seasonic" in name_lower) and ("psu" in name_lower or "power" in name_lower):
+        if "1000w" in name_lower:
+            return 180
+        elif "850w" in name_lower:
+            return 150
+        elif "750w" in name_lower:
+            return 120
+        else:
+            return 100
+    elif "psu" in name_lower or "power supply" in name_lower:
+        return 0  # Generic PSU valued at 0 unless premium
+
+    # Case estimates (typically 0 unless premium)
+    elif "case" in name_lower or "chassis" in name_lower:
+        if "corsair" in name_lower or "nzxt" in name_lower or "lian li" in name_lower:
+            return 100
+        else:
+            return 0
+
+    # Cooler estimates
+    elif "cooler" in name_lower or "heatsink" in name_lower:
+        if "corsair" in name_lower or "noctua" in name_lower:
+            return 80
+        else:
+            return 20
+
+    # Default fallback
+    return 50
+
+
+def legacy_categorize_component(component_name: str) -> str:
+    """The former hand-written chain of price_fetcher._categorize_component."""
+    name_lower = component_name.lower()
+
+    if any(term in name_lower for term in ["gpu", "graphics", "rtx", "gtx", "radeon", "rx"]):
+        return "GPU"
+    elif any(term in name_lower for term in ["cpu", "processor", "ryzen", "core i", "i5", "i7", "i9"]):
+        return "CPU"
+    elif any(term in name_lower for term in ["ram", "memory", "ddr4", "ddr5"]):
+        return "RAM"
+    elif any(term in name_lower for term in ["ssd", "nvme", "hdd", "storage"]):
+        return "Storage"
+    elif any(term in name_lower for term in ["motherboard", "mobo", "x870", "z790", "b650"]):
+        return "Motherboard"
+    elif any(term in name_lower for term in ["psu", "power supply"]):
+        return "PSU"
+    elif any(term in name_lower for term in ["case", "chassis"]):
+        return "Case"
+    elif any(term in name_lower for term in ["cooler", "heatsink"]):
+        return "Cooler"
+    else:
+        return "Other"
+
+
+def linear_chain(config):
+    """Evaluates a rule table the way an if/elif chain does: rule after rule, substring checks."""
+    price_rules = [([[k.lower() for k in g] for g in r["match"]], r["price"]) for r in config["price_rules"]]
+    category_rules = [([[k.lower() for k in g] for g in r["match"]], r["category"]) for r in config["category_rules"]]
+
+    def first_match(rules, name, default):
+        for groups, value in rules:
+            if all(any(k in name for k in group) for group in groups):
+                return value
+        return default
+
+    def classify(component_name):
+        name_lower = component_name.lower()
+        return (first_match(price_rules, name_lower, config["default_price"]),
+                first_match(category_rules, name_lower, config["default_category"]))
+
+    return classify
+
+
+def synthetic_config(base, count, rng):
+    """Prepends `count` specific model rules (e.g. 'zx 1234') to the built-in price rules."""
+    prefixes = ["rtx", "gtx", "rx", "arc", "ryzen 5", "ryzen 7", "core i5-", "core i7-", "quadro", "radeon pro"]
+    seen = set()
+    model_rules = []
+    while len(model_rules) < count:
+        keyword = f"{rng.choice(prefixes)} {rng.randint(1000, 99999)}"
+        if keyword in seen:
+            continue
+        seen.add(keyword)
+        model_rules.append({"match": [[keyword]], "price": rng.randint(30, 2000)})
+    config = dict(base)
+    config["price_rules"] = model_rules + base["price_rules"]
+    return config, sorted(seen)
+
+
+def make_names(config, count, rng, extra_keywords=()):
+    """Synthetic component names built from the rule vocabulary plus noise words."""
+    vocabulary = sorted({k for r in config["price_rules"] + config["category_rules"] for g in r["match"] for k in g})
+    vocabulary += list(extra_keywords)
+    noise = ["asus", "msi", "gaming", "oc", "edition", "white", "rgb", "pro", "ti", "super", "x3d", "16gb", "ddr4"]
+    names = []
+    for _ in range(count):
+        words = rng.sample(vocabulary, rng.randint(1, 2)) + rng.sample(noise, rng.randint(0, 3))
+        rng.shuffle(words)
+        names.append(" ".join(w.upper() if rng.random() < 0.3 else w for w in words))
+    return names
+
+
+def timeit(fn, names, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for name in names:
+            fn(name)
+        best = min(best, time.perf_counter() - started)
+    return best / len(names) * 1e6  # microseconds per name
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--names", type=int, default=5000)
+    parser.add_argument("--synthetic-rules", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    with open(DEFAULT_RULES_FILE, "r", encoding="utf-8") as f:
+        base = json.load(f)
+
+    # 1. Built-in rules vs. the old hand-written chains
+    engine = RuleEngine(base)
+    names = make_names(base, args.names, rng)
+    for name in names:
+        expected = (legacy_estimate_price_from_name(name), legacy_categorize_component(name))
+        if engine.classify(name) != expected:
+            raise SystemExit(f"Mismatch for {name!r}: {engine.classify(name)} != {expected}")
+
+    def legacy_both(name):
+        return legacy_estimate_price_from_name(name), legacy_categorize_component(name)
+
+    legacy_us = timeit(legacy_both, names)
+    compiled_us = timeit(engine.classify, names)
+    print(f"Built-in rules ({len(base['price_rules'])} price + {len(base['category_rules'])} category), "
+          f"{len(names)} names, results identical")
+    print(f"  if/elif chains : {legacy_us:7.2f} us/name")
+    print(f"  compiled rules : {compiled_us:7.2f} us/name  ({legacy_us / compiled_us:.1f}x)")
+
+    # 2. Large rule table
+    config, models = synthetic_config(base, args.synthetic_rules, rng)
+    big_engine = RuleEngine(config)
+    chain = linear_chain(config)
+    big_names = make_names(config, args.names, rng, extra_keywords=models)
+    for name in big_names[:2000]:
+        if big_engine.classify(name) != chain(name):
+            raise SystemExit(f"Mismatch for {name!r}")
+
+    chain_us = timeit(chain, big_names)
+    big_compiled_us = timeit(big_engine.classify, big_names)
+    print(f"Synthetic table ({len(config['price_rules'])} price rules), {len(big_names)} names")
+    print(f"  linear chain   : {chain_us:7.2f} us/name")
+    print(f"  compiled rules : {big_compiled_us:7.2f} us/name  ({chain_us / big_compiled_us:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+"""
+bench_suite.py
+Offline benchmark suite for the hot paths, with results saved as JSON so two
+runs (e.g. before and after a change) can be compared.
+
+    python bench_suite.py [-k price_cache] [--quick] [--save FILE] [--compare OLD.json]
+
+Cases:
+- parse:       extract_price_from_text, parse_listing_html and the BeautifulSoup
+               parse on the saved pages in fixtures/ (padded to --page-kb)
+- rules:       _estimate_price_from_name / _categorize_component over 100k
+               synthetic component names
+- price_cache: get_cache_entry / save_cache_entry with 10, 1k and 100k cached rows
+- history:     save_result with 100 to 100k results already in the history
+- analyzer:    analyze_profitability and analyze_many_async end to end against
+               the local stub API (stub_openai_server.py, no added latency)
+
+Nothing leaves the machine or touches the working files: the analyzer talks
+to a stub API server on 127.0.0.1 (so the timings include the HTTP round
+trip), and the price cache and history live in a temporary directory. Each case is timed pytest-benchmark style: one warmup call, then
+--rounds rounds of a calibrated number of calls; min/median/mean/stddev are
+per call. Results go to bench_results/<timestamp>.json by default.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+
+import analyzer
+import main as app
+import price_fetcher
+from bench_parser import load_fixtures
+from bench_rules import make_names
+from history_store import HistoryStore
+from listing_parser import extract_price_from_text, parse_listing_html, parse_listing_soup
+from stub_openai_server import StubSettings, start_server
+
+
+RESULTS_DIR = "bench_results"
+NAME_COUNT = 100_000
+CACHE_ROWS = (10, 1_000, 100_000)
+HISTORY_SIZES = (100, 1_000, 10_000, 100_000)
+# --quick: sizes for a smoke run (CI, before committing)
+QUICK_NAME_COUNT = 5_000
+QUICK_CACHE_ROWS = (10, 1_000)
+QUICK_HISTORY_SIZES = (100, 1_000)
+# A round lasts at least this long (more calls per round for fast cases)
+MIN_ROUND_SECONDS = 0.05
+MAX_CALLS_PER_ROUND = 100_000
+
+PRICE_SAMPLES = [
+    "450 €", "1 250,00 €", "1 250 €", "Prix : 899€", "300 euros", "Vendu 1.200 €",
+    "PC gamer RTX 3060 Ryzen 5 5600X 16 Go RAM, 650 € à débattre, remise en main propre Paris 11e",
+]
+STUB_PARTS = [
+    {"component": "NVIDIA RTX 3060 12GB", "estimated_price": 220, "notes": "used, good condition"},
+    {"component": "AMD Ryzen 5 5600X", "estimated_price": 110, "notes": ""},
+    {"component": "16GB DDR4 3200MHz", "estimated_price": 35, "notes": ""},
+    {"component": "1TB NVMe SSD", "estimated_price": 45, "notes": ""},
+    {"component": "B550 motherboard", "estimated_price": 70, "notes": ""},
+    {"component": "Generic 650W PSU", "estimated_price": 0, "notes": "generic"},
+    {"component": "Case", "estimated_price": 0, "notes": ""},
+]
+
+
+# What the stub API answers to every prompt
+STUB_ANSWER = {
+    "is_gaming_pc": True,
+    "listing_price": 0,
+    "parts": STUB_PARTS,
+    "total_estimated_value": sum(part["estimated_price"] for part in STUB_PARTS),
+    "profit_potential": 0,
+    "profit_percentage": 0,
+    "verdict": "PASS",
+    "reasoning": "Stubbed appraisal.",
+}
+
+
+class Bench:
+    """One benchmark case: setup() is a context manager yielding the function to time."""
+
+    def __init__(self, name, group, setup, items=1, **params):
+        self.name = name
+        self.group = group
+        self.setup = setup
+        # Operations per call (e.g. names classified), for the per-item figure
+        self.items = items
+        self.params = params
+
+
+def measure(fn, rounds):
+    """Per-call timings of `rounds` rounds, pytest-benchmark style (warmup, then calibrated rounds)."""
+    fn()
+    calls = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= MIN_ROUND_SECONDS or calls >= MAX_CALLS_PER_ROUND:
+            break
+        calls = min(MAX_CALLS_PER_ROUND, calls * max(2, int(MIN_ROUND_SECONDS / max(elapsed, 1e-9) * 1.2)))
+    timings = [elapsed / calls]
+    for _ in range(rounds - 1):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        timings.append((time.perf_counter() - started) / calls)
+    return {
+        "min": min(timings),
+        "max": max(timings),
+        "mean": statistics.fmean(timings),
+        "median": statistics.median(timings),
+        "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "rounds": len(timings),
+        "calls_per_round": calls,
+        "ops": 1 / statistics.median(timings),
+    }
+
+
+@contextlib.contextmanager
+def _ready(fn):
+    yield fn
+
+
+# --- parse ---
+
+def parse_cases(page_kb):
+    cases = [Bench("extract_price_from_text", "parse",
+                   lambda: _ready(lambda: [extract_price_from_text(s) for s in PRICE_SAMPLES]),
+                   items=len(PRICE_SAMPLES))]
+    for fixture, html in load_fixtures(page_kb).items():
+        cases.append(Bench(f"parse_listing_html[{fixture}]", "parse",
+                           lambda html=html: _ready(lambda: parse_listing_html(html)), page_kb=page_kb))
+        cases.append(Bench(f"parse_listing_soup[{fixture}]", "parse",
+                           lambda html=html: _ready(lambda: parse_listing_soup(html)), page_kb=page_kb))
+    return cases
+
+
+# --- rules ---
+
+def rule_cases(name_count):
+    with open(price_fetcher.RULES_FILE, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    names = make_names(config, name_count, random.Random(42))
+
+    def run(fn):
+        return lambda: _ready(lambda: [fn(name) for name in names])
+
+    return [
+        Bench("_estimate_price_from_name", "rules", run(price_fetcher._estimate_price_from_name),
+              items=len(names), names=len(names)),
+        Bench("_categorize_component", "rules", run(price_fetcher._categorize_component),
+              items=len(names), names=len(names)),
+    ]
+
+
+# --- price_cache ---
+
+def _cache_row(name):
+    return {
+        "component_name": name,
+        "category": "GPU",
+        "estimated_new_price_eur": 300.0,
+        "estimated_used_price_eur": 195.0,
+        "last_updated": datetime.now().isoformat(),
+        "source": "benchmark",
+    }
+
+
+@contextlib.contextmanager
+def _price_cache(rows, backend):
+    """A temporary cache backend holding `rows` entries, installed as the module's backend."""
+    with tempfile.TemporaryDirectory() as tmp:
+        if backend == "sqlite":
+            cache = price_fetcher.SqliteComponentCache(os.path.join(tmp, "cache.db"))
+        else:
+            cache = price_fetcher.CsvComponentCache(os.path.join(tmp, "cache.csv"))
+        cache.upsert_many(_cache_row(f"Bench GPU {n} OC") for n in range(rows))
+        previous = price_fetcher.set_cache_backend(cache)
+        try:
+            yield cache
+        finally:
+            price_fetcher.set_cache_backend(previous)
+            if backend == "sqlite":
+                cache.close()
+
+
+def price_cache_cases(sizes, backend):
+    cases = []
+    for rows in sizes:
+        lookups = [f"Bench GPU {n} OC" if n % 2 else f"Unknown GPU {n}" for n in range(200)]
+
+        @contextlib.contextmanager
+        def lookup(rows=rows, lookups=lookups):
+            with _price_cache(rows, backend):
+                yield lambda: [price_fetcher.get_cache_entry(name) for name in lookups]
+
+        @contextlib.contextmanager
+        def save(rows=rows):
+            counter = iter(range(10**9))
+            with _price_cache(rows, backend):
+                yield lambda: price_fetcher.save_cache_entry(f"New GPU {next(counter)} OC", "GPU", 300.0)
+
+        @contextlib.contextmanager
+        def load(rows=rows):
+            with _price_cache(rows, backend) as cache:
+                if backend == "sqlite":
+                    yield lambda: price_fetcher.SqliteComponentCache(cache.path).get("Bench GPU 1 OC")
+                else:
+                    yield lambda: price_fetcher.CsvComponentCache(cache.path).get("Bench GPU 1 OC")
+
+        cases += [
+            Bench(f"get_cache_entry[{rows}]", "price_cache", lookup, items=len(lookups), rows=rows, backend=backend),
+            Bench(f"save_cache_entry[{rows}]", "price_cache", save, rows=rows, backend=backend),
+            Bench(f"cold_load[{rows}]", "price_cache", load, rows=rows, backend=backend),
+        ]
+    return cases
+
+
+# --- history ---
+
+def _history_entry(n, rng):
+    price = rng.randint(150, 1500)
+    estimated = int(price * rng.uniform(0.6, 2.0))
+    return {
+        "id": f"2026-01-01T00:00:{n:09d}",
+        "date": "2026-01-01 12:00",
+        "url": f"https://www.leboncoin.fr/ad/ordinateurs/{3000000000 + n}",
+        "title": f"PC Gamer {n}",
+        "price": price,
+        "estimated": estimated,
+        "profit": estimated - price,
+        "margin": round((estimated - price) / price * 100),
+        "verdict": "BUY" if estimated > price * 1.5 else "PASS",
+        "parts": STUB_PARTS[:4],
+        "reasoning": "Synthetic history entry.",
+    }
+
+
+def history_cases(sizes):
+    listing = {"url": "https://www.leboncoin.fr/ad/ordinateurs/1", "title": "PC Gamer RTX 3060"}
+    analysis = {"listing_price": 650, "total_estimated_value": 900, "profit_potential": 250,
+                "profit_percentage": 38, "verdict": "PASS", "parts": STUB_PARTS, "reasoning": "Stub."}
+    cases = []
+    for size in sizes:
+        @contextlib.contextmanager
+        def save(size=size):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "history.jsonl")
+                rng = random.Random(size)
+                with open(path, "w", encoding="utf-8") as f:
+                    for n in range(size):
+                        f.write(json.dumps(_history_entry(n, rng)) + "\n")
+                previous = app.HISTORY
+                app.HISTORY = HistoryStore(path=path, export_dir=os.path.join(tmp, "history_data"),
+                                           data_file=os.path.join(tmp, "data.js"))
+                try:
+                    # The warmup call loads the index; the timed calls are steady-state saves
+                    yield lambda: app.save_result(listing, analysis)
+                finally:
+                    app.HISTORY = previous
+
+        cases.append(Bench(f"save_result[{size}]", "history", save, history=size))
+    return cases
+
+
+# --- analyzer ---
+
+def analyzer_cases(backend):
+    listing = {
+        "url": "https://www.leboncoin.fr/ad/ordinateurs/1",
+        "title": "PC Gamer RTX 3060 Ryzen 5 5600X",
+        "price_str": "650",
+        "raw_text": "PC gamer en très bon état. RTX 3060 12 Go, Ryzen 5 5600X, 16 Go DDR4, SSD NVMe 1 To, "
+                    "carte mère B550, alimentation 650W. Remise en main propre Paris.\n" * 20,
+    }
+
+    @contextlib.contextmanager
+    def stub_api():
+        server = start_server(settings=StubSettings(answer=STUB_ANSWER))
+        try:
+            yield server
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    @contextlib.contextmanager
+    def analyze():
+        with stub_api() as server, _price_cache(1_000, backend):
+            appraiser = analyzer.AntigravityAnalyzer(cache=None, base_url=server.base_url)
+            yield lambda: appraiser.analyze_profitability(listing)
+
+    @contextlib.contextmanager
+    def analyze_many(count=20):
+        listings = [dict(listing, url=f"{listing['url']}{n}") for n in range(count)]
+
+        async def run_many(base_url):
+            # The async client's connections belong to one event loop: a fresh client per asyncio.run
+            _, async_client = analyzer.make_clients(base_url)
+            try:
+                appraiser = analyzer.AntigravityAnalyzer(cache=None, async_client=async_client)
+                return await appraiser.analyze_many_async(listings)
+            finally:
+                await async_client.close()
+
+        with stub_api() as server, _price_cache(1_000, backend):
+            yield lambda: asyncio.run(run_many(server.base_url))
+
+    return [
+        Bench("analyze_profitability[stub]", "analyzer", analyze, backend=backend),
+        Bench("analyze_many_async[stub, 20]", "analyzer", analyze_many, items=20, backend=backend),
+    ]
+
+
+# --- runner ---
+
+def collect(args):
+    names = QUICK_NAME_COUNT if args.quick else args.names
+    cache_rows = QUICK_CACHE_ROWS if args.quick else CACHE_ROWS
+    history_sizes = QUICK_HISTORY_SIZES if args.quick else HISTORY_SIZES
+    groups = [
+        lambda: parse_cases(args.page_kb),
+        lambda: rule_cases(names),
+        lambda: price_cache_cases(cache_rows, args.cache_backend),
+        lambda: history_cases(history_sizes),
+        lambda: analyzer_cases(args.cache_backend),
+    ]
+    for group in groups:
+        for case in group():
+            if not args.k or args.k in f"{case.group}.{case.name}":
+                yield case
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10).stdout.strip()
+    except Exception:
+        commit = ""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit or None,
+    }
+
+
+def _format_time(seconds):
+    if seconds >= 1:
+        return f"{seconds:8.3f} s "
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:8.3f} ms"
+    return f"{seconds * 1e6:8.3f} us"
+
+
+def compare(old, new):
+    """Lines of median change per benchmark present in both result files."""
+    before = {f"{b['group']}.{b['name']}": b for b in old["benchmarks"]}
+    lines = []
+    for bench in new["benchmarks"]:
+        key = f"{bench['group']}.{bench['name']}"
+        if key not in before:
+            continue
+        old_median = before[key]["stats"]["median"]
+        change = (bench["stats"]["median"] - old_median) / old_median * 100
+        lines.append(f"  {key:<48} {_format_time(old_median)} -> {_format_time(bench['stats']['median'])}  {change:+7.1f}%")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", metavar="SUBSTRING", help="Only run cases whose 'group.name' contains this")
+    parser.add_argument("--quick", action="store_true", help="Small sizes, for a smoke run")
+    parser.add_argument("--rounds", type=int, default=5, help="Timed rounds per case (default: 5)")
+    parser.add_argument("--names", type=int, default=NAME_COUNT, help="Synthetic names for the rules cases")
+    parser.add_argument("--page-kb", type=int, default=600, help="Pad each HTML fixture to this size (default: 600)")
+    parser.add_argument("--cache-backend", choices=("csv", "sqlite"), default="csv")
+    parser.add_argument("--save", metavar="FILE", help=f"Results file (default: {RESULTS_DIR}/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="FILE", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "machine": machine_info(),
+        "options": {"quick": args.quick, "rounds": args.rounds, "page_kb": args.page_kb,
+                    "cache_backend": args.cache_backend, "filter": args.k},
+        "benchmarks": [],
+    }
+    for case in collect(args):
+        # Progress lines and rich output of the code under test are not part of the report
+        with case.setup() as fn, contextlib.redirect_stdout(io.StringIO()):
+            stats = measure(fn, args.rounds)
+        stats["per_item"] = stats["median"] / case.items
+        results["benchmarks"].append({"name": case.name, "group": case.group, "params": case.params, "stats": stats})
+        per_item = f"  ({_format_time(stats['per_item']).strip()} per item)" if case.items > 1 else ""
+        print(f"  {case.group + '.' + case.name:<48} median {_format_time(stats['median'])}  "
+              f"stddev {_format_time(stats['stddev'])}{per_item}", flush=True)
+
+    path = args.save or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {path}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            old = json.load(f)
+        print(f"Median change vs. {args.compare} ({old['created_at']}):")
+        for line in compare(old, results):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
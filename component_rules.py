@@ -0,0 +1,194 @@
+"""
+component_rules.py
+Data-driven component pricing/categorization rules.
+
+Rules live in component_rules.json. All of their keywords are compiled once
+into an Aho-Corasick automaton, so a single pass over a component name finds
+every keyword it contains; the price and category rules are then resolved from
+that hit set without re-scanning the name for each rule.
+"""
+
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+
+DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "component_rules.json")
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton finding every (possibly overlapping) keyword occurrence in one pass."""
+
+    def __init__(self, keywords: List[str]):
+        self.keywords = list(keywords)
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+
+        # Trie of the keywords
+        terminal: List[List[int]] = [[]]
+        for keyword_id, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = self._goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    terminal.append([])
+                state = nxt
+            terminal[state].append(keyword_id)
+
+        # Failure links, breadth first; outputs include those of the failure state
+        out: List[List[int]] = [list(t) for t in terminal]
+        queue = list(self._goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                out[nxt].extend(out[self._fail[nxt]])
+        self._out = [tuple(o) for o in out]
+
+        # Fold the failure links into a full transition table (a DFA), so matching
+        # is a single dict lookup per character; unknown characters go back to the root.
+        self._delta: List[Dict[str, int]] = [dict(self._goto[0])]
+        for state in queue:
+            transitions = dict(self._delta[self._fail[state]]) if state else {}
+            transitions.update(self._goto[state])
+            while len(self._delta) <= state:
+                self._delta.append({})
+            self._delta[state] = transitions
+        self._has_out = [bool(o) for o in self._out]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yields (start, end, keyword_id) for every keyword occurrence; end is exclusive."""
+        delta, out, keywords = self._delta, self._out, self.keywords
+        state = 0
+        for index, ch in enumerate(text):
+            state = delta[state].get(ch, 0)
+            for keyword_id in out[state]:
+                yield index + 1 - len(keywords[keyword_id]), index + 1, keyword_id
+
+    def find(self, text: str) -> Set[int]:
+        """Ids of the keywords occurring anywhere in text."""
+        delta, out, has_out = self._delta, self._out, self._has_out
+        hits: Set[int] = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if has_out[state]:
+                hits.update(out[state])
+        return hits
+
+
+class _CompiledRules:
+    """An ordered rule table resolved against a keyword hit set (first matching rule wins)."""
+
+    def __init__(self, rules: List[Dict], value_key: str, keyword_ids: Dict[str, int]):
+        self.values = [rule[value_key] for rule in rules]
+        self.rules = rules
+        self.groups: List[List[frozenset]] = []
+        # Only rules whose first group was hit can match: index them by those keywords
+        self.by_first_keyword: Dict[int, List[int]] = {}
+        for rule_index, rule in enumerate(rules):
+            groups = [frozenset(keyword_ids[k.lower()] for k in group) for group in rule["match"]]
+            self.groups.append(groups)
+            for keyword_id in groups[0]:
+                self.by_first_keyword.setdefault(keyword_id, []).append(rule_index)
+
+    def resolve(self, hits: Set[int]) -> Optional[int]:
+        """Index of the first rule satisfied by the hit set, or None."""
+        candidates = set()
+        for keyword_id in hits:
+            candidates.update(self.by_first_keyword.get(keyword_id, ()))
+        for rule_index in sorted(candidates):
+            if all(group & hits for group in self.groups[rule_index][1:]):
+                return rule_index
+        return None
+
+
+class RuleEngine:
+    """Compiled price and category rules sharing one keyword automaton."""
+
+    def __init__(self, config: Dict):
+        self.default_price = config.get("default_price", 50)
+        self.default_category = config.get("default_category", "Other")
+        price_rules = config.get("price_rules", [])
+        category_rules = config.get("category_rules", [])
+
+        keywords: List[str] = []
+        keyword_ids: Dict[str, int] = {}
+        for rule in price_rules + category_rules:
+            if not rule.get("match"):
+                raise ValueError(f"Rule without keywords: {rule}")
+            for group in rule["match"]:
+                for keyword in group:
+                    keyword = keyword.lower()
+                    if keyword not in keyword_ids:
+                        keyword_ids[keyword] = len(keywords)
+                        keywords.append(keyword)
+
+        self.keyword_ids = keyword_ids
+        self.automaton = KeywordAutomaton(keywords)
+        self.price_rules = _CompiledRules(price_rules, "price", keyword_ids)
+        self.category_rules = _CompiledRules(category_rules, "category", keyword_ids)
+
+    def classify(self, component_name: str) -> Tuple[float, str]:
+        """(estimated new price, category) of a component name, from one pass over the name."""
+        hits = self.automaton.find(component_name.lower())
+        price_index = self.price_rules.resolve(hits)
+        category_index = self.category_rules.resolve(hits)
+        price = self.default_price if price_index is None else self.price_rules.values[price_index]
+        category = self.default_category if category_index is None else self.category_rules.values[category_index]
+        return price, category
+
+    def match(self, text: str, word_start: bool = False) -> Dict:
+        """
+        Rule match details for a text: price, category, whether a rule matched at
+        all ("matched"), and the model-number keywords (containing digits) of the
+        price rule that fired, e.g. ["rtx 3060"]; empty for generic rules like "gpu".
+        With word_start, keywords only count at the start of a word ("ram" not in "programme").
+        """
+        lowered = text.lower()
+        if word_start:
+            hits = {
+                keyword_id for start, _end, keyword_id in self.automaton.iter_matches(lowered)
+                if start == 0 or not lowered[start - 1].isalnum()
+            }
+        else:
+            hits = self.automaton.find(lowered)
+        price_index = self.price_rules.resolve(hits)
+        category_index = self.category_rules.resolve(hits)
+        model_keywords = []
+        if price_index is not None:
+            rule_keywords = frozenset().union(*self.price_rules.groups[price_index])
+            model_keywords = sorted(
+                self.automaton.keywords[k] for k in hits & rule_keywords
+                if any(ch.isdigit() for ch in self.automaton.keywords[k])
+            )
+        return {
+            "price": self.default_price if price_index is None else self.price_rules.values[price_index],
+            "category": self.default_category if category_index is None else self.category_rules.values[category_index],
+            "matched": price_index is not None or category_index is not None,
+            "model_keywords": model_keywords,
+        }
+
+    def estimate_price(self, component_name: str) -> float:
+        return self.classify(component_name)[0]
+
+    def categorize(self, component_name: str) -> str:
+        return self.classify(component_name)[1]
+
+
+def load_rule_engine(path: str = DEFAULT_RULES_FILE) -> RuleEngine:
+    """Load and compile a rules file."""
+    with open(path, "r", encoding="utf-8") as f:
+        return RuleEngine(json.load(f))
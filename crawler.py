@@ -0,0 +1,254 @@
+"""
+crawler.py
+Discovers listing URLs from Leboncoin search-result pages.
+
+SearchCrawler walks the result pages of a search (category, keywords, price
+range, location) with the AntigravityScraper browser pool, reads the ad ids
+and the prices shown on the result cards, and streams the URLs of new ads
+under a price threshold to the batch pipeline. Ads priced above the threshold
+never cost a detail scrape or a model call.
+"""
+
+import asyncio
+import json
+import re
+from typing import Dict, List, Optional
+from urllib.parse import urlencode
+
+from bs4 import BeautifulSoup
+
+import metrics
+from listing_parser import NEXT_DATA_RE, extract_price_from_text, format_price
+from parse_pool import get_parse_pool
+
+
+SEARCH_URL = "https://www.leboncoin.fr/recherche"
+AD_URL = "https://www.leboncoin.fr/ad/{category}/{ad_id}"
+# Leboncoin category ids used in search URLs
+CATEGORY_IDS = {"ordinateurs": "15"}
+DEFAULT_CATEGORY = "ordinateurs"
+DEFAULT_MAX_PAGES = 10
+# Pause between two result pages, on top of the scraper's own pacing
+SEARCH_PAGE_INTERVAL = 2.0
+# Tries per result page (a failed load or parse is retried once, then the crawl stops paginating)
+SEARCH_PAGE_ATTEMPTS = 2
+# Present once the result cards have rendered
+SEARCH_READY_SELECTOR = '[data-qa-id="aditem_container"]'
+
+_AD_HREF_RE = re.compile(r"/ad/([^/?#]+)/(\d+)")
+
+
+def build_search_url(query: Optional[str] = None, page: int = 1, category: str = DEFAULT_CATEGORY,
+                     price_min: Optional[int] = None, price_max: Optional[int] = None,
+                     locations: Optional[str] = None) -> str:
+    """Search-results URL for a category, keywords, price range and location, newest ads first."""
+    params = {"category": CATEGORY_IDS.get(category, category)}
+    if query:
+        params["text"] = query
+    if price_min is not None or price_max is not None:
+        params["price"] = f"{price_min if price_min is not None else 'min'}-{price_max if price_max is not None else 'max'}"
+    if locations:
+        params["locations"] = locations
+    params["sort"] = "time"
+    params["order"] = "desc"
+    if page > 1:
+        params["page"] = page
+    return f"{SEARCH_URL}?{urlencode(params)}"
+
+
+def _card(ad_id: str, category: str, title: str, price_str: str, url: Optional[str] = None) -> Dict:
+    return {
+        "ad_id": ad_id,
+        "url": url or AD_URL.format(category=category, ad_id=ad_id),
+        "title": title,
+        "price_str": price_str,
+    }
+
+
+def _find_ads(node, depth=0) -> Optional[List[Dict]]:
+    """The first list of ad dicts (with 'list_id' and 'subject') in a search page state."""
+    if depth > 8:
+        return None
+    if isinstance(node, list):
+        if node and all(isinstance(item, dict) and "list_id" in item and "subject" in item for item in node):
+            return node
+        children = node
+    elif isinstance(node, dict):
+        children = node.values()
+    else:
+        return None
+    for child in children:
+        if isinstance(child, (dict, list)):
+            found = _find_ads(child, depth + 1)
+            if found is not None:
+                return found
+    return None
+
+
+def cards_from_next_data(state) -> Optional[Dict]:
+    """{"cards", "max_pages"} from a decoded search page state, or None."""
+    if not isinstance(state, dict):
+        return None
+    search = ((state.get("props") or {}).get("pageProps") or {}).get("searchData") or {}
+    ads = search.get("ads") if isinstance(search.get("ads"), list) else _find_ads(state)
+    if ads is None:
+        return None
+    cards = []
+    for ad in ads:
+        if not isinstance(ad, dict) or ad.get("list_id") is None:
+            continue
+        url = ad.get("url") if isinstance(ad.get("url"), str) else None
+        match = _AD_HREF_RE.search(url or "")
+        category = match.group(1) if match else DEFAULT_CATEGORY
+        price_str = format_price(ad.get("price"))
+        if not price_str and isinstance(ad.get("price_cents"), (int, float)):
+            price_str = format_price(ad["price_cents"] / 100)
+        cards.append(_card(str(ad["list_id"]), category, str(ad.get("subject") or "").strip(), price_str, url))
+    return {"cards": cards, "max_pages": search.get("max_pages")}
+
+
+@metrics.timed("parse.search_soup")
+def cards_from_html(html: str) -> List[Dict]:
+    """Result cards from the search page markup (the fallback)."""
+    soup = BeautifulSoup(html, "html.parser")
+    cards = []
+    seen = set()
+    for link in soup.select('a[href*="/ad/"]'):
+        match = _AD_HREF_RE.search(link.get("href", ""))
+        if not match or match.group(2) in seen:
+            continue
+        seen.add(match.group(2))
+        title_tag = link.select_one('[data-qa-id="aditem_title"], p[title], h2, h3')
+        title = link.get("title") or ((title_tag.get("title") or title_tag.get_text(strip=True)) if title_tag else "")
+        price_tag = link.select_one('[data-qa-id="aditem_price"], [data-test-id="price"]')
+        price_text = price_tag.get_text(" ", strip=True) if price_tag else ""
+        if not price_text:
+            # Only a euro amount counts: the card text also holds dates, postcodes and specs
+            euro = re.search(r"\d[\d\s.,]*€", link.get_text(" ", strip=True))
+            price_text = euro.group(0) if euro else ""
+        cards.append(_card(match.group(2), match.group(1), title.strip(), extract_price_from_text(price_text)))
+    return cards
+
+
+def parse_search_results(next_data: Optional[str] = None, html: Optional[str] = None) -> Dict:
+    """
+    {"cards": [{"ad_id", "url", "title", "price_str"}], "max_pages", "source"} of a
+    search-results page, from the page state JSON when possible.
+    """
+    if not next_data and html:
+        match = NEXT_DATA_RE.search(html)
+        next_data = match.group(1) if match else None
+    if next_data:
+        try:
+            result = cards_from_next_data(json.loads(next_data))
+        except ValueError:
+            result = None
+        if result is not None:
+            return dict(result, source="next_data")
+    return {"cards": cards_from_html(html) if html else [], "max_pages": None, "source": "html"}
+
+
+class SearchCrawler:
+    """
+    Streams the URLs of ads found on search-result pages.
+
+    - scraper: a running AntigravityScraper session (its browser pool is shared
+      with the listing scrapes)
+    - max_price: ads whose card price is above this (or missing) are skipped
+    - max_pages: result pages visited per search
+    - parse_pool: ParsePool reading the result pages (default: the shared one),
+      so parsing never holds up the page fetches
+    """
+
+    def __init__(self, scraper, max_price=None, max_pages=DEFAULT_MAX_PAGES, page_interval=SEARCH_PAGE_INTERVAL,
+                 parse_pool=None):
+        self.scraper = scraper
+        self.parse_pool = parse_pool
+        self.max_price = max_price
+        self.max_pages = max_pages
+        self.page_interval = page_interval
+        self._seen_ids = set()
+        # Crawl statistics
+        self.pages = 0
+        self.cards = 0
+        self.duplicates = 0
+        self.over_price = 0
+        self.no_price = 0
+        self.yielded = 0
+        self.failed_pages = 0
+        # (url, error) of each result page given up on
+        self.errors = []
+
+    def _keep(self, card) -> bool:
+        """Price pre-filter on the card price."""
+        if self.max_price is None:
+            return True
+        if not card["price_str"]:
+            self.no_price += 1
+            return False
+        try:
+            price = float(card["price_str"])
+        except ValueError:
+            self.no_price += 1
+            return False
+        if price > self.max_price:
+            self.over_price += 1
+            return False
+        return True
+
+    async def discover(self, query=None, category=DEFAULT_CATEGORY, price_min=None, locations=None):
+        """Yields the URL of each new ad under max_price, page by page, as the pages are read."""
+        for page in range(1, self.max_pages + 1):
+            if page > 1 and self.page_interval:
+                await asyncio.sleep(self.page_interval)
+            url = build_search_url(query, page=page, category=category, price_min=price_min,
+                                   price_max=self.max_price, locations=locations)
+            result = await self._read_page(url)
+            if result is None:
+                # The ads already queued keep going; later pages would likely fail the same way
+                break
+            self.pages += 1
+
+            new_cards = 0
+            for card in result["cards"]:
+                self.cards += 1
+                if card["ad_id"] in self._seen_ids:
+                    self.duplicates += 1
+                    continue
+                self._seen_ids.add(card["ad_id"])
+                new_cards += 1
+                if self._keep(card):
+                    self.yielded += 1
+                    yield card["url"]
+
+            # Past the last page Leboncoin serves the last results again (or nothing)
+            if not new_cards or (result["max_pages"] and page >= result["max_pages"]):
+                break
+
+    async def _read_page(self, url) -> Optional[Dict]:
+        """parse_search_results of one result page, or None once SEARCH_PAGE_ATTEMPTS loads/parses failed."""
+        for attempt in range(1, SEARCH_PAGE_ATTEMPTS + 1):
+            try:
+                fetched = await self.scraper.fetch_search_page(url, SEARCH_READY_SELECTOR)
+                with metrics.span("parse.search"):
+                    return await (self.parse_pool or get_parse_pool()).run(
+                        parse_search_results, fetched["next_data"], fetched["html"])
+            except Exception as e:
+                error = str(e) or type(e).__name__
+                print(f"[yellow]Search page failed ({error}), attempt {attempt}/{SEARCH_PAGE_ATTEMPTS}: {url}[/yellow]")
+                if attempt < SEARCH_PAGE_ATTEMPTS and self.page_interval:
+                    await asyncio.sleep(self.page_interval)
+        self.failed_pages += 1
+        self.errors.append((url, error))
+        return None
+
+    def stats(self):
+        return {
+            "pages": self.pages,
+            "cards": self.cards,
+            "duplicates": self.duplicates,
+            "over_price": self.over_price,
+            "no_price": self.no_price,
+            "queued": self.yielded,
+            "failed_pages": self.failed_pages,
+        }
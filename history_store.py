@@ -0,0 +1,447 @@
+"""
+history_store.py
+Append-only scan history behind the dashboard.
+
+Each saved analysis is one JSON line in history.jsonl, written with a single
+O_APPEND write, so saving costs the same whatever the history size and an
+interrupted run can at worst leave one torn line (skipped on read).
+
+A HistoryIndex keeps the journal's sort orders (by date, profit and margin)
+and summary aggregates up to date one entry at a time as results are saved;
+its state is checkpointed next to the journal and caught up from the journal
+tail when loaded.
+
+dashboard.html reads an export of the journal: a small manifest (the
+aggregates and the shard list), the sort orders, and shards of SHARD_SIZE
+results that it loads as the list is scrolled. The export is brought up to
+date only when the dashboard is about to be used, rewriting just the shards
+that changed; every file is replaced atomically.
+
+    python history_store.py export   # rewrite the dashboard files
+    python history_store.py stats    # summary of the history
+"""
+
+import json
+import os
+import tempfile
+import threading
+from bisect import insort
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from price_fetcher import get_rule_engine
+
+HISTORY_FILE = "history.jsonl"
+# Dashboard export: manifest.js, indexes.js and shard-NNNNN.js files, loaded as <script>s (works from file://)
+EXPORT_DIR = "history_data"
+MANIFEST_FILE = "manifest.js"
+MANIFEST_PREFIX = "window.SCRAP_MANIFEST = "
+INDEXES_FILE = "indexes.js"
+INDEXES_PREFIX = "window.SCRAP_INDEXES = "
+SHARD_CALLBACK = "window.SCRAP_HISTORY_SHARD"
+SHARD_SIZE = 500
+# History file of earlier versions
+DATA_FILE = "data.js"
+DATA_JS_PREFIX = "window.SCRAP_HISTORY = "
+
+SORT_FIELDS = ("date", "profit", "margin")
+BEST_DEALS_PER_CATEGORY = 5
+# Bumped when the checkpointed index changes meaning; older checkpoints are rebuilt from the journal
+INDEX_VERSION = 2
+
+
+def deal_category(entry: Dict) -> str:
+    """
+    Component category of a result's most valuable part ('GPU', 'CPU', ...):
+    the part category saved with the analysis, else the component rules'.
+    'Other' for results without priced parts.
+    """
+    parts = [part for part in entry.get("parts") or [] if isinstance(part, dict)]
+    if not parts:
+        return "Other"
+    top = max(parts, key=lambda part: _number(part.get("estimated_price")))
+    category = top.get("category")
+    if not category or category == "Other":
+        category = get_rule_engine().categorize(top.get("component", ""))
+    return category
+
+
+def _number(value) -> float:
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _sort_value(entry: Dict, field: str):
+    if field == "date":
+        # "YYYY-MM-DD HH:MM" strings sort chronologically as they are
+        return entry.get("date") or ""
+    return _number(entry.get(field))
+
+
+def read_data_js(path: str = DATA_FILE) -> List[Dict]:
+    """Entries of a data.js history file, as written by earlier versions."""
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    json_str = content.replace(DATA_JS_PREFIX, "", 1).strip().rstrip(";")
+    return json.loads(json_str) if json_str else []
+
+
+def _read_js_assignment(path: str, prefix: str) -> Optional[Dict]:
+    """The JSON value of a `<prefix>{...};` file, or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    try:
+        return json.loads(content.replace(prefix, "", 1).strip().rstrip(";"))
+    except ValueError:
+        return None
+
+
+class HistoryIndex:
+    """
+    Sort orders and aggregates over the journal, updated one entry at a time.
+
+    Orders are kept as ascending (sort value, journal index) lists, so adding an
+    entry is a binary-search insertion; displayed orders are these reversed
+    (highest first, newest first among ties). stats() does no scan.
+    """
+
+    def __init__(self):
+        # Journal bytes and entries covered so far
+        self.journal_bytes = 0
+        self.count = 0
+        self.keys = {field: [] for field in SORT_FIELDS}
+        self.verdicts = {}
+        self.profit_sum = 0.0
+        self.margin_sum = 0.0
+        self.best_profit = None
+        self.first_date = None
+        self.last_date = None
+        # Component category of the most valuable part (deal_category) -> best deals by profit, best first
+        self.best_deals = {}
+
+    def add(self, entry: Dict):
+        index = self.count
+        self.count += 1
+        for field in SORT_FIELDS:
+            insort(self.keys[field], (_sort_value(entry, field), index))
+
+        verdict = entry.get("verdict", "UNKNOWN")
+        self.verdicts[verdict] = self.verdicts.get(verdict, 0) + 1
+        profit = _number(entry.get("profit"))
+        self.profit_sum += profit
+        self.margin_sum += _number(entry.get("margin"))
+        if self.best_profit is None or profit > self.best_profit:
+            self.best_profit = profit
+        date = entry.get("date")
+        if date:
+            self.first_date = min(self.first_date or date, date)
+            self.last_date = max(self.last_date or date, date)
+
+        deals = self.best_deals.setdefault(deal_category(entry), [])
+        if len(deals) < BEST_DEALS_PER_CATEGORY or profit > deals[-1]["profit"]:
+            deals.append({
+                "index": index,
+                "title": entry.get("title", ""),
+                "url": entry.get("url", ""),
+                "profit": profit,
+                "margin": _number(entry.get("margin")),
+                "verdict": verdict,
+            })
+            deals.sort(key=lambda deal: (-deal["profit"], -deal["index"]))
+            del deals[BEST_DEALS_PER_CATEGORY:]
+
+    def order(self, field: str) -> List[int]:
+        """Journal indexes in display order for a sort field (highest/newest first)."""
+        return [index for _, index in reversed(self.keys[field])]
+
+    def stats(self) -> Dict:
+        return {
+            "count": self.count,
+            "verdicts": dict(self.verdicts),
+            "profit_sum": round(self.profit_sum, 2),
+            "best_profit": self.best_profit if self.best_profit is not None else 0,
+            "mean_margin": round(self.margin_sum / self.count, 2) if self.count else 0.0,
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "best_deals": {category: list(deals) for category, deals in self.best_deals.items()},
+        }
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": INDEX_VERSION,
+            "journal_bytes": self.journal_bytes,
+            "count": self.count,
+            "keys": self.keys,
+            "profit_sum": self.profit_sum,
+            "margin_sum": self.margin_sum,
+            "verdicts": self.verdicts,
+            "best_profit": self.best_profit,
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "best_deals": self.best_deals,
+        }
+
+    @classmethod
+    def from_dict(cls, state: Dict) -> "HistoryIndex":
+        if state.get("version") != INDEX_VERSION:
+            raise ValueError("index checkpoint from another version")
+        index = cls()
+        index.journal_bytes = state["journal_bytes"]
+        index.count = state["count"]
+        index.keys = {field: [tuple(key) for key in state["keys"][field]] for field in SORT_FIELDS}
+        index.profit_sum = state["profit_sum"]
+        index.margin_sum = state["margin_sum"]
+        index.verdicts = state["verdicts"]
+        index.best_profit = state["best_profit"]
+        index.first_date = state["first_date"]
+        index.last_date = state["last_date"]
+        index.best_deals = state["best_deals"]
+        return index
+
+
+class HistoryStore:
+    """
+    JSON Lines scan history with its HistoryIndex and an on-demand dashboard export.
+
+    On first use, an existing data.js without a journal is imported, so the
+    history saved by earlier versions is kept.
+    """
+
+    def __init__(self, path: str = HISTORY_FILE, export_dir: str = EXPORT_DIR,
+                 shard_size: int = SHARD_SIZE, data_file: str = DATA_FILE):
+        self.path = path
+        self.export_dir = export_dir
+        self.shard_size = shard_size
+        # Legacy single-file history, imported once
+        self.data_file = data_file
+        # Checkpoint of the HistoryIndex (history_index.json next to history.jsonl)
+        self.index_path = os.path.splitext(path)[0] + "_index.json"
+        self._lock = threading.RLock()
+        self._ready = False
+        self._index = None
+
+    def _ensure_ready(self):
+        """Imports a legacy data.js and makes sure the journal ends with a newline."""
+        if self._ready:
+            return
+        if not os.path.exists(self.path):
+            legacy = read_data_js(self.data_file)
+            if legacy:
+                lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in legacy)
+                self._write_atomic(self.path, lines)
+        elif os.path.getsize(self.path) > 0:
+            # A run killed mid-write leaves a torn last line: start the next entry on a fresh line
+            with open(self.path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                torn = f.read(1) != b"\n"
+            if torn:
+                self._append_bytes(b"\n")
+        self._ready = True
+
+    def _append_bytes(self, data: bytes) -> int:
+        """Appends to the journal; returns the offset the data was written at."""
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            # With O_APPEND the position is the end of this write, even with other writers
+            return os.lseek(fd, 0, os.SEEK_CUR) - len(data)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _write_atomic(path: str, text: str):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".history.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def append(self, entry: Dict):
+        """Adds one result to the journal and the index (safe to call from several threads)."""
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._ensure_ready()
+            index = self.index()
+            offset = self._append_bytes(line)
+            if offset == index.journal_bytes:
+                index.add(entry)
+                index.journal_bytes += len(line)
+            # Otherwise another process appended too: index() catches up from the journal
+
+    def _lines(self) -> Iterator[str]:
+        """Valid JSON lines of the journal, as stored."""
+        with self._lock:
+            self._ensure_ready()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    json.loads(line)
+                except ValueError:
+                    continue # Torn line from an interrupted write
+                yield line
+
+    def entries(self) -> List[Dict]:
+        return [json.loads(line) for line in self._lines()]
+
+    def __len__(self):
+        return self.index().count
+
+    def _journal_size(self) -> int:
+        return os.path.getsize(self.path) if os.path.exists(self.path) else 0
+
+    def _read_from(self, offset: int) -> Tuple[List[Tuple[int, Dict]], int]:
+        """
+        ([(byte offset, entry)], end offset) for the complete lines from `offset`
+        on. A trailing line still being written is left for the next read.
+        """
+        found = []
+        if not os.path.exists(self.path):
+            return found, offset
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                start, offset = offset, offset + len(line)
+                try:
+                    found.append((start, json.loads(line)))
+                except ValueError:
+                    continue # Torn line from an interrupted write
+        return found, offset
+
+    def index(self) -> HistoryIndex:
+        """The HistoryIndex, loaded from its checkpoint on first use and caught up with the journal."""
+        with self._lock:
+            self._ensure_ready()
+            if self._index is None:
+                self._index = HistoryIndex()
+                if os.path.exists(self.index_path):
+                    try:
+                        with open(self.index_path, "r", encoding="utf-8") as f:
+                            state = HistoryIndex.from_dict(json.load(f))
+                        # A checkpoint past the end of the journal belongs to another journal
+                        if state.journal_bytes <= self._journal_size():
+                            self._index = state
+                    except (ValueError, KeyError, TypeError):
+                        pass # Unreadable checkpoint: rebuild from the journal
+            if self._index.journal_bytes < self._journal_size():
+                found, end = self._read_from(self._index.journal_bytes)
+                for _, entry in found:
+                    self._index.add(entry)
+                self._index.journal_bytes = end
+            return self._index
+
+    def stats(self) -> Dict:
+        """Aggregates of the whole history: counts per verdict, mean margin, best deals per main component category."""
+        return self.index().stats()
+
+    def read_manifest(self) -> Optional[Dict]:
+        """The manifest of the last dashboard export, or None."""
+        return _read_js_assignment(os.path.join(self.export_dir, MANIFEST_FILE), MANIFEST_PREFIX)
+
+    def export_shards(self, force: bool = False) -> int:
+        """
+        Brings the dashboard export up to date and returns the number of shard
+        files written. Entries go into shards of `shard_size` in journal order;
+        full shards never change, so only the last, partial shard and new ones
+        are (re)written from the journal tail. The sort orders come from the
+        index, and the manifest is replaced last.
+        """
+        with self._lock:
+            index = self.index()
+            manifest = None if force else self.read_manifest()
+            if manifest is not None and manifest.get("shard_size") != self.shard_size:
+                manifest = None
+            if manifest is not None and manifest["journal_bytes"] == index.journal_bytes:
+                return 0
+
+            if manifest is None and os.path.isdir(self.export_dir):
+                # Full rewrite: drop shards of an older layout
+                for name in os.listdir(self.export_dir):
+                    if name.startswith("shard-") and name.endswith(".js"):
+                        os.remove(os.path.join(self.export_dir, name))
+
+            shards = list(manifest["shards"]) if manifest else []
+            offset = manifest["journal_bytes"] if manifest else 0
+            if shards and shards[-1]["count"] < self.shard_size:
+                offset = shards.pop()["offset"]
+            found, _ = self._read_from(offset)
+            # Stay consistent with the index if another process appended meanwhile
+            found = [item for item in found if item[0] < index.journal_bytes]
+
+            written = 0
+            for start in range(0, len(found), self.shard_size):
+                chunk = found[start:start + self.shard_size]
+                number = len(shards)
+                entries = [entry for _, entry in chunk]
+                dates = [entry["date"] for entry in entries if entry.get("date")]
+                shard = {
+                    "file": f"shard-{number:05d}.js",
+                    "offset": chunk[0][0],
+                    "count": len(entries),
+                    "first_date": min(dates) if dates else None,
+                    "last_date": max(dates) if dates else None,
+                }
+                body = ",\n".join(json.dumps(entry, ensure_ascii=False) for entry in entries)
+                self._write_atomic(
+                    os.path.join(self.export_dir, shard["file"]),
+                    f"{SHARD_CALLBACK}({number}, [\n{body}\n]);\n",
+                )
+                shards.append(shard)
+                written += 1
+
+            orders = {field: index.order(field) for field in SORT_FIELDS}
+            self._write_atomic(
+                os.path.join(self.export_dir, INDEXES_FILE),
+                f"{INDEXES_PREFIX}{json.dumps(orders, separators=(',', ':'))};\n",
+            )
+            self._write_atomic(self.index_path, json.dumps(index.to_dict(), separators=(",", ":")))
+            manifest = {
+                "version": 2,
+                "shard_size": self.shard_size,
+                "journal_bytes": index.journal_bytes,
+                "totals": index.stats(),
+                "shards": shards,
+            }
+            self._write_atomic(
+                os.path.join(self.export_dir, MANIFEST_FILE),
+                f"{MANIFEST_PREFIX}{json.dumps(manifest, ensure_ascii=False)};\n",
+            )
+            return written
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Scan history journal.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("export", help=f"Rewrite the dashboard files in {EXPORT_DIR}/")
+    sub.add_parser("stats", help="Counts per verdict, mean margin and best deals per main component (GPU, CPU, ...)")
+    args = parser.parse_args()
+
+    store = HistoryStore()
+    if args.command == "export":
+        shards = store.export_shards(force=True)
+        print(f"Exported {len(store)} results to {shards} shards in {store.export_dir}/")
+    elif args.command == "stats":
+        stats = store.stats()
+        print(f"{stats['count']} scans from {stats['first_date']} to {stats['last_date']}")
+        print("  " + ", ".join(f"{verdict}: {count}" for verdict, count in sorted(stats["verdicts"].items())))
+        print(f"  mean margin: {stats['mean_margin']}%, best profit: {stats['best_profit']}€")
+        for category, deals in sorted(stats["best_deals"].items()):
+            print(f"  best deals with a {category} as main component:")
+            for deal in deals:
+                print(f"    {deal['profit']:>8}€  {deal['margin']:>7}%  {deal['verdict']:<5}  {deal['title'][:60]}")
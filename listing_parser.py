@@ -0,0 +1,257 @@
+"""
+listing_parser.py
+Extraction of title, price and description from a Leboncoin ad page.
+
+Ad pages embed their data as JSON: the Next.js page state (__NEXT_DATA__) and
+a schema.org JSON-LD block. Those are sliced out of the HTML with a regex and
+decoded directly, which is much cheaper than building a DOM of a large page.
+BeautifulSoup is only used when neither block is usable; with the optional
+`selectolax` or `lxml` package installed, that fallback uses the faster parser.
+
+extract_listing is the whole extraction as a pure function over the page bytes
+(or the page state JSON), so it can run in worker processes (see parse_pool.py).
+"""
+
+import json
+import os
+import re
+from typing import Dict, Optional, Union
+
+from bs4 import BeautifulSoup
+
+import metrics
+
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError: # Optional: BeautifulSoup is used without it
+    SelectolaxParser = None
+
+try:
+    import lxml
+except ImportError: # Optional: faster BeautifulSoup tree builder
+    lxml = None
+
+
+NEXT_DATA_RE = re.compile(r'<script[^>]*\bid=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.DOTALL | re.IGNORECASE)
+JSON_LD_RE = re.compile(r'<script[^>]*\btype=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.DOTALL | re.IGNORECASE)
+
+# Returns the page state without serializing the whole DOM (for page.evaluate)
+NEXT_DATA_SCRIPT = "() => { const el = document.getElementById('__NEXT_DATA__'); return el ? el.textContent : null; }"
+
+# How deep to look for the ad object in an unfamiliar page state
+MAX_STATE_DEPTH = 8
+
+# DOM parsers for the fallback, fastest first; LISTING_HTML_PARSER picks one
+HTML_PARSERS = ("selectolax", "lxml", "html.parser")
+
+
+def extract_price_from_text(s: str) -> str:
+    """Cleans and extracts a numeric price from text (handles NBSP and thin spaces)."""
+    if not s:
+        return ""
+    # Common NBSP or narrow NBSP characters
+    s = s.replace('\u00A0', ' ').replace('\u202F', ' ').replace('\u2009', ' ')
+    # Try to find patterns like '1 000 €' or '1000€' or '1\u0000 000 €'
+    m = re.search(r"(\d{1,3}(?:[ \.,]\d{3})*(?:[\.,]\d+)?)\s*€", s)
+    if not m:
+        # fallback: any standalone number sequence
+        m = re.search(r"(\d[\d \.,]*)", s)
+    if not m:
+        return ""
+    num = m.group(1)
+    # Remove grouping spaces and non-digit punctuation, keep decimal dot
+    num = num.replace(' ', '').replace('\u00A0', '').replace('\u202F', '')
+    num = num.replace(',', '.')
+    # Strip any trailing non-digit/point
+    num = re.sub(r"[^0-9.]", '', num)
+    return num
+
+
+def format_price(value) -> str:
+    """'450' for 450 / 450.0 / [450] / '450', '' when there is no usable number."""
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, str):
+        return extract_price_from_text(value)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(int(value)) if float(value).is_integer() else str(value)
+    return ""
+
+
+def _find_ad(node, depth=0) -> Optional[Dict]:
+    """The first dict with a 'subject' and a 'body' (Leboncoin's ad shape) in a page state."""
+    if depth > MAX_STATE_DEPTH:
+        return None
+    if isinstance(node, dict):
+        if isinstance(node.get("subject"), str) and "body" in node:
+            return node
+        children = node.values()
+    elif isinstance(node, list):
+        children = node
+    else:
+        return None
+    for child in children:
+        if isinstance(child, (dict, list)):
+            found = _find_ad(child, depth + 1)
+            if found is not None:
+                return found
+    return None
+
+
+def listing_from_next_data(state) -> Optional[Dict]:
+    """{title, price_str, raw_text} from a decoded __NEXT_DATA__ state, or None."""
+    if not isinstance(state, dict):
+        return None
+    ad = ((state.get("props") or {}).get("pageProps") or {}).get("ad")
+    if not isinstance(ad, dict) or not ad.get("subject"):
+        ad = _find_ad(state)
+    if ad is None:
+        return None
+    price_str = format_price(ad.get("price"))
+    if not price_str and isinstance(ad.get("price_cents"), (int, float)):
+        price_str = format_price(ad["price_cents"] / 100)
+    return {"title": ad["subject"].strip(), "price_str": price_str, "raw_text": (ad.get("body") or "").strip()}
+
+
+def parse_next_data_json(text: Optional[str]) -> Optional[Dict]:
+    """listing_from_next_data over the raw JSON text of the __NEXT_DATA__ script."""
+    if not text:
+        return None
+    try:
+        return listing_from_next_data(json.loads(text))
+    except ValueError:
+        return None
+
+
+def listing_from_json_ld(data) -> Optional[Dict]:
+    """{title, price_str, raw_text} from a decoded JSON-LD block (Product with an Offer), or None."""
+    candidates = data if isinstance(data, list) else [data]
+    for candidate in list(candidates):
+        if isinstance(candidate, dict) and isinstance(candidate.get("@graph"), list):
+            candidates.extend(candidate["@graph"])
+    for item in candidates:
+        if not isinstance(item, dict) or not item.get("name"):
+            continue
+        types = item.get("@type")
+        types = types if isinstance(types, list) else [types]
+        if "Product" not in types and "Offer" not in types:
+            continue
+        offers = item.get("offers") or {}
+        offer = offers[0] if isinstance(offers, list) and offers else offers
+        price = offer.get("price") if isinstance(offer, dict) else item.get("price")
+        return {
+            "title": str(item["name"]).strip(),
+            "price_str": format_price(price),
+            "raw_text": str(item.get("description") or "").strip(),
+        }
+    return None
+
+
+def available_parsers():
+    """The HTML_PARSERS whose package is installed."""
+    installed = {"selectolax": SelectolaxParser is not None, "lxml": lxml is not None, "html.parser": True}
+    return [name for name in HTML_PARSERS if installed[name]]
+
+
+def resolve_parser(name: Optional[str] = None) -> str:
+    """The DOM parser to use: `name`, else $LISTING_HTML_PARSER, else the fastest installed."""
+    name = name or os.getenv("LISTING_HTML_PARSER")
+    if not name:
+        return available_parsers()[0]
+    if name not in available_parsers():
+        raise ValueError(f"HTML parser {name!r} is not available (installed: {', '.join(available_parsers())})")
+    return name
+
+
+def _selectolax_text(node, separator: str) -> str:
+    """Like BeautifulSoup's get_text(separator, strip=True): the stripped, non-empty strings joined."""
+    if node is None:
+        return ""
+    chunks = (chunk.strip() for chunk in node.text(separator="\x00").split("\x00"))
+    return separator.join(chunk for chunk in chunks if chunk)
+
+
+def _parse_listing_selectolax(html: str) -> Dict:
+    tree = SelectolaxParser(html)
+    # BeautifulSoup's get_text leaves script and style contents out too
+    tree.strip_tags(["script", "style", "template"])
+
+    title_tag = tree.css_first('h1')
+    title = _selectolax_text(title_tag, "") if title_tag else "Unknown Title"
+
+    price_tag = tree.css_first('[data-qa-id="adview_price"]')
+    raw_price = _selectolax_text(price_tag if price_tag else tree.root, " ")
+
+    description_tag = tree.css_first('[data-qa-id="adview_description_container"]')
+    raw_text = _selectolax_text(description_tag if description_tag else tree.root, "\n")
+
+    return {"title": title, "price_str": extract_price_from_text(raw_price), "raw_text": raw_text}
+
+
+@metrics.timed("parse.soup")
+def parse_listing_soup(html: str, parser: Optional[str] = None) -> Dict:
+    """DOM-based extraction (the fallback): title, price_str and raw_text."""
+    parser = resolve_parser(parser)
+    if parser == "selectolax":
+        return _parse_listing_selectolax(html)
+    soup = BeautifulSoup(html, parser)
+
+    # Extract Title
+    title_tag = soup.find('h1')
+    title = title_tag.get_text(strip=True) if title_tag else "Unknown Title"
+
+    # Extract Price (LBC specific structure often changes). Best-effort extraction.
+    price_tag = soup.select_one('[data-qa-id="adview_price"]')
+    if price_tag:
+        raw_price = price_tag.get_text(separator=' ', strip=True)
+    else:
+        # Fallback: search the entire page text for something that looks like a euro amount
+        raw_price = soup.get_text(separator=' ', strip=True)
+
+    # Extract Description
+    description_tag = soup.select_one('[data-qa-id="adview_description_container"]')
+    # Keep line breaks in the whole-page fallback so page chrome can be filtered out line by line
+    raw_text = description_tag.get_text(separator='\n', strip=True) if description_tag else soup.get_text(separator='\n', strip=True)
+
+    return {"title": title, "price_str": extract_price_from_text(raw_price), "raw_text": raw_text}
+
+
+@metrics.timed("parse.listing_html")
+def parse_listing_html(html: str, parser: Optional[str] = None) -> Dict:
+    """
+    title, price_str, raw_text and "source" ("next_data", "json_ld" or "html")
+    of an ad page, from the embedded JSON when possible.
+    """
+    match = NEXT_DATA_RE.search(html)
+    if match:
+        listing = parse_next_data_json(match.group(1))
+        if listing is not None:
+            return dict(listing, source="next_data")
+
+    for match in JSON_LD_RE.finditer(html):
+        try:
+            listing = listing_from_json_ld(json.loads(match.group(1)))
+        except ValueError:
+            continue
+        if listing is not None:
+            return dict(listing, source="json_ld")
+
+    return dict(parse_listing_soup(html, parser), source="html")
+
+
+def extract_listing(html: Union[bytes, str, None] = None, next_data: Optional[str] = None,
+                    parser: Optional[str] = None) -> Optional[Dict]:
+    """
+    title, price_str, raw_text and "source" of an ad, from the page state JSON
+    text and/or the full page (UTF-8 bytes or str). None when only a page state
+    was given and it holds no ad. Pure and picklable: safe in a worker process.
+    """
+    if next_data:
+        listing = parse_next_data_json(next_data)
+        if listing is not None:
+            return dict(listing, source="next_data")
+    if html is None:
+        return None
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    return parse_listing_html(html, parser)
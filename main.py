@@ -1,6 +1,7 @@
+import argparse
 import asyncio
+import functools
 import sys
-import json
 import os
 import webbrowser
 from datetime import datetime
@@ -9,15 +10,27 @@ from rich.table import Table
 from rich.panel import Panel
 from rich import print as rprint
 
+import metrics
 from scraper import AntigravityScraper
-from analyzer import AntigravityAnalyzer
+from analyzer import AnalysisCache, AntigravityAnalyzer
+from crawler import DEFAULT_MAX_PAGES, SearchCrawler
+from local_analysis import LOCAL_CONFIDENCE_THRESHOLD
+from listing_parser import HTML_PARSERS
+from parse_pool import DEFAULT_PARSE_WORKERS, ParsePool, set_parse_pool
+from history_store import HistoryStore
+from pipeline import BatchPipeline
+from seen_listings import RESCRAPE_AFTER_SECONDS, SeenListings
+from snapshot_store import SnapshotReplayer, SnapshotStore
 
 console = Console()
-DATA_FILE = "data.js"
 DASHBOARD_FILE = "dashboard.html"
+HISTORY = HistoryStore()
 
-def save_result(data, analysis):
-    """Saves the analysis result to data.js"""
+def save_result(data, analysis, raise_errors=False):
+    """
+    Appends the analysis result to the scan history (see history_store.py).
+    A failed save is printed, and re-raised with raise_errors (batch runs count it as a failure).
+    """
     
     # Construct the result object
     result_entry = {
@@ -34,36 +47,240 @@ def save_result(data, analysis):
         "reasoning": analysis.get('reasoning', '')
     }
 
-    # Read existing data
-    history = []
-    if os.path.exists(DATA_FILE):
-        try:
-            with open(DATA_FILE, "r", encoding="utf-8") as f:
-                content = f.read()
-                # Strip "window.SCRAP_HISTORY = " and ";"
-                json_str = content.replace("window.SCRAP_HISTORY = ", "").strip().rstrip(";")
-                if json_str:
-                    history = json.loads(json_str)
-        except Exception as e:
-            console.print(f"[bold red]Warning: Could not read existing history: {e}[/bold red]")
-
-    # Append new result
-    history.append(result_entry)
-
-    # Write back to file
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            f.write(f"window.SCRAP_HISTORY = {json.dumps(history, indent=4)};")
-        console.print(f"[bold green]>> Result saved to {DATA_FILE}[/bold green]")
+        HISTORY.append(result_entry)
+        console.print(f"[bold green]>> Result saved to {HISTORY.path}[/bold green]")
     except Exception as e:
         console.print(f"[bold red]Error saving data: {e}[/bold red]")
+        if raise_errors:
+            raise
+
+def positive_int(value):
+    """argparse type: an integer of at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="LBC-Arbitrage: find profitable part-out gaming PCs on Leboncoin.")
+    parser.add_argument("url", nargs="?", help="Leboncoin listing URL (prompted for if omitted)")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="Read listing URLs (one per line) from FILE, or from stdin with '-'")
+    parser.add_argument("--search", metavar="QUERY",
+                        help="Discover listings from Leboncoin search results ('' for the whole category) and scan them")
+    parser.add_argument("--max-price", type=int, help="Only scan search results priced at most this (EUR)")
+    parser.add_argument("--min-price", type=int, help="Only scan search results priced at least this (EUR)")
+    parser.add_argument("--location", help="Search location filter, as in Leboncoin URLs (e.g. Paris)")
+    parser.add_argument("--max-pages", type=int, default=DEFAULT_MAX_PAGES, help="Search result pages to walk")
+    parser.add_argument("--scrape-workers", type=int, default=2, help="Concurrent browser pages (batch mode)")
+    parser.add_argument("--analyze-workers", type=int, default=4, help="Concurrent AI analyses (batch mode)")
+    parser.add_argument("--persist-workers", type=int, default=1, help="Concurrent result writers (batch mode)")
+    parser.add_argument("--queue-size", type=int, default=8, help="Capacity of the queues between stages (batch mode)")
+    parser.add_argument("--llm-batch-size", type=positive_int, default=1,
+                        help="Listings packed into one model request (batch mode)")
+    parser.add_argument("--no-analysis-cache", action="store_true",
+                        help="Always ask the model, even for listings analyzed before")
+    parser.add_argument("--local-first", action="store_true",
+                        help="Appraise clearly described listings offline and only ask the model for the rest")
+    parser.add_argument("--local-threshold", type=float, default=LOCAL_CONFIDENCE_THRESHOLD,
+                        help="Minimum local extraction confidence (0-1) to skip the model (with --local-first)")
+    parser.add_argument("--replay", action="store_true",
+                        help="Re-run parsing and analysis on stored page snapshots (those of --batch, or all) without a browser")
+    parser.add_argument("--no-snapshots", action="store_true",
+                        help="Do not keep the raw HTML of scraped pages")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="Scrape and analyze every URL, even ads seen recently or unchanged (batch mode)")
+    parser.add_argument("--rescrape-after", type=float, default=RESCRAPE_AFTER_SECONDS / 3600, metavar="HOURS",
+                        help="Scrape an ad seen before again only after this many hours (batch mode)")
+    parser.add_argument("--openai-base-url", metavar="URL",
+                        help="OpenAI-compatible API to use instead of OpenAI's (e.g. stub_openai_server.py); "
+                             "defaults to $OPENAI_BASE_URL")
+    parser.add_argument("--parse-workers", type=int, default=DEFAULT_PARSE_WORKERS, metavar="N",
+                        help="Processes parsing scraped pages (0: a thread of the main process)")
+    parser.add_argument("--html-parser", choices=HTML_PARSERS,
+                        help="DOM parser of the HTML fallback (default: the fastest installed; "
+                             "selectolax and lxml are optional packages)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve step timings and counters in Prometheus format on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="Append one JSON line per timed step (page.goto, openai.completion, ...) to FILE")
+    return parser.parse_args(argv)
+
+
+def build_scraper(args, **kwargs):
+    """Scraper keeping a snapshot of every fetched page unless --no-snapshots."""
+    return AntigravityScraper(snapshot_store=None if args.no_snapshots else SnapshotStore(), **kwargs)
+
+
+def build_analyzer(args):
+    """Analyzer reusing cached answers for unchanged listings unless --no-analysis-cache."""
+    return AntigravityAnalyzer(
+        cache=None if args.no_analysis_cache else AnalysisCache(),
+        max_concurrency=args.analyze_workers,
+        local_threshold=args.local_threshold if args.local_first else None,
+        base_url=args.openai_base_url,
+    )
+
+
+async def read_urls(source):
+    """Streams URLs from a file or stdin ('-'), skipping blank lines and # comments."""
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8")
+    try:
+        while True:
+            # readline can block on stdin: keep it off the event loop
+            line = await asyncio.to_thread(stream.readline)
+            if not line:
+                break
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def print_batch_summary(summary):
+    """Prints the throughput summary of a batch run."""
+    console.print(
+        f"\n[bold]>> Batch done:[/bold] {summary['completed']} listings saved, "
+        f"{summary['failed']} failed in {summary['elapsed_s']}s "
+        f"([bold cyan]{summary['listings_per_min']} listings/min[/bold cyan])"
+    )
+    table = Table(title="Pipeline Stages", show_header=True, header_style="bold magenta")
+    table.add_column("Stage")
+    table.add_column("Workers", justify="right")
+    table.add_column("Processed", justify="right")
+    table.add_column("Failed", justify="right")
+    table.add_column("p50", justify="right")
+    table.add_column("p95", justify="right")
+    for name, stage in summary["stages"].items():
+        table.add_row(
+            name,
+            str(stage["workers"]),
+            str(stage["processed"]),
+            str(stage["failed"]),
+            f"{stage['p50_s']}s",
+            f"{stage['p95_s']}s",
+        )
+    console.print(table)
+
+
+async def run_batch(args):
+    """Streams a list of URLs through the scrape -> analyze -> persist pipeline."""
+    analyzer = build_analyzer(args)
+    # Replays are meant to re-run everything
+    seen = None if args.no_dedup or args.replay else SeenListings(rescrape_after=args.rescrape_after * 3600)
+
+    def make_pipeline(scraper, scrape_workers=args.scrape_workers):
+        return BatchPipeline(
+            scraper,
+            analyzer,
+            # Failed saves must reach the pipeline: not completed, not marked as analyzed
+            functools.partial(save_result, raise_errors=True),
+            scrape_workers=scrape_workers,
+            analyze_workers=args.analyze_workers,
+            persist_workers=args.persist_workers,
+            queue_size=args.queue_size,
+            analyze_batch_size=args.llm_batch_size,
+            seen=seen,
+        )
+
+    transfer = None
+    crawler = None
+    if args.replay:
+        replayer = SnapshotReplayer(SnapshotStore())
+        # No browser pages to bound: keep every parse worker busy
+        pipeline = make_pipeline(replayer, scrape_workers=replayer.concurrency)
+        summary = await pipeline.run(read_urls(args.batch) if args.batch else None)
+    else:
+        async with build_scraper(args, pool_size=args.scrape_workers) as scraper:
+            pipeline = make_pipeline(scraper)
+            if args.search is not None:
+                # Ad URLs stream from the result pages into the pipeline as they are found
+                crawler = SearchCrawler(scraper, max_price=args.max_price, max_pages=args.max_pages)
+                urls = crawler.discover(args.search, price_min=args.min_price, locations=args.location)
+            else:
+                urls = read_urls(args.batch)
+            summary = await pipeline.run(urls)
+            transfer = scraper.transfer_stats()
+
+    for stage, url, error in pipeline.errors:
+        rprint(f"[red]{stage} failed for {url}: {error}[/red]")
+    print_batch_summary(summary)
+    if HISTORY.export_shards():
+        console.print(f"[dim]Dashboard data refreshed ({HISTORY.export_dir}/)[/dim]")
+    if transfer is not None:
+        console.print(
+            f"[dim]Pages: {transfer['pages']}, {transfer['mean_bytes'] / 1024:.0f} KiB and "
+            f"{transfer['mean_load_s']}s per page on average, {transfer['blocked_requests']} requests blocked[/dim]"
+        )
+    else:
+        console.print(f"[dim]Replayed {replayer.replayed} stored snapshots[/dim]")
+    if crawler is not None:
+        stats = crawler.stats()
+        console.print(
+            f"[dim]Search: {stats['pages']} result pages, {stats['cards']} cards, {stats['queued']} listings queued, "
+            f"{stats['over_price']} over the price limit and {stats['no_price']} without a price skipped[/dim]"
+        )
+        for url, error in crawler.errors:
+            rprint(f"[red]Search page failed: {url}: {error}[/red]")
+    if seen is not None:
+        stats = seen.stats()
+        console.print(
+            f"[dim]Seen listings: {stats['skipped_recent']} scraped recently and {stats['skipped_duplicate']} "
+            f"repeated URLs skipped, {stats['unchanged']} unchanged listings not re-analyzed "
+            f"({stats['scrapes_avoided']} scrapes and {stats['analyses_avoided']} analyses avoided)[/dim]"
+        )
+    if analyzer.cache is not None:
+        stats = analyzer.cache.stats()
+        console.print(f"[dim]Analysis cache: {stats['hits']} hits, {stats['misses']} misses[/dim]")
+    console.print(f"[dim]Prompt compaction saved ~{analyzer.tokens_saved} tokens[/dim]")
+    resolved = analyzer.resolution_stats()
+    console.print(
+        f"[dim]Resolved locally: {resolved['local']} ({resolved['local_fraction']:.0%}), "
+        f"from cache: {resolved['cache']}, by the model: {resolved['model']}[/dim]"
+    )
+    if args.llm_batch_size > 1:
+        console.print(f"[dim]Batched requests: {analyzer.batch_requests}, "
+                      f"listings retried alone: {analyzer.batch_item_retries}[/dim]")
+    if metrics.is_enabled():
+        console.print("[dim]Time per step:[/dim]")
+        for line in metrics.format_summary(metrics.snapshot()):
+            console.print(f"[dim]  {line}[/dim]", highlight=False)
+    return summary
+
 
 async def main():
     console.print(Panel.fit("[bold cyan]LBC-Arbitrage: The Antigravity Tool[/bold cyan]", border_style="cyan"))
-    
+    args = parse_args()
+    try:
+        parse_pool = ParsePool(workers=args.parse_workers, parser=args.html_parser)
+    except ValueError as e:
+        console.print(f"[bold red]ERROR: {e}[/bold red]")
+        return
+    set_parse_pool(parse_pool)
+    if args.metrics_port or args.trace:
+        metrics.enable(trace_path=args.trace)
+        if args.metrics_port:
+            metrics.serve(args.metrics_port)
+            console.print(f"[dim]Metrics on http://127.0.0.1:{args.metrics_port}/metrics[/dim]")
+    try:
+        await run(args)
+    finally:
+        metrics.disable()
+        parse_pool.close()
+
+
+async def run(args):
+    if args.batch or args.replay or args.search is not None:
+        await run_batch(args)
+        return
+
     # Get URL from args or input
-    if len(sys.argv) > 1:
-        target_url = sys.argv[1]
+    if args.url:
+        target_url = args.url
     else:
         target_url = console.input("[bold yellow]>> Enter Leboncoin URL: [/bold yellow]")
 
@@ -71,8 +288,8 @@ async def main():
         rprint("[bold red]ERROR: No URL provided. Exiting.[/bold red]")
         return
 
-    scraper = AntigravityScraper()
-    analyzer = AntigravityAnalyzer()
+    scraper = build_scraper(args)
+    analyzer = build_analyzer(args)
     
     # 1. Scrape
     with console.status("[bold green]Scraping Leboncoin...[/bold green]", spinner="dots"):
@@ -81,7 +298,7 @@ async def main():
     if data:
         # 2. Analyze
         with console.status("[bold purple]Analyzing with GPT-4o...[/bold purple]", spinner="earth"):
-            analysis = analyzer.analyze_profitability(data)
+            analysis = await analyzer.analyze_profitability_async(data)
         
         # 3. Output Results
         listing_price = analysis.get('listing_price', 0)
@@ -128,6 +345,7 @@ async def main():
 
         # 4. Save and Open Dashboard
         save_result(data, analysis)
+        HISTORY.export_shards()
         
         dashboard_path = os.path.abspath(DASHBOARD_FILE)
         rprint(f"\n[bold blue]>> Opening dashboard: {dashboard_path}[/bold blue]")
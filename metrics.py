@@ -0,0 +1,314 @@
+"""
+metrics.py
+Timing spans and counters for the scrape / analyze / cache steps, exported as
+Prometheus text (a local /metrics endpoint) or a JSON Lines trace file.
+
+Recording is off until enable() is called: span() then hands back a shared
+no-op context manager and incr() returns at once, so instrumented code pays
+a single flag check per call.
+
+    with metrics.span("page.goto"):
+        await page.goto(url)
+
+    @metrics.timed("parse.soup")
+    def parse_listing_soup(html): ...
+
+    metrics.incr("analysis_cache.hits")
+
+    python metrics.py summary trace.jsonl
+"""
+
+import functools
+import inspect
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+METRIC_PREFIX = "lbc"
+# Upper bounds (seconds) of the span duration histogram buckets
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+_lock = threading.Lock()
+_counters: Dict[str, float] = {}
+_spans: Dict[str, Dict] = {}
+_trace = None
+# Event list of captured_spans() while it is active
+_captured = None
+
+_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("name", "_wall", "_started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._wall = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _record_span(self.name, time.perf_counter() - self._started, self._wall,
+                     exc_type.__name__ if exc_type is not None else None)
+        return False
+
+
+def _record_span(name: str, duration: float, wall: float, error: Optional[str] = None):
+    with _lock:
+        if _captured is not None:
+            _captured.append((name, duration, wall, error))
+            return
+        stats = _spans.get(name)
+        if stats is None:
+            stats = _spans[name] = {"count": 0, "sum": 0.0, "max": 0.0, "errors": 0,
+                                    "buckets": [0] * len(SPAN_BUCKETS)}
+        stats["count"] += 1
+        stats["sum"] += duration
+        stats["max"] = max(stats["max"], duration)
+        if error is not None:
+            stats["errors"] += 1
+        for i, bound in enumerate(SPAN_BUCKETS):
+            if duration <= bound:
+                stats["buckets"][i] += 1
+                break
+        if _trace is not None:
+            event = {"ts": round(wall, 6), "span": name, "duration_s": round(duration, 6)}
+            if error is not None:
+                event["error"] = error
+            _trace.write(json.dumps(event) + "\n")
+
+
+def span(name: str):
+    """Context manager timing one step (an exception inside still records it, as an error)."""
+    return _Span(name) if _enabled else _NOOP_SPAN
+
+
+def timed(name: str):
+    """Decorator: each call of the (sync or async) function is a span."""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with _Span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def captured_spans():
+    """
+    Records the spans of the block, enabled or not, as a list of (name,
+    duration_s, wall time, error) events instead of in this process's stats:
+    worker processes send them back to be replayed with record_spans().
+    """
+    global _enabled, _captured
+    events = []
+    with _lock:
+        previous = _enabled, _captured
+        _enabled, _captured = True, events
+    try:
+        yield events
+    finally:
+        with _lock:
+            _enabled, _captured = previous
+
+
+def record_spans(events):
+    """Adds spans timed elsewhere (captured_spans() events) to the stats and the trace."""
+    if not _enabled:
+        return
+    for name, duration, wall, error in events:
+        _record_span(name, duration, wall, error)
+
+
+def incr(name: str, value: float = 1):
+    """Adds `value` to a counter."""
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(trace_path: Optional[str] = None):
+    """Starts recording; spans are also appended to `trace_path` as JSON lines when given."""
+    global _enabled, _trace
+    with _lock:
+        if trace_path and _trace is None:
+            _trace = open(trace_path, "a", encoding="utf-8")
+        _enabled = True
+
+
+def disable():
+    """Stops recording and closes the trace, ending it with a line of counter totals."""
+    global _enabled, _trace
+    with _lock:
+        _enabled = False
+        if _trace is not None:
+            _trace.write(json.dumps({"ts": round(time.time(), 6), "counters": dict(_counters)}) + "\n")
+            _trace.close()
+            _trace = None
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _spans.clear()
+
+
+def snapshot() -> Dict:
+    """{"counters": {name: value}, "spans": {name: {count, total_s, mean_s, max_s, errors}}}."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "spans": {
+                name: {
+                    "count": s["count"],
+                    "total_s": round(s["sum"], 6),
+                    "mean_s": round(s["sum"] / s["count"], 6),
+                    "max_s": round(s["max"], 6),
+                    "errors": s["errors"],
+                }
+                for name, s in _spans.items()
+            },
+        }
+
+
+def _metric_name(name: str) -> str:
+    return f"{METRIC_PREFIX}_{_NAME_RE.sub('_', name)}"
+
+
+def prometheus_text() -> str:
+    """Counters and span histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for name in sorted(_counters):
+            metric = _metric_name(name) + "_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {_counters[name]:g}")
+
+        histogram = f"{METRIC_PREFIX}_span_duration_seconds"
+        errors = f"{METRIC_PREFIX}_span_errors_total"
+        if _spans:
+            lines.append(f"# TYPE {histogram} histogram")
+        for name in sorted(_spans):
+            s = _spans[name]
+            cumulative = 0
+            for bound, count in zip(SPAN_BUCKETS, s["buckets"]):
+                cumulative += count
+                lines.append(f'{histogram}_bucket{{span="{name}",le="{bound:g}"}} {cumulative}')
+            lines.append(f'{histogram}_bucket{{span="{name}",le="+Inf"}} {s["count"]}')
+            lines.append(f'{histogram}_sum{{span="{name}"}} {s["sum"]:.6f}')
+            lines.append(f'{histogram}_count{{span="{name}"}} {s["count"]}')
+        if _spans:
+            lines.append(f"# TYPE {errors} counter")
+        for name in sorted(_spans):
+            lines.append(f'{errors}{{span="{name}"}} {_spans[name]["errors"]}')
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Keep scrapes out of the console
+
+
+def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serves prometheus_text() on http://host:port/metrics from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
+
+
+def summarize_trace(path: str) -> Dict:
+    """Per-span {count, total_s, mean_s, max_s, errors} and the final counters of a trace file."""
+    spans, counters = {}, {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue # Torn last line of an interrupted run
+            if "counters" in event:
+                counters = event["counters"]
+                continue
+            s = spans.setdefault(event["span"], {"count": 0, "total_s": 0.0, "max_s": 0.0, "errors": 0})
+            s["count"] += 1
+            s["total_s"] += event["duration_s"]
+            s["max_s"] = max(s["max_s"], event["duration_s"])
+            s["errors"] += "error" in event
+    for s in spans.values():
+        s["mean_s"] = s["total_s"] / s["count"]
+    return {"counters": counters, "spans": spans}
+
+
+def format_summary(summary: Dict) -> list:
+    """One line per span (slowest total first), then the counters."""
+    lines = []
+    for name, s in sorted(summary["spans"].items(), key=lambda item: -item[1]["total_s"]):
+        errors = f", {s['errors']} errors" if s["errors"] else ""
+        lines.append(f"{name:<28} {s['count']:>6} x  total {s['total_s']:8.2f}s  "
+                     f"mean {s['mean_s'] * 1000:8.1f} ms  max {s['max_s'] * 1000:8.1f} ms{errors}")
+    for name, value in sorted(summary["counters"].items()):
+        lines.append(f"{name:<28} {value:g}")
+    return lines
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pipeline timing traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    summary_cmd = sub.add_parser("summary", help="Time spent per step in a JSONL trace (main.py --trace)")
+    summary_cmd.add_argument("trace")
+    args = parser.parse_args()
+
+    if args.command == "summary":
+        for line in format_summary(summarize_trace(args.trace)):
+            print(line)
@@ -0,0 +1,129 @@
+"""
+parse_pool.py
+Listing extraction in worker processes, off the asyncio event loop.
+
+Parsing a large ad page (above all the BeautifulSoup fallback) is CPU work:
+run on the event loop, it stalls every other page in flight. ParsePool hands
+the page bytes to listing_parser.extract_listing in a ProcessPoolExecutor, so
+the browser workers only navigate and the parses run in parallel on other cores.
+"""
+
+import asyncio
+import atexit
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Union
+
+import metrics
+from listing_parser import extract_listing, resolve_parser
+
+
+# Parse processes by default: leave a core for the event loop and the browser
+DEFAULT_PARSE_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+
+
+def _call_timed(fn, *args):
+    """fn(*args) in a worker process, with the spans it recorded (parse.listing_html, parse.soup, ...)."""
+    with metrics.captured_spans() as events:
+        result = fn(*args)
+    return result, events
+
+
+class ParsePool:
+    """
+    Runs extract_listing in `workers` processes (0: in a thread of this process,
+    for environments without multiprocessing). Processes start on first use.
+
+    - parser: DOM parser of the fallback ("selectolax", "lxml", "html.parser"),
+      default: the fastest installed (see listing_parser.resolve_parser)
+
+    While metrics are enabled, the spans timed inside the workers come back
+    with each result and are recorded here, as if parsed in this process.
+    """
+
+    def __init__(self, workers: int = DEFAULT_PARSE_WORKERS, parser: Optional[str] = None):
+        self.workers = workers
+        # Resolved here so a missing optional parser fails before the first page
+        self.parser = resolve_parser(parser)
+        self._executor = None
+        self._lock = threading.Lock()
+        self.parsed = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn, not fork: this process runs the browser driver's threads
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    async def run(self, fn, *args):
+        """fn(*args) in a worker (fn and args must be picklable)."""
+        if not self.workers:
+            return await asyncio.to_thread(fn, *args)
+        if metrics.is_enabled():
+            # Worker processes have their own (disabled) metrics: their spans are sent back
+            result, events = await self._submit(_call_timed, fn, *args)
+            metrics.record_spans(events)
+            return result
+        return await self._submit(fn, *args)
+
+    async def _submit(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): start a fresh pool and try once more
+            self._reset()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+
+    async def parse(self, html: Union[bytes, str, None] = None, next_data: Optional[str] = None) -> Optional[Dict]:
+        """extract_listing(html, next_data) in a worker; str pages are sent as UTF-8 bytes."""
+        if isinstance(html, str):
+            html = html.encode("utf-8")
+        listing = await self.run(extract_listing, html, next_data, self.parser)
+        self.parsed += 1
+        return listing
+
+    def _reset(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_parse_pool() -> ParsePool:
+    """The shared ParsePool (created on first use, shut down at exit)."""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ParsePool()
+            atexit.register(_default_pool.close)
+        return _default_pool
+
+
+def set_parse_pool(pool: ParsePool) -> ParsePool:
+    """Replaces the shared ParsePool; returns the previous one (not closed)."""
+    global _default_pool
+    with _default_lock:
+        previous, _default_pool = _default_pool, pool
+    return previous
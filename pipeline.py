@@ -0,0 +1,233 @@
+"""
+pipeline.py
+Staged asyncio pipeline for batch runs: scrape -> analyze -> persist.
+
+Each stage has its own worker count and the stages are connected by bounded
+queues, so a slow OpenAI call holds back the scraper with backpressure instead
+of blocking the event loop, and memory stays bounded on long URL streams.
+"""
+
+import asyncio
+import math
+import time
+
+
+_STOP = object()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0.0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class StageStats:
+    """Timings and outcome counters for one pipeline stage."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.durations = []
+        self.failures = 0
+
+    def record(self, seconds):
+        self.durations.append(seconds)
+
+    def summary(self):
+        return {
+            "workers": self.workers,
+            "processed": len(self.durations),
+            "failed": self.failures,
+            "p50_s": round(percentile(self.durations, 50), 3),
+            "p95_s": round(percentile(self.durations, 95), 3),
+        }
+
+
+class BatchPipeline:
+    """
+    Streams listing URLs through scraping, analysis and persistence stages.
+
+    - scraper: an AntigravityScraper (uses get_many_listings for the scrape stage)
+    - analyzer: an AntigravityAnalyzer (analyze_profitability_async runs on the event loop;
+      analyzers with only the blocking analyze_profitability run in worker threads)
+    - persist: callable(data, analysis) storing one result (e.g. main.save_result)
+
+    With analyze_batch_size > 1, each analyze worker takes up to that many queued
+    listings at once and sends them through analyzer.analyze_batch_async.
+
+    With a `seen` index (seen_listings.SeenListings), ads scraped recently or
+    already queued are not scraped, and scraped ads whose content is unchanged
+    since their last analysis are not analyzed again.
+    """
+
+    def __init__(self, scraper, analyzer, persist, scrape_workers=2, analyze_workers=2,
+                 persist_workers=1, queue_size=8, analyze_batch_size=1, seen=None):
+        self.scraper = scraper
+        self.analyzer = analyzer
+        self.persist = persist
+        self.seen = seen
+        self.queue_size = queue_size
+        self.analyze_batch_size = analyze_batch_size
+        self.stages = {
+            "scrape": StageStats("scrape", scrape_workers),
+            "analyze": StageStats("analyze", analyze_workers),
+            "persist": StageStats("persist", persist_workers),
+        }
+        self.errors = []
+        self.completed = 0
+        self.elapsed = 0.0
+
+    async def run(self, urls):
+        """Runs the whole batch and returns the throughput summary."""
+        started = time.perf_counter()
+        analyze_queue = asyncio.Queue(maxsize=self.queue_size)
+        persist_queue = asyncio.Queue(maxsize=self.queue_size)
+
+        analyze_tasks = [
+            asyncio.create_task(self._analyze_worker(analyze_queue, persist_queue))
+            for _ in range(self.stages["analyze"].workers)
+        ]
+        persist_tasks = [
+            asyncio.create_task(self._persist_worker(persist_queue))
+            for _ in range(self.stages["persist"].workers)
+        ]
+
+        try:
+            await self._scrape_stage(urls, analyze_queue)
+            for _ in analyze_tasks:
+                await analyze_queue.put(_STOP)
+            await asyncio.gather(*analyze_tasks)
+            for _ in persist_tasks:
+                await persist_queue.put(_STOP)
+            await asyncio.gather(*persist_tasks)
+        finally:
+            for task in analyze_tasks + persist_tasks:
+                task.cancel()
+            await asyncio.gather(*analyze_tasks, *persist_tasks, return_exceptions=True)
+            if self.seen is not None:
+                await asyncio.to_thread(self.seen.flush)
+            self.elapsed = time.perf_counter() - started
+
+        return self.summary()
+
+    async def _unseen(self, urls):
+        """The URLs the seen index wants scraped."""
+        if hasattr(urls, "__aiter__"):
+            async for url in urls:
+                if self.seen.should_scrape(url):
+                    yield url
+        else:
+            for url in urls:
+                if self.seen.should_scrape(url):
+                    yield url
+
+    async def _scrape_stage(self, urls, analyze_queue):
+        stats = self.stages["scrape"]
+        if self.seen is not None and urls is not None:
+            urls = self._unseen(urls)
+        async for record in self.scraper.get_many_listings(urls, concurrency=stats.workers):
+            stats.record(record.get("elapsed_s", 0.0))
+            if "error" in record:
+                stats.failures += 1
+                self.errors.append(("scrape", record["url"], record["error"]))
+                continue
+            if self.seen is not None and not self.seen.has_changed(record):
+                await self._flush_seen_if_due()
+                continue
+            await analyze_queue.put(record)
+
+    async def _flush_seen_if_due(self):
+        # The index rewrite is file I/O over every entry: keep it off the event loop
+        if self.seen.save_due:
+            await asyncio.to_thread(self.seen.flush)
+
+    async def _analyze_worker(self, analyze_queue, persist_queue):
+        if self.analyze_batch_size > 1 and hasattr(self.analyzer, "analyze_batch_async"):
+            await self._analyze_batch_worker(analyze_queue, persist_queue)
+            return
+        stats = self.stages["analyze"]
+        while True:
+            data = await analyze_queue.get()
+            if data is _STOP:
+                return
+            started = time.perf_counter()
+            try:
+                analysis = await self._analyze(data)
+            except Exception as e:
+                stats.failures += 1
+                self.errors.append(("analyze", data.get("url"), str(e)))
+                continue
+            finally:
+                stats.record(time.perf_counter() - started)
+            await persist_queue.put((data, analysis))
+
+    async def _analyze_batch_worker(self, analyze_queue, persist_queue):
+        stats = self.stages["analyze"]
+        stopping = False
+        while not stopping:
+            batch = []
+            item = await analyze_queue.get()
+            # Wait for one listing, then take whatever else is already queued
+            while item is not _STOP:
+                batch.append(item)
+                if len(batch) >= self.analyze_batch_size or analyze_queue.empty():
+                    break
+                item = analyze_queue.get_nowait()
+            stopping = item is _STOP
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            try:
+                analyses = await self.analyzer.analyze_batch_async(batch, batch_size=self.analyze_batch_size)
+            except Exception as e:
+                analyses = [e] * len(batch)
+            elapsed = time.perf_counter() - started
+            for data, analysis in zip(batch, analyses):
+                stats.record(elapsed)
+                if isinstance(analysis, Exception):
+                    stats.failures += 1
+                    self.errors.append(("analyze", data.get("url"), str(analysis)))
+                    continue
+                await persist_queue.put((data, analysis))
+
+    async def _analyze(self, data):
+        analyze_async = getattr(self.analyzer, "analyze_profitability_async", None)
+        if analyze_async is not None:
+            return await analyze_async(data)
+        # analyze_profitability blocks on the OpenAI round-trip: keep it off the event loop
+        return await asyncio.to_thread(self.analyzer.analyze_profitability, data)
+
+    async def _persist_worker(self, persist_queue):
+        stats = self.stages["persist"]
+        while True:
+            item = await persist_queue.get()
+            if item is _STOP:
+                return
+            data, analysis = item
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.persist, data, analysis)
+                self.completed += 1
+                if self.seen is not None:
+                    self.seen.mark_analyzed(data)
+                    await self._flush_seen_if_due()
+            except Exception as e:
+                stats.failures += 1
+                self.errors.append(("persist", data.get("url"), str(e)))
+            finally:
+                stats.record(time.perf_counter() - started)
+
+    def summary(self):
+        minutes = self.elapsed / 60
+        return {
+            "completed": self.completed,
+            "failed": sum(s.failures for s in self.stages.values()),
+            "elapsed_s": round(self.elapsed, 2),
+            "listings_per_min": round(self.completed / minutes, 2) if minutes > 0 else 0.0,
+            "stages": {name: stats.summary() for name, stats in self.stages.items()},
+            "seen": self.seen.stats() if self.seen is not None else None,
+        }
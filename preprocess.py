@@ -0,0 +1,165 @@
+"""
+preprocess.py
+Listing text compaction between the scraper and the analyzer prompt.
+
+The scraped text is often the whole page (navigation, cookie banner, footer)
+when the description block is missing. Before it goes into the prompt it is
+split into lines/sentences, stripped of boilerplate and duplicates, reduced to
+the spans that mention hardware or the listing's condition, and cut to a token
+budget.
+"""
+
+import math
+import re
+from typing import Dict, List, Tuple
+
+from component_rules import KeywordAutomaton
+from price_fetcher import get_rule_engine
+
+
+DEFAULT_TOKEN_BUDGET = 800
+# Rough size of an English/French GPT token, in characters
+CHARS_PER_TOKEN = 4
+# Lines longer than this are split into sentences before filtering
+MAX_SEGMENT_CHARS = 240
+# Neighbouring segments kept around each relevant one, for context
+CONTEXT_SEGMENTS = 1
+
+# French hardware vocabulary the pricing rules do not cover
+EXTRA_HARDWARE_KEYWORDS = [
+    "carte graphique", "processeur", "carte mère", "carte mere", "mémoire", "barrette",
+    "alimentation", "boitier", "boîtier", "ventirad", "watercooling", "refroidissement",
+    "barrettes", "disque", "disques", "stockage", "ecran", "écran", "clavier", "souris", "tour", "pc gamer",
+    "geforce", "nvidia", "amd", "intel", "hdd", "m.2", "sata",
+]
+# Condition words the verdict depends on (see the TRASH rule in the prompt)
+CONDITION_KEYWORDS = [
+    "hs", "h.s", "panne", "broken", "pour pièces", "pour pieces", "ne fonctionne", "ne marche",
+    "défectueux", "défectueuse", "defectueux", "defectueuse", "ne démarre", "ne demarre",
+    "écran noir", "artefact", "artefacts",
+    "garantie", "facture", "neuf", "état",
+]
+
+BOILERPLATE_RE = re.compile(
+    r"^(?:"
+    r"se connecter|connexion|s'inscrire|déposer une annonce|mes annonces|mes recherches|favoris|"
+    r"messages|rechercher|menu|accueil|retour|partager|signaler l'annonce|signaler|voir plus|"
+    r"voir moins|afficher le numéro|envoyer un message|contacter|acheter|réserver|suivre|"
+    r"continuer sans accepter|tout accepter|tout refuser|accepter(?: & fermer)?|paramétrer.*|"
+    r"gérer (?:mes|les) (?:choix|cookies).*|.*\bcookies?\b.*|©.*|conditions générales.*|vie privée.*|"
+    r"plan du site.*|aide|publicité|annonces similaires|voir l'annonce|voir toutes les annonces.*|"
+    r"leboncoin.*|nos applications.*|télécharger l'application.*"
+    r")$",
+    re.IGNORECASE,
+)
+
+# Capacities and clocks ("16 Go", "1To", "750W", "3.6GHz")
+_SPEC_RE = re.compile(r"\b\d+(?:[.,]\d+)?\s?(?:go|to|gb|tb|mo|mb|w|mhz|ghz)\b", re.IGNORECASE)
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?;•])\s+|\s+[-•·|]\s+")
+_HAS_WORD_RE = re.compile(r"\w")
+
+# (rule engine, hardware automaton, condition automaton), rebuilt when the rules are reloaded
+_vocabulary = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate GPT token count of a text (about 4 characters per token)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+
+def _get_vocabulary() -> Tuple[KeywordAutomaton, KeywordAutomaton]:
+    """
+    The (hardware, condition) keyword automatons; hardware keywords come from the
+    pricing rules. They are cached in a triple together with the rule engine they
+    were built from, and rebuilt when the rules are reloaded.
+    """
+    global _vocabulary
+    engine = get_rule_engine()
+    if _vocabulary is None or _vocabulary[0] is not engine:
+        hardware = KeywordAutomaton(list(engine.keyword_ids) + [k.lower() for k in EXTRA_HARDWARE_KEYWORDS])
+        condition = KeywordAutomaton([k.lower() for k in CONDITION_KEYWORDS])
+        _vocabulary = (engine, hardware, condition)
+    return _vocabulary[1], _vocabulary[2]
+
+
+def _mentions(automaton: KeywordAutomaton, text: str) -> int:
+    """Number of whole-word keyword occurrences ('ram' must not match 'programme', nor 'hs' 'hsbc')."""
+    count = 0
+    for start, end, _keyword_id in automaton.iter_matches(text):
+        if (start == 0 or not text[start - 1].isalnum()) and (end == len(text) or not text[end].isalnum()):
+            count += 1
+    return count
+
+
+def _segments(raw_text: str) -> List[str]:
+    """Non-empty, whitespace-collapsed lines; overly long lines are split into sentences."""
+    segments = []
+    for line in raw_text.splitlines():
+        line = " ".join(line.split())
+        if not line:
+            continue
+        if len(line) <= MAX_SEGMENT_CHARS:
+            segments.append(line)
+            continue
+        segments.extend(part for part in _SENTENCE_SPLIT_RE.split(line) if part.strip())
+    return segments
+
+
+def compact_listing_text(raw_text: str, token_budget: int = DEFAULT_TOKEN_BUDGET) -> Tuple[str, Dict]:
+    """
+    Returns (compacted text, stats) for the prompt.
+
+    stats: tokens_before, tokens_after, tokens_saved, segments_kept, segments_total.
+    """
+    raw_text = raw_text or ""
+    tokens_before = estimate_tokens(raw_text)
+    hardware, condition = _get_vocabulary()
+
+    # 1. Boilerplate and duplicate lines
+    segments = []
+    seen = set()
+    for segment in _segments(raw_text):
+        key = segment.lower()
+        if key in seen or BOILERPLATE_RE.match(segment) or not _HAS_WORD_RE.search(segment):
+            continue
+        seen.add(key)
+        segments.append(segment)
+
+    # 2. Relevance: segments with the most hardware/condition mentions first, then their neighbours
+    priorities = {}
+    for index, segment in enumerate(segments):
+        lowered = segment.lower()
+        hits = _mentions(condition, lowered) + _mentions(hardware, lowered) + len(_SPEC_RE.findall(lowered))
+        if hits:
+            priorities[index] = (0, -hits)
+    for index in list(priorities):
+        for neighbour in range(index - CONTEXT_SEGMENTS, index + CONTEXT_SEGMENTS + 1):
+            if 0 <= neighbour < len(segments):
+                priorities.setdefault(neighbour, (1, 0))
+    if not priorities:
+        # Nothing recognisable: keep everything and let the budget decide
+        priorities = {index: (1, 0) for index in range(len(segments))}
+
+    # 3. Token budget, filled by priority then position; output keeps the original order
+    kept = []
+    used = 0
+    for index in sorted(priorities, key=lambda i: (priorities[i], i)):
+        cost = estimate_tokens(segments[index]) + 1
+        if used + cost > token_budget:
+            continue
+        kept.append(index)
+        used += cost
+    if not kept and segments:
+        first = min(priorities, key=lambda i: (priorities[i], i))
+        kept = [first]
+        segments[first] = segments[first][:token_budget * CHARS_PER_TOKEN]
+
+    text = "\n".join(segments[index] for index in sorted(kept))
+    tokens_after = estimate_tokens(text)
+    return text, {
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(0, tokens_before - tokens_after),
+        "segments_kept": len(kept),
+        "segments_total": len(segments),
+    }
@@ -1,61 +1,669 @@
 """
 price_fetcher.py
 Fetches market prices for PC components from pcprice.watch and caches results
-in components_cache.csv to avoid redundant lookups.
+in components_cache.csv (or a SQLite file, see set_cache_backend) to avoid
+redundant lookups.
 """
 
+import atexit
 import csv
 import os
 import re
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
 from datetime import datetime, timedelta
-from typing import Optional, Dict
+from typing import Optional, Dict, Iterator, List
+
+import metrics
+from component_rules import DEFAULT_RULES_FILE, RuleEngine, load_rule_engine
 
 
 CACHE_FILE = "components_cache.csv"
+CACHE_DB_FILE = "components_cache.db"  # Used by the SQLite backend (PRICE_CACHE_BACKEND=sqlite)
 USED_PART_DISCOUNT = 0.35  # 35% discount for used parts
 CACHE_EXPIRY_DAYS = 30
+RULES_FILE = DEFAULT_RULES_FILE  # Price/category heuristics, compiled once by get_rule_engine()
+WRITE_BEHIND_MAX_PENDING = 64  # Flush the write-behind buffer once it holds this many entries
+CACHE_COMPACT_MIN_SUPERSEDED = 100  # Compact once superseded rows exceed max(this, live rows)
+
+CACHE_FIELDS = [
+    "component_name",
+    "category",
+    "estimated_new_price_eur",
+    "estimated_used_price_eur",
+    "last_updated",
+    "source",
+]
+
+
+_rule_engine: Optional[RuleEngine] = None
+
+
+# Units folded onto their number ("1 To" -> "1tb"); French Go/To/Mo are common on Leboncoin
+_UNIT_ALIASES = {"tb": "tb", "to": "tb", "gb": "gb", "go": "gb", "mb": "mb", "mo": "mb",
+                 "w": "w", "ghz": "ghz", "mhz": "mhz"}
+_UNIT_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(tb|to|gb|go|mb|mo|w|ghz|mhz)\b")
+_MULTIPLIER_RE = re.compile(r"\b(\d+)\s*x\s*(?=\d)")
+_80PLUS_RE = re.compile(r"80\s*(?:\+|plus\b)")
+# Suffixes that are part of a model number ("3060 Ti" is not a "3060")
+_MODEL_SUFFIXES = {"ti", "xt", "xtx", "super", "x3d"}
+
+# Near matches must share the exact same model tokens and overlap this much otherwise
+NEAR_MATCH_MIN_SIMILARITY = 0.75
+
+
+def canonical_tokens(component_name: str) -> List[str]:
+    """
+    Canonical tokens of a component name: lowercase, units folded onto numbers
+    ("850 W" -> "850w", "1 To" -> "1tb"), "80 Plus"/"80+" -> "80plus",
+    "2 x 16GB" -> "2x16gb" and model suffixes glued to the number ("3060 Ti" -> "3060ti").
+    """
+    text = component_name.lower()
+    text = _80PLUS_RE.sub(" 80plus ", text)
+    text = re.sub(r"[^\w\s.\-]", " ", text)
+    text = _MULTIPLIER_RE.sub(r"\1x", text)
+    text = _UNIT_RE.sub(lambda m: m.group(1).replace(",", ".") + _UNIT_ALIASES[m.group(2)], text)
+    tokens: List[str] = []
+    for token in text.split():
+        token = token.strip(".-")
+        if not token:
+            continue
+        if token in _MODEL_SUFFIXES and tokens and tokens[-1][-1].isdigit():
+            tokens[-1] += token
+        else:
+            tokens.append(token)
+    return tokens
+
+
+def _normalize_name(component_name: str) -> str:
+    """Lookup key for a component name: its canonical tokens as a sorted set, so word order doesn't matter."""
+    return " ".join(sorted(set(canonical_tokens(component_name))))
+
+
+def _model_key(normalized_name: str) -> str:
+    """The tokens carrying digits (model numbers, capacities, wattages) of a normalized name."""
+    return " ".join(token for token in normalized_name.split() if any(c.isdigit() for c in token))
+
+
+def _name_similarity(key_a: str, key_b: str) -> float:
+    """
+    Similarity of two normalized names with the same model key: 1.0 when one is a
+    subset of the other ("seasonic 850w" vs "seasonic 850w psu"), else Jaccard.
+    """
+    a, b = set(key_a.split()), set(key_b.split())
+    if a <= b or b <= a:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _best_near_match(key: str, candidates: Dict[str, Dict]) -> Optional[Dict]:
+    best, best_score = None, NEAR_MATCH_MIN_SIMILARITY
+    for candidate_key, row in candidates.items():
+        score = _name_similarity(key, candidate_key)
+        if score >= best_score:
+            best, best_score = row, score
+    return best
+
+
+class CsvComponentCache:
+    """
+    Process-wide in-memory index of the cache CSV.
+
+    The file is parsed once into a dict keyed by normalized component name and
+    only re-read when its mtime/size changes (e.g. edited by hand or by another
+    process), so lookups are O(1) instead of a scan of the whole file.
+
+    The CSV is treated as an append-only journal: new and updated entries are
+    appended (the last row for a name wins) and the file is compacted with an
+    atomic temp file + rename once superseded rows pile up. In write-behind
+    mode appends are buffered in memory and flushed in one batch.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        # None follows the module-level CACHE_FILE
+        self._path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._index: Dict[str, Dict] = {}
+        # model key -> {normalized name -> row}, for near-match lookups
+        self._by_model: Dict[str, Dict[str, Dict]] = {}
+        self._file_rows = 0
+        self._pending: Dict[str, Dict] = {}
+        self._write_behind_depth = 0
+
+    @property
+    def path(self) -> str:
+        return self._path or CACHE_FILE
+
+    def ensure(self):
+        """Create the cache CSV file if it doesn't exist."""
+        if not os.path.exists(self.path):
+            with open(self.path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=CACHE_FIELDS)
+                writer.writeheader()
+
+    @staticmethod
+    def _file_signature(path: str):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+    def _refresh(self):
+        signature = self._file_signature(self.path)
+        if signature is not None and signature == self._signature:
+            return
+        self._index = {}
+        self._file_rows = 0
+        if signature is not None:
+            try:
+                with metrics.span("price_cache.csv_read"), open(self.path, "r", newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        # A torn last line from an interrupted append has missing fields
+                        if not row.get("component_name") or row.get("source") is None:
+                            continue
+                        self._file_rows += 1
+                        # Last occurrence wins: later rows are updates
+                        self._index[_normalize_name(row["component_name"])] = row
+            except Exception:
+                self._index = {}
+                self._file_rows = 0
+        # Buffered writes that haven't reached the file yet still apply
+        for key, row in self._pending.items():
+            self._index[key] = row
+        self._by_model = {}
+        for key, row in self._index.items():
+            self._index_model(key, row)
+        self._signature = signature
+
+    def _index_model(self, key: str, row: Dict):
+        model_key = _model_key(key)
+        if model_key:
+            self._by_model.setdefault(model_key, {})[key] = row
+
+    def get(self, component_name: str) -> Optional[Dict]:
+        with self._lock:
+            self._refresh()
+            row = self._index.get(_normalize_name(component_name))
+            return dict(row) if row is not None else None
+
+    def find_similar(self, component_name: str) -> Optional[Dict]:
+        """Closest entry with the same model tokens (see _name_similarity), or None."""
+        key = _normalize_name(component_name)
+        model_key = _model_key(key)
+        if not model_key:
+            return None
+        with self._lock:
+            self._refresh()
+            row = _best_near_match(key, self._by_model.get(model_key, {}))
+            return dict(row) if row is not None else None
+
+    def rows(self) -> List[Dict]:
+        with self._lock:
+            self._refresh()
+            return [dict(row) for row in self._index.values()]
+
+    def iter_pages(self, page_size: int) -> Iterator[List[Dict]]:
+        rows = self.rows()
+        for start in range(0, len(rows), page_size):
+            yield rows[start:start + page_size]
+
+    def rows_updated_before(self, cutoff: str) -> List[Dict]:
+        return [row for row in self.rows() if (row.get("last_updated") or "") < cutoff]
+
+    def upsert_many(self, rows: List[Dict]):
+        with self.write_behind():
+            for row in rows:
+                self.upsert(row)
+
+    def upsert(self, row: Dict) -> Dict:
+        """Insert or update an entry; returns the stored row (keeping the original name on update)."""
+        with self._lock:
+            self._refresh()
+            key = _normalize_name(row["component_name"])
+            existing = self._index.get(key)
+            stored = {field: str(row[field]) for field in CACHE_FIELDS}
+            if existing is not None:
+                stored["component_name"] = existing["component_name"]
+            self._index[key] = stored
+            self._index_model(key, stored)
+            if self._write_behind_depth:
+                self._pending[key] = stored
+                if len(self._pending) >= WRITE_BEHIND_MAX_PENDING:
+                    self.flush()
+            else:
+                self._append([stored])
+            return dict(stored)
+
+    def flush(self):
+        """Append all buffered entries to the journal in a single write."""
+        with self._lock:
+            if not self._pending:
+                return
+            pending, self._pending = self._pending, {}
+            try:
+                self._append(list(pending.values()))
+            except Exception:
+                self._pending = {**pending, **self._pending}
+                raise
+
+    @metrics.timed("price_cache.csv_append")
+    def _append(self, rows: List[Dict]):
+        self.ensure()
+        with open(self.path, "r+b") as f:
+            # Never glue new rows onto a torn line left by an interrupted append
+            f.seek(0, os.SEEK_END)
+            needs_newline = False
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) not in (b"\n", b"\r")
+        with open(self.path, "a", newline="", encoding="utf-8") as f:
+            if needs_newline:
+                f.write("\r\n")
+            csv.DictWriter(f, fieldnames=CACHE_FIELDS).writerows(rows)
+        self._file_rows += len(rows)
+        self._signature = self._file_signature(self.path)
+        if self._file_rows - len(self._index) > max(CACHE_COMPACT_MIN_SUPERSEDED, len(self._index)):
+            self.compact()
+
+    @metrics.timed("price_cache.csv_compact")
+    def compact(self):
+        """Rewrite the journal with one row per component, atomically (temp file + rename)."""
+        with self._lock:
+            self._refresh()
+            directory = os.path.dirname(os.path.abspath(self.path))
+            fd, tmp_path = tempfile.mkstemp(prefix=".components_cache.", suffix=".tmp", dir=directory)
+            try:
+                with os.fdopen(fd, "w", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=CACHE_FIELDS)
+                    writer.writeheader()
+                    writer.writerows(self._index.values())
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            # Buffered entries are now on disk too
+            self._pending = {}
+            self._file_rows = len(self._index)
+            self._signature = self._file_signature(self.path)
+
+    @contextmanager
+    def write_behind(self):
+        with self._lock:
+            self._write_behind_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._write_behind_depth -= 1
+                if not self._write_behind_depth:
+                    self.flush()
+
+
+class SqliteComponentCache:
+    """
+    Component price cache stored in a SQLite file (WAL mode).
+
+    Safe for several workers/processes writing at once: WAL lets readers run
+    alongside a writer, and every upsert is a single atomic statement. The
+    normalized name is the primary key (indexed lookups) and last_updated has
+    its own index for expiry scans.
+    """
+
+    def __init__(self, path: str = "components_cache.db"):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Dict] = {}
+        self._write_behind_depth = 0
+        self._schema_ready = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections can't be shared between threads: one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                if not self._schema_ready:
+                    self._create_schema(conn)
+                    self._schema_ready = True
+        return conn
+
+    # Bumped when the way normalized_name/model_key are derived changes
+    SCHEMA_VERSION = 1
+
+    @classmethod
+    def _create_schema(cls, conn: sqlite3.Connection):
+        with conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS components (
+                    normalized_name TEXT PRIMARY KEY,
+                    component_name TEXT NOT NULL,
+                    category TEXT,
+                    estimated_new_price_eur REAL,
+                    estimated_used_price_eur REAL,
+                    last_updated TEXT,
+                    source TEXT,
+                    model_key TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_last_updated ON components(last_updated)")
+            if conn.execute("PRAGMA user_version").fetchone()[0] < cls.SCHEMA_VERSION:
+                columns = {row[1] for row in conn.execute("PRAGMA table_info(components)")}
+                if "model_key" not in columns:
+                    conn.execute("ALTER TABLE components ADD COLUMN model_key TEXT")
+                # Re-key existing rows with the canonical names; rows that now collide keep the newest
+                records = conn.execute("SELECT * FROM components ORDER BY last_updated").fetchall()
+                conn.execute("DELETE FROM components")
+                conn.executemany(cls._UPSERT_SQL, [cls._upsert_params(cls._to_row(r)) for r in records])
+                conn.execute(f"PRAGMA user_version = {cls.SCHEMA_VERSION}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_components_model_key ON components(model_key)")
+
+    _UPSERT_SQL = """
+        INSERT INTO components (normalized_name, component_name, category, estimated_new_price_eur,
+                                estimated_used_price_eur, last_updated, source, model_key)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(normalized_name) DO UPDATE SET
+            category = excluded.category,
+            estimated_new_price_eur = excluded.estimated_new_price_eur,
+            estimated_used_price_eur = excluded.estimated_used_price_eur,
+            last_updated = excluded.last_updated,
+            source = excluded.source
+    """
+
+    @staticmethod
+    def _upsert_params(row: Dict) -> tuple:
+        key = _normalize_name(str(row["component_name"]))
+        return (
+            key,
+            str(row["component_name"]),
+            row["category"],
+            float(row["estimated_new_price_eur"]),
+            float(row["estimated_used_price_eur"]),
+            row["last_updated"],
+            row["source"],
+            _model_key(key),
+        )
+
+    @staticmethod
+    def _to_row(record) -> Dict:
+        # Same shape as csv.DictReader rows so callers don't care about the backend
+        return {field: "" if record[field] is None else str(record[field]) for field in CACHE_FIELDS}
+
+    def ensure(self):
+        self._connection()
+
+    def get(self, component_name: str) -> Optional[Dict]:
+        key = _normalize_name(component_name)
+        with self._lock:
+            if key in self._pending:
+                return dict(self._pending[key])
+        record = self._connection().execute(
+            "SELECT * FROM components WHERE normalized_name = ?", (key,)
+        ).fetchone()
+        return self._to_row(record) if record is not None else None
+
+    def find_similar(self, component_name: str) -> Optional[Dict]:
+        """Closest entry with the same model tokens (see _name_similarity), or None."""
+        key = _normalize_name(component_name)
+        model_key = _model_key(key)
+        if not model_key:
+            return None
+        self.flush()
+        records = self._connection().execute(
+            "SELECT * FROM components WHERE model_key = ?", (model_key,)
+        ).fetchall()
+        best = _best_near_match(key, {record["normalized_name"]: record for record in records})
+        return self._to_row(best) if best is not None else None
+
+    def rows(self) -> List[Dict]:
+        return [row for page in self.iter_pages(1000) for row in page]
+
+    def iter_pages(self, page_size: int) -> Iterator[List[Dict]]:
+        self.flush()
+        conn = self._connection()
+        last_rowid = 0
+        while True:
+            # Keyset pagination: each page is an index range scan, not an OFFSET skip
+            records = conn.execute(
+                "SELECT rowid, * FROM components WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, page_size),
+            ).fetchall()
+            if not records:
+                return
+            last_rowid = records[-1]["rowid"]
+            yield [self._to_row(record) for record in records]
+
+    def rows_updated_before(self, cutoff: str) -> List[Dict]:
+        self.flush()
+        records = self._connection().execute(
+            "SELECT * FROM components WHERE last_updated < ? ORDER BY last_updated", (cutoff,)
+        ).fetchall()
+        return [self._to_row(record) for record in records]
+
+    def upsert(self, row: Dict) -> Dict:
+        stored = {field: str(row[field]) for field in CACHE_FIELDS}
+        with self._lock:
+            if self._write_behind_depth:
+                key = _normalize_name(stored["component_name"])
+                existing = self._pending.get(key)
+                if existing is not None:
+                    stored["component_name"] = existing["component_name"]
+                self._pending[key] = stored
+                if len(self._pending) >= WRITE_BEHIND_MAX_PENDING:
+                    self.flush()
+                return dict(stored)
+        self.upsert_many([stored])
+        return self.get(stored["component_name"]) or stored
+
+    def upsert_many(self, rows: List[Dict]):
+        """Insert or update many entries in one transaction."""
+        if not rows:
+            return
+        conn = self._connection()
+        with conn:
+            conn.executemany(self._UPSERT_SQL, [self._upsert_params(row) for row in rows])
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        try:
+            self.upsert_many(list(pending.values()))
+        except Exception:
+            with self._lock:
+                self._pending = {**pending, **self._pending}
+            raise
+
+    def compact(self):
+        self.flush()
+        self._connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    @contextmanager
+    def write_behind(self):
+        with self._lock:
+            self._write_behind_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._write_behind_depth -= 1
+                done = not self._write_behind_depth
+            if done:
+                self.flush()
+
+    def close(self):
+        self.flush()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def _default_backend():
+    """CSV unless PRICE_CACHE_BACKEND=sqlite (file from PRICE_CACHE_DB)."""
+    if os.getenv("PRICE_CACHE_BACKEND", "csv").lower() == "sqlite":
+        return SqliteComponentCache(os.getenv("PRICE_CACHE_DB", CACHE_DB_FILE))
+    return CsvComponentCache()
+
+
+_cache_backend = _default_backend()
+
+
+def get_cache_backend():
+    """The storage backend currently used by the price cache."""
+    return _cache_backend
+
+
+def set_cache_backend(backend):
+    """
+    Switch the price cache storage (a CsvComponentCache or SqliteComponentCache).
+    Buffered writes of the previous backend are flushed first. Returns the previous backend.
+    """
+    global _cache_backend
+    previous = _cache_backend
+    previous.flush()
+    _cache_backend = backend
+    return previous
+
+
+def write_behind():
+    """
+    Context manager buffering save_cache_entry writes and flushing them in one batch on exit.
+
+        with write_behind():
+            for part in parts:
+                estimate_component_price(part)
+    """
+    return _cache_backend.write_behind()
+
+
+def flush_cache():
+    """Write any buffered cache entries to disk."""
+    _cache_backend.flush()
+
+
+def compact_cache():
+    """Drop superseded rows from the cache storage."""
+    _cache_backend.ensure()
+    _cache_backend.compact()
+
+
+def migrate_csv_to_sqlite(csv_path: Optional[str] = None, db_path: str = None) -> int:
+    """
+    One-shot import of a cache CSV (default: CACHE_FILE) into a SQLite cache file.
+    Existing SQLite entries with the same name are updated. Returns the number of rows imported.
+    """
+    rows = CsvComponentCache(csv_path).rows()
+    target = SqliteComponentCache(db_path or CACHE_DB_FILE)
+    try:
+        target.upsert_many(rows)
+    finally:
+        target.close()
+    return len(rows)
+
+
+def measure_name_hit_rate(csv_path: Optional[str] = None) -> Dict:
+    """
+    Replay the names of a cache CSV in file order, looking each one up among the names
+    before it, with the former exact lowercase match and with canonical + near matching.
+    Each miss stands for a duplicate row the cache would have created.
+    """
+    with open(csv_path or CACHE_FILE, "r", newline="", encoding="utf-8") as f:
+        names = [row["component_name"] for row in csv.DictReader(f) if row.get("component_name")]
+
+    seen_lower = set()
+    seen_keys: Dict[str, str] = {}
+    seen_by_model: Dict[str, Dict[str, Dict]] = {}
+    exact_hits = 0
+    matches = []
+    for name in names:
+        if name.lower() in seen_lower:
+            exact_hits += 1
+        seen_lower.add(name.lower())
+
+        key = _normalize_name(name)
+        matched = seen_keys.get(key)
+        if matched is None:
+            near = _best_near_match(key, seen_by_model.get(_model_key(key), {}))
+            matched = near["component_name"] if near else None
+        if matched is not None:
+            matches.append((name, matched))
+        else:
+            seen_keys[key] = name
+            if _model_key(key):
+                seen_by_model.setdefault(_model_key(key), {})[key] = {"component_name": name}
+
+    lookups = len(names)
+    return {
+        "lookups": lookups,
+        "exact_hits": exact_hits,
+        "exact_hit_rate": exact_hits / lookups if lookups else 0.0,
+        "canonical_hits": len(matches),
+        "canonical_hit_rate": len(matches) / lookups if lookups else 0.0,
+        "matches": matches,
+    }
+
+
+def _flush_at_exit():
+    _cache_backend.flush()
+
+
+atexit.register(_flush_at_exit)
 
 
 def ensure_cache_exists():
     """Create the cache CSV file if it doesn't exist."""
-    if not os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=[
-                    "component_name",
-                    "category",
-                    "estimated_new_price_eur",
-                    "estimated_used_price_eur",
-                    "last_updated",
-                    "source",
-                ],
-            )
-            writer.writeheader()
+    CsvComponentCache(CACHE_FILE).ensure()
+
+
+def _fresh(row: Optional[Dict]) -> Optional[Dict]:
+    """The row if it isn't expired, else None."""
+    if row is None:
+        return None
+    # Check expiry
+    try:
+        updated = datetime.fromisoformat(row["last_updated"])
+        if datetime.now() - updated > timedelta(days=CACHE_EXPIRY_DAYS):
+            return None  # Expired
+        return row
+    except Exception:
+        return None
 
 
 def get_cache_entry(component_name: str) -> Optional[Dict]:
     """
     Retrieve a cached component price entry if it exists and is recent.
+    Names are compared in canonical form (case, spacing, word order and units don't matter).
     Returns None if not found or expired.
     """
-    ensure_cache_exists()
-    try:
-        with open(CACHE_FILE, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                if row["component_name"].lower() == component_name.lower():
-                    # Check expiry
-                    try:
-                        updated = datetime.fromisoformat(row["last_updated"])
-                        if datetime.now() - updated > timedelta(days=CACHE_EXPIRY_DAYS):
-                            return None  # Expired
-                        return row
-                    except Exception:
-                        return None
-    except Exception:
-        pass
-    return None
+    _cache_backend.ensure()
+    entry = _fresh(_cache_backend.get(component_name))
+    metrics.incr("price_cache.hits" if entry is not None else "price_cache.misses")
+    return entry
+
+
+def find_similar_cache_entry(component_name: str) -> Optional[Dict]:
+    """
+    Retrieve a recent cache entry for a near-duplicate name, e.g. "SeaSonic 850W 80 Plus Bronze PSU"
+    for "Seasonic 850W 80plus Bronze". Model tokens (anything with a digit) must match exactly.
+    """
+    _cache_backend.ensure()
+    entry = _fresh(_cache_backend.find_similar(component_name))
+    if entry is not None:
+        metrics.incr("price_cache.near_hits")
+    return entry
 
 
 def save_cache_entry(
@@ -68,68 +676,12 @@ def save_cache_entry(
     Save or update a component price in the cache.
     Automatically calculates used price as (new_price * (1 - USED_PART_DISCOUNT)).
     """
-    ensure_cache_exists()
+    _cache_backend.ensure()
 
     estimated_used_price_eur = estimated_new_price_eur * (1 - USED_PART_DISCOUNT)
     last_updated = datetime.now().isoformat()
 
-    # Read existing entries
-    entries = []
-    try:
-        with open(CACHE_FILE, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            entries = list(reader)
-    except Exception:
-        pass
-
-    # Update or add entry
-    found = False
-    for entry in entries:
-        if entry["component_name"].lower() == component_name.lower():
-            entry.update(
-                {
-                    "category": category,
-                    "estimated_new_price_eur": estimated_new_price_eur,
-                    "estimated_used_price_eur": round(estimated_used_price_eur, 2),
-                    "last_updated": last_updated,
-                    "source": source,
-                }
-            )
-            found = True
-            break
-
-    if not found:
-        entries.append(
-            {
-                "component_name": component_name,
-                "category": category,
-                "estimated_new_price_eur": estimated_new_price_eur,
-                "estimated_used_price_eur": round(estimated_used_price_eur, 2),
-                "last_updated": last_updated,
-                "source": source,
-            }
-        )
-
-    # Write back
-    try:
-        with open(CACHE_FILE, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=[
-                    "component_name",
-                    "category",
-                    "estimated_new_price_eur",
-                    "estimated_used_price_eur",
-                    "last_updated",
-                    "source",
-                ],
-            )
-            writer.writeheader()
-            writer.writerows(entries)
-    except Exception as e:
-        print(f"[Warning] Could not save cache entry: {e}")
-
-    return {
+    entry = {
         "component_name": component_name,
         "category": category,
         "estimated_new_price_eur": estimated_new_price_eur,
@@ -138,6 +690,14 @@ def save_cache_entry(
         "source": source,
     }
 
+    # Append-only: the entry is journaled (or buffered in write-behind mode) instead of rewriting the file
+    try:
+        _cache_backend.upsert(entry)
+    except Exception as e:
+        print(f"[Warning] Could not save cache entry: {e}")
+
+    return entry
+
 
 def estimate_component_price(component_name: str) -> Dict:
     """
@@ -154,8 +714,8 @@ def estimate_component_price(component_name: str) -> Dict:
         "category": str
     }
     """
-    # Check cache
-    cached_entry = get_cache_entry(component_name)
+    # Check cache (exact canonical name, then near-duplicate names)
+    cached_entry = get_cache_entry(component_name) or find_similar_cache_entry(component_name)
     if cached_entry:
         return {
             "component_name": cached_entry["component_name"],
@@ -167,8 +727,7 @@ def estimate_component_price(component_name: str) -> Dict:
 
     # Fallback: estimate based on component name patterns
     # In production, this would call an API like pcprice.watch or a price database
-    estimated_new_price = _estimate_price_from_name(component_name)
-    category = _categorize_component(component_name)
+    estimated_new_price, category = get_rule_engine().classify(component_name)
 
     # Save to cache
     result = save_cache_entry(component_name, category, estimated_new_price)
@@ -177,146 +736,90 @@ def estimate_component_price(component_name: str) -> Dict:
     return result
 
 
+def get_rule_engine() -> RuleEngine:
+    """The compiled pricing/category rules (loaded from RULES_FILE on first use)."""
+    global _rule_engine
+    if _rule_engine is None:
+        _rule_engine = load_rule_engine(RULES_FILE)
+    return _rule_engine
+
+
+def reload_rules(path: Optional[str] = None) -> RuleEngine:
+    """Recompile the rules, e.g. after editing component_rules.json."""
+    global _rule_engine, RULES_FILE
+    if path is not None:
+        RULES_FILE = path
+    _rule_engine = load_rule_engine(RULES_FILE)
+    return _rule_engine
+
+
 def _estimate_price_from_name(component_name: str) -> float:
     """
     Simple heuristic to estimate a component's new price based on its name.
     In a production system, this would call pcprice.watch API or scrape prices.
+    The heuristics are the price rules of component_rules.json.
     """
-    name_lower = component_name.lower()
-
-    # GPU estimates (very rough)
-    if "rtx 4090" in name_lower:
-        return 1800
-    elif "rtx 4080" in name_lower:
-        return 1200
-    elif "rtx 4070" in name_lower:
-        return 700
-    elif "rtx 4060" in name_lower:
-        return 320
-    elif "rtx 3090" in name_lower:
-        return 1000
-    elif "rtx 3080" in name_lower:
-        return 700
-    elif "rtx 3070" in name_lower:
-        return 500
-    elif "rtx 3060" in name_lower:
-        return 350
-    elif "rx 6800" in name_lower:
-        return 500
-    elif "rx 6700" in name_lower:
-        return 380
-    elif "rx 6600" in name_lower:
-        return 250
-    elif "rx 7900" in name_lower:
-        return 750
-    elif "rx 7800" in name_lower:
-        return 400
-    elif "gpu" in name_lower or "graphics" in name_lower or "gtx" in name_lower or "radeon" in name_lower:
-        return 400  # Generic GPU estimate
-
-    # CPU estimates
-    elif "ryzen 9 7950x" in name_lower:
-        return 500
-    elif "ryzen 9 7900x" in name_lower:
-        return 400
-    elif "ryzen 7 7700x" in name_lower:
-        return 300
-    elif "ryzen 5 7600x" in name_lower:
-        return 230
-    elif "i9-13900k" in name_lower:
-        return 580
-    elif "i7-13700k" in name_lower:
-        return 420
-    elif "i5-13600k" in name_lower:
-        return 280
-    elif "cpu" in name_lower or "processor" in name_lower or "ryzen" in name_lower or "core i" in name_lower:
-        return 250  # Generic CPU estimate
-
-    # RAM estimates
-    elif "32gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
-        return 150
-    elif "16gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
-        return 80
-    elif "8gb" in name_lower and ("ddr5" in name_lower or "ddr4" in name_lower):
-        return 40
-    elif "ram" in name_lower or "memory" in name_lower or "ddr" in name_lower:
-        return 60  # Generic RAM estimate
-
-    # SSD/Storage estimates
-    elif "2tb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
-        return 150
-    elif "1tb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
-        return 80
-    elif "500gb" in name_lower and ("ssd" in name_lower or "nvme" in name_lower):
-        return 50
-    elif "ssd" in name_lower or "nvme" in name_lower or "storage" in name_lower:
-        return 70  # Generic SSD estimate
-
-    # Motherboard estimates
-    elif "motherboard" in name_lower or "mobo" in name_lower or "x870" in name_lower or "z790" in name_lower:
-        return 250
-
-    # PSU estimates (only valued if premium brand)
-    elif ("corsair" in name_lower or "seasonic" in name_lower) and ("psu" in name_lower or "power" in name_lower):
-        if "1000w" in name_lower:
-            return 180
-        elif "850w" in name_lower:
-            return 150
-        elif "750w" in name_lower:
-            return 120
-        else:
-            return 100
-    elif "psu" in name_lower or "power supply" in name_lower:
-        return 0  # Generic PSU valued at 0 unless premium
-
-    # Case estimates (typically 0 unless premium)
-    elif "case" in name_lower or "chassis" in name_lower:
-        if "corsair" in name_lower or "nzxt" in name_lower or "lian li" in name_lower:
-            return 100
-        else:
-            return 0
-
-    # Cooler estimates
-    elif "cooler" in name_lower or "heatsink" in name_lower:
-        if "corsair" in name_lower or "noctua" in name_lower:
-            return 80
-        else:
-            return 20
-
-    # Default fallback
-    return 50
+    return get_rule_engine().estimate_price(component_name)
 
 
 def _categorize_component(component_name: str) -> str:
     """Categorize a component by type."""
-    name_lower = component_name.lower()
-
-    if any(term in name_lower for term in ["gpu", "graphics", "rtx", "gtx", "radeon", "rx"]):
-        return "GPU"
-    elif any(term in name_lower for term in ["cpu", "processor", "ryzen", "core i", "i5", "i7", "i9"]):
-        return "CPU"
-    elif any(term in name_lower for term in ["ram", "memory", "ddr4", "ddr5"]):
-        return "RAM"
-    elif any(term in name_lower for term in ["ssd", "nvme", "hdd", "storage"]):
-        return "Storage"
-    elif any(term in name_lower for term in ["motherboard", "mobo", "x870", "z790", "b650"]):
-        return "Motherboard"
-    elif any(term in name_lower for term in ["psu", "power supply"]):
-        return "PSU"
-    elif any(term in name_lower for term in ["case", "chassis"]):
-        return "Case"
-    elif any(term in name_lower for term in ["cooler", "heatsink"]):
-        return "Cooler"
-    else:
-        return "Other"
-
-
-def get_all_cached_components() -> list:
-    """Retrieve all cached components for dashboard visualization."""
-    ensure_cache_exists()
-    try:
-        with open(CACHE_FILE, "r", newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            return list(reader)
-    except Exception:
-        return []
+    return get_rule_engine().categorize(component_name)
+
+
+def get_all_cached_components(limit: Optional[int] = None, offset: int = 0) -> list:
+    """
+    Retrieve cached components for dashboard visualization.
+    Returns every row by default, or one page of `limit` rows starting at `offset`.
+    """
+    _cache_backend.ensure()
+    if limit is None:
+        return _cache_backend.rows()[offset:]
+    rows = []
+    skipped = 0
+    for page in _cache_backend.iter_pages(max(limit, 1)):
+        for row in page:
+            if skipped < offset:
+                skipped += 1
+                continue
+            rows.append(row)
+            if len(rows) >= limit:
+                return rows
+    return rows
+
+
+def iter_cached_components(page_size: int = 500) -> Iterator[List[Dict]]:
+    """Yield the cached components one page (list of rows) at a time."""
+    _cache_backend.ensure()
+    yield from _cache_backend.iter_pages(page_size)
+
+
+def get_stale_components(max_age_days: int = CACHE_EXPIRY_DAYS) -> List[Dict]:
+    """Cached components whose price is older than max_age_days (due for a refresh)."""
+    _cache_backend.ensure()
+    cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+    return _cache_backend.rows_updated_before(cutoff)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Component price cache maintenance.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    migrate = sub.add_parser("migrate", help="Import the CSV cache into a SQLite cache file")
+    migrate.add_argument("--csv", default=CACHE_FILE)
+    migrate.add_argument("--db", default=CACHE_DB_FILE)
+    hit_rate = sub.add_parser("hit-rate", help="Replay a cache CSV and report exact vs. canonical/near-match hit rates")
+    hit_rate.add_argument("--csv", default=CACHE_FILE)
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        count = migrate_csv_to_sqlite(args.csv, args.db)
+        print(f"Migrated {count} components from {args.csv} to {args.db}")
+    elif args.command == "hit-rate":
+        report = measure_name_hit_rate(args.csv)
+        print(f"{report['lookups']} names replayed from {args.csv}")
+        print(f"  exact lowercase match : {report['exact_hits']} hits ({report['exact_hit_rate']:.0%})")
+        print(f"  canonical + near match: {report['canonical_hits']} hits ({report['canonical_hit_rate']:.0%})")
+        for name, matched in report["matches"]:
+            print(f"    {name!r} -> {matched!r}")
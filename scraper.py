@@ -1,106 +1,469 @@
 import asyncio
-import re
+import time
+from collections import deque
+from urllib.parse import urlparse
 from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
+
+import metrics
+from listing_parser import NEXT_DATA_SCRIPT
+from parse_pool import get_parse_pool
+
+
+_BATCH_DONE = object()
+# Safety cap on stored page text; the analyzer compacts it to its token budget
+RAW_TEXT_MAX_CHARS = 20000
+
+# Requests not needed to read a listing: heavy resources and third-party trackers/ads
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "media", "font"})
+BLOCKED_TRACKER_DOMAINS = (
+    "doubleclick.net", "googlesyndication.com", "googletagmanager.com", "googletagservices.com",
+    "google-analytics.com", "googleadservices.com", "adservice.google.com", "facebook.net",
+    "connect.facebook.com", "criteo.com", "criteo.net", "hotjar.com", "taboola.com", "outbrain.com",
+    "amazon-adsystem.com", "adnxs.com", "scorecardresearch.com", "smartadserver.com", "quantserve.com",
+    "tiktok.com", "bing.com", "pinterest.com", "snapchat.com", "yieldmo.com", "pubmatic.com",
+    "rubiconproject.com", "teads.tv", "sentry.io", "datadoghq.com",
+)
+# Present once the listing itself has rendered
+LISTING_READY_SELECTOR = '[data-qa-id="adview_price"], [data-qa-id="adview_description_container"]'
+
+
+def _is_blocked(resource_type, url):
+    """True for requests a listing scrape can do without."""
+    if resource_type in BLOCKED_RESOURCE_TYPES:
+        return True
+    host = (urlparse(url).hostname or "").lower()
+    return any(host == domain or host.endswith("." + domain) for domain in BLOCKED_TRACKER_DOMAINS)
+
+
+async def _iterate(items):
+    """Iterates a regular or an async iterable."""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+
+class _DomainRateLimiter:
+    """Spaces out requests to the same domain by at least `min_interval` seconds."""
+
+    def __init__(self, min_interval):
+        self.min_interval = min_interval
+        self._next_slot = {}
+
+    async def wait(self, url):
+        if not self.min_interval or self.min_interval <= 0:
+            return
+        domain = urlparse(url).netloc.lower()
+        now = asyncio.get_running_loop().time()
+        # Reserve the next free slot for this domain before sleeping, so concurrent callers queue up in order
+        slot = max(now, self._next_slot.get(domain, now))
+        self._next_slot[domain] = slot + self.min_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class _PooledPage:
+    """A browser context and its page, reused across navigations."""
+
+    def __init__(self, context, page):
+        self.context = context
+        self.page = page
+        self.navigations = 0
+        self.consent_handled = False
+        # Traffic of the current navigation
+        self.bytes_received = 0
+        self.requests = 0
+        self.blocked_requests = 0
+        self.pending_sizes = set()
+
+    def reset_traffic(self):
+        self.bytes_received = 0
+        self.requests = 0
+        self.blocked_requests = 0
+
 
 class AntigravityScraper:
     """
     The 'Antigravity' class. It floats over anti-bot measures.
+
+    Use it as an async context manager to keep one browser alive for a whole
+    session and reuse a bounded pool of contexts/pages between listings:
+
+        async with AntigravityScraper(pool_size=3) as scraper:
+            data = await scraper.get_listing_data(url)
+
+    Outside of a session, each call to get_listing_data opens (and closes) its own browser.
     """
     
-    def __init__(self):
+    def __init__(self, pool_size=2, max_navigations_per_page=25, headless=False, per_domain_interval=1.0,
+                 block_resources=True, ready_timeout_ms=10000, snapshot_store=None, parse_pool=None):
         self.browser_args = [
             '--disable-blink-features=AutomationControlled',
             '--no-sandbox',
             '--user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         ]
+        # headless=False by default: LBC is tough on headless browsers.
+        self.headless = headless
+        self.pool_size = pool_size
+        # Recycle a context after this many navigations to keep memory and tracking state bounded.
+        self.max_navigations_per_page = max_navigations_per_page
+        # Minimum delay between two navigations to the same domain in batch mode
+        self.per_domain_interval = per_domain_interval
+        # Abort images, media, fonts and tracker requests
+        self.block_resources = block_resources
+        # How long to wait for the price/description blocks before parsing what is there
+        self.ready_timeout_ms = ready_timeout_ms
+        # SnapshotStore keeping the raw HTML of every page (for replay and fixtures)
+        self.snapshot_store = snapshot_store
+        # ParsePool running the extraction off the event loop (default: the shared one)
+        self.parse_pool = parse_pool
 
-    async def get_listing_data(self, url):
-        """Spins up a stealthy browser to grab the raw HTML and extract key data."""
-        print(f"[bold blue]>> Launching Antigravity engine for:[/bold blue] {url}")
-        async with async_playwright() as p:
-            # Headless=False to look more human if needed, but trying True first for speed if possible.
-            # User suggested Headless=False if needed. Let's default to True but keep it configurable if we were to expand.
-            # For LBC, sometimes Headless=False is safer. Let's stick to the user's hint or the base code.
-            # Base code had headless=True. I'll stick to that but add a comment.
-            browser = await p.chromium.launch(headless=False, args=self.browser_args) # Changed to False as LBC is tough
-            context = await browser.new_context(viewport={'width': 1920, 'height': 1080})
+        self._playwright = None
+        self._browser = None
+        self._slots = None
+        self._idle_pages = deque()
+
+        # Pool statistics
+        self.acquire_wait_times = []
+        self.pages_created = 0
+        self.pages_recycled = 0
+        # Per-listing traffic and load time ({"bytes", "requests", "blocked_requests", "load_s"})
+        self.page_metrics = []
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    @property
+    def is_running(self):
+        return self._browser is not None
+
+    async def start(self):
+        """Launches the shared browser. Safe to call more than once."""
+        if self._browser is not None:
+            return
+        self._playwright = await async_playwright().start()
+        try:
+            with metrics.span("browser.launch"):
+                self._browser = await self._playwright.chromium.launch(headless=self.headless, args=self.browser_args)
+        except Exception:
+            await self._playwright.stop()
+            self._playwright = None
+            raise
+        self._slots = asyncio.Semaphore(self.pool_size)
+        self._idle_pages = deque()
+
+    async def close(self):
+        """Closes every pooled context, the browser and the playwright driver."""
+        while self._idle_pages:
+            await self._discard_page(self._idle_pages.popleft())
+        if self._browser is not None:
+            try:
+                await self._browser.close()
+            except Exception:
+                pass
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._slots = None
+
+    async def _new_page(self):
+        context = await self._browser.new_context(viewport={'width': 1920, 'height': 1080})
+        try:
             page = await context.new_page()
-            
+        except Exception:
+            await context.close()
+            raise
+        self.pages_created += 1
+        pooled = _PooledPage(context, page)
+        if self.block_resources:
+            await context.route("**/*", lambda route: self._route_request(pooled, route))
+        page.on("requestfinished", lambda request: self._track_request(pooled, request))
+        return pooled
+
+    async def _route_request(self, pooled, route):
+        request = route.request
+        try:
+            if _is_blocked(request.resource_type, request.url):
+                pooled.blocked_requests += 1
+                await route.abort()
+            else:
+                await route.continue_()
+        except Exception:
+            pass # Page closed while the request was in flight
+
+    def _track_request(self, pooled, request):
+        pooled.requests += 1
+        # Sizes are only known asynchronously; _scrape_listing awaits them before reporting
+        task = asyncio.ensure_future(self._add_transfer_size(pooled, request))
+        pooled.pending_sizes.add(task)
+        task.add_done_callback(pooled.pending_sizes.discard)
+
+    async def _add_transfer_size(self, pooled, request):
+        try:
+            sizes = await request.sizes()
+            pooled.bytes_received += sizes.get("responseBodySize", 0) + sizes.get("responseHeadersSize", 0)
+        except Exception:
+            pass
+
+    async def _discard_page(self, pooled):
+        try:
+            await pooled.context.close()
+        except Exception:
+            pass # Browser may already be gone
+
+    async def _acquire_page(self):
+        """Waits for a free pool slot and returns an idle page (or a fresh one)."""
+        started = time.perf_counter()
+        await self._slots.acquire()
+        self.acquire_wait_times.append(time.perf_counter() - started)
+        try:
+            while self._idle_pages:
+                pooled = self._idle_pages.popleft()
+                if not pooled.page.is_closed():
+                    return pooled
+                self.pages_recycled += 1
+                await self._discard_page(pooled)
+            return await self._new_page()
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _release_page(self, pooled, crashed=False):
+        """Returns a page to the pool, recycling it after a crash or too many navigations."""
+        try:
+            pooled.navigations += 1
+            if crashed or pooled.navigations >= self.max_navigations_per_page or pooled.page.is_closed():
+                self.pages_recycled += 1
+                await self._discard_page(pooled)
+            else:
+                self._idle_pages.append(pooled)
+        finally:
+            self._slots.release()
+
+    def pool_stats(self):
+        """Summary of how long callers waited to get a page from the pool."""
+        waits = self.acquire_wait_times
+        return {
+            "pool_size": self.pool_size,
+            "acquisitions": len(waits),
+            "mean_wait_s": round(sum(waits) / len(waits), 4) if waits else 0.0,
+            "max_wait_s": round(max(waits), 4) if waits else 0.0,
+            "pages_created": self.pages_created,
+            "pages_recycled": self.pages_recycled,
+        }
+
+    def transfer_stats(self):
+        """Bytes transferred, requests blocked and load time per scraped listing."""
+        measured = self.page_metrics
+        pages = len(measured)
+        return {
+            "pages": pages,
+            "total_bytes": sum(m["bytes"] for m in measured),
+            "mean_bytes": round(sum(m["bytes"] for m in measured) / pages) if pages else 0,
+            "blocked_requests": sum(m["blocked_requests"] for m in measured),
+            "mean_load_s": round(sum(m["load_s"] for m in measured) / pages, 3) if pages else 0.0,
+            "max_load_s": round(max(m["load_s"] for m in measured), 3) if pages else 0.0,
+        }
+
+    async def get_listing_data(self, url):
+        """Grabs the raw HTML of a listing with a pooled stealthy browser page and extracts key data."""
+        if not self.is_running:
+            # One-shot mode: open a session just for this listing.
+            async with self:
+                return await self.get_listing_data(url)
+
+        try:
+            return await self._scrape_listing(url)
+        except Exception as e:
+            print(f"[bold red]💥 Gravity too heavy (Error): {e}[/bold red]")
+            return None
+
+    async def get_many_listings(self, urls, concurrency=None, per_domain_interval=None):
+        """
+        Scrapes many listings concurrently and yields each result as soon as it is ready.
+
+        `urls` may be a regular or an async iterable, so URLs can be streamed in.
+        At most `concurrency` pages are in flight (defaults to the pool size) and
+        requests to the same domain are spaced by `per_domain_interval` seconds.
+
+        Yields the listing dict for each success, or an error record
+        {"url", "error", "error_type"} for each failure. Both carry "elapsed_s".
+        If iterating `urls` raises, the pages already launched are still yielded,
+        then the error is raised.
+        """
+        concurrency = concurrency or self.pool_size
+        if per_domain_interval is None:
+            per_domain_interval = self.per_domain_interval
+
+        own_session = not self.is_running
+        if own_session:
+            await self.start()
+
+        limiter = _DomainRateLimiter(per_domain_interval)
+        # A slot is held from launch until the consumer takes the result,
+        # so a slow consumer pushes back on the scraping tasks.
+        semaphore = asyncio.Semaphore(concurrency)
+        results = asyncio.Queue()
+        in_flight = set()
+        feed_error = []
+
+        async def scrape_one(url):
+            started = time.perf_counter()
             try:
-                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                
-                # Handle cookie banner if it exists (generic approach)
-                try:
-                    # Common LBC cookie button selector (might change, but good to try)
-                    await page.click('#didomi-notice-agree-button', timeout=5000)
-                except:
-                    pass # No banner or different ID
-
-                # Random scroll to trigger lazy loading and look human
-                await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-                await asyncio.sleep(2) 
-                
-                content = await page.content()
-                
-                # Basic parsing here to get the price if possible, but the Analyzer will do the heavy lifting
-                # We return the full HTML or a structured dict if we want to do some pre-processing.
-                # For now, let's return the raw text and let the Brain handle it, 
-                # BUT we also want to try to extract the price specifically if it's easy, 
-                # to pass it to the analyzer as a fallback/confirmation.
-                
-                soup = BeautifulSoup(content, 'html.parser')
-                
-                # Extract Title
-                title_tag = soup.find('h1')
-                title = title_tag.get_text(strip=True) if title_tag else "Unknown Title"
-                
-                # Extract Price (LBC specific structure often changes). Best-effort extraction.
-                price_text = ""
-                # Look for price in common places
-                price_tag = soup.select_one('[data-qa-id="adview_price"]')
-                if price_tag:
-                    raw_price = price_tag.get_text(separator=' ', strip=True)
-                else:
-                    # Fallback: search the entire page text for something that looks like a euro amount
-                    raw_price = soup.get_text(separator=' ', strip=True)
-
-                # Helper to clean and extract a numeric price (handles NBSP and thin spaces)
-                def extract_price_from_text(s: str) -> str:
-                    if not s:
-                        return ""
-                    # Common NBSP or narrow NBSP characters
-                    s = s.replace('\u00A0', ' ').replace('\u202F', ' ').replace('\u2009', ' ')
-                    # Try to find patterns like '1 000 €' or '1000€' or '1\u0000 000 €'
-                    m = re.search(r"(\d{1,3}(?:[ \.,]\d{3})*(?:[\.,]\d+)?)\s*€", s)
-                    if not m:
-                        # fallback: any standalone number sequence
-                        m = re.search(r"(\d[\d \.,]*)", s)
-                    if not m:
-                        return ""
-                    num = m.group(1)
-                    # Remove grouping spaces and non-digit punctuation, keep decimal dot
-                    num = num.replace(' ', '').replace('\u00A0', '').replace('\u202F', '')
-                    num = num.replace(',', '.')
-                    # Strip any trailing non-digit/point
-                    num = re.sub(r"[^0-9.]", '', num)
-                    return num
-
-                price_text = extract_price_from_text(raw_price)
-                
-                # Extract Description
-                description_tag = soup.select_one('[data-qa-id="adview_description_container"]')
-                raw_text = description_tag.get_text(separator='\n', strip=True) if description_tag else soup.get_text(separator=' ', strip=True)
-                
-                return {
-                    "title": title,
-                    "price_str": price_text,
-                    "raw_text": raw_text[:8000], # Limit for tokens
-                    "url": url
-                }
+                await limiter.wait(url)
+                record = await self._scrape_listing(url)
+            except Exception as e:
+                record = {"url": url, "error": str(e) or type(e).__name__, "error_type": type(e).__name__}
+            record["elapsed_s"] = round(time.perf_counter() - started, 3)
+            results.put_nowait(record)
 
+        async def feed():
+            try:
+                async for url in _iterate(urls):
+                    url = (url or "").strip()
+                    if not url:
+                        continue
+                    await semaphore.acquire()
+                    task = asyncio.create_task(scrape_one(url))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
             except Exception as e:
-                print(f"[bold red]💥 Gravity too heavy (Error): {e}[/bold red]")
-                return None
+                feed_error.append(e)
+            try:
+                # Even when the URL source failed, the pages already launched are finished and yielded
+                while in_flight:
+                    await asyncio.wait(set(in_flight))
             finally:
-                await browser.close()
+                results.put_nowait(_BATCH_DONE)
+
+        feeder = asyncio.create_task(feed())
+        try:
+            while True:
+                record = await results.get()
+                if record is _BATCH_DONE:
+                    break
+                semaphore.release()
+                yield record
+            if feed_error:
+                raise feed_error[0]
+        finally:
+            # Consumer stopped early (or finished): don't leave tasks behind
+            feeder.cancel()
+            for task in list(in_flight):
+                task.cancel()
+            await asyncio.gather(feeder, *in_flight, return_exceptions=True)
+            if own_session:
+                await self.close()
+
+    async def _page_metrics(self, pooled, load_s):
+        """Traffic of the navigation that just finished on a pooled page."""
+        if pooled.pending_sizes:
+            await asyncio.gather(*pooled.pending_sizes, return_exceptions=True)
+        stats = {
+            "bytes": pooled.bytes_received,
+            "requests": pooled.requests,
+            "blocked_requests": pooled.blocked_requests,
+            "load_s": round(load_s, 3),
+        }
+        self.page_metrics.append(stats)
+        metrics.incr("scraper.pages")
+        metrics.incr("scraper.bytes_received", stats["bytes"])
+        metrics.incr("scraper.blocked_requests", stats["blocked_requests"])
+        return stats
+
+    async def _open(self, pooled, url, ready_selector):
+        """Navigates a pooled page to `url` and waits for `ready_selector` (best effort)."""
+        page = pooled.page
+        with metrics.span("page.goto"):
+            await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+
+        # Handle cookie banner if it exists (generic approach).
+        # Consent is stored in the context, so a reused page only needs it once.
+        if not pooled.consent_handled:
+            try:
+                with metrics.span("page.consent_click"):
+                    # Common LBC cookie button selector (might change, but good to try)
+                    await page.click('#didomi-notice-agree-button', timeout=5000)
+            except:
+                pass # No banner or different ID
+            pooled.consent_handled = True
+
+        # Wait for the content blocks rather than a fixed delay
+        try:
+            with metrics.span("page.wait_ready"):
+                await page.wait_for_selector(ready_selector, timeout=self.ready_timeout_ms)
+        except Exception:
+            pass # Parse whatever rendered; the parsers' fallbacks cover missing blocks
+
+    async def _fetch_page(self, url, ready_selector, full_html):
+        """
+        {"next_data", "html", "page_stats"} of `url`, loaded on a pooled page:
+        the page state JSON text and, when `full_html` or the page has no state,
+        the serialized DOM. The page is back in the pool on return. Raises on failure.
+        """
+        pooled = await self._acquire_page()
+        crashed = False
+        pooled.reset_traffic()
+        started = time.perf_counter()
+        try:
+            await self._open(pooled, url, ready_selector)
+            next_data = None if full_html else await pooled.page.evaluate(NEXT_DATA_SCRIPT)
+            html = None if next_data else await pooled.page.content()
+            page_stats = await self._page_metrics(pooled, time.perf_counter() - started)
+            return {"next_data": next_data, "html": html, "page_stats": page_stats}
+        except Exception:
+            crashed = True
+            raise
+        finally:
+            await self._release_page(pooled, crashed=crashed)
+
+    async def fetch_search_page(self, url, ready_selector):
+        """
+        Loads a search-results page on a pooled page (within a session) and
+        returns {"url", "next_data", "html", "page_stats"}: the page state JSON
+        text when the page has one (html is then None), else the serialized DOM.
+        Raises on failure.
+        """
+        if not self.is_running:
+            raise RuntimeError("fetch_search_page needs a running scraper session")
+        fetched = await self._fetch_page(url, ready_selector, full_html=False)
+        return dict(fetched, url=url)
+
+    async def _scrape_listing(self, url):
+        """Scrapes one listing: navigation on a pooled page, then extraction in the parse pool. Raises on failure."""
+        print(f"[bold blue]>> Launching Antigravity engine for:[/bold blue] {url}")
+        # The full page is needed for the snapshot anyway; otherwise the page state JSON carries the whole ad
+        fetched = await self._fetch_page(url, LISTING_READY_SELECTOR, full_html=self.snapshot_store is not None)
+        parse_pool = self.parse_pool or get_parse_pool()
+
+        # The page is back in the pool: storing and parsing don't hold up navigation
+        snapshot = None
+        if fetched["html"] is not None and self.snapshot_store is not None:
+            with metrics.span("snapshot.put"):
+                snapshot = await asyncio.to_thread(self.snapshot_store.put, url, fetched["html"])
+        with metrics.span("parse.listing"):
+            listing = await parse_pool.parse(fetched["html"], fetched["next_data"])
+        if listing is None:
+            # A page state without a recognizable ad: load the full page for the JSON-LD / DOM fallbacks
+            fetched = await self._fetch_page(url, LISTING_READY_SELECTOR, full_html=True)
+            with metrics.span("parse.listing"):
+                listing = await parse_pool.parse(fetched["html"])
+
+        record = {
+            "title": listing["title"],
+            "price_str": listing["price_str"],
+            "raw_text": listing["raw_text"][:RAW_TEXT_MAX_CHARS],
+            "url": url,
+            "extracted_from": listing["source"],
+            "page_stats": fetched["page_stats"],
+        }
+        if snapshot is not None:
+            record["snapshot"] = snapshot["sha256"]
+        return record
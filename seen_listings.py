@@ -0,0 +1,197 @@
+"""
+seen_listings.py
+Index of the listings already processed, keyed on the Leboncoin ad id.
+
+Batch runs are often fed the same ads again. For each ad id (the number in
+/ad/ordinateurs/<id>) the index keeps the last price, a hash of the listing
+content and when it was last scraped and analyzed, so the pipeline can skip
+ads scraped recently and, for ads scraped again, skip the model unless the
+price or the description changed.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+
+SEEN_LISTINGS_FILE = "seen_listings.json"
+# Ads scraped more recently than this are not scraped again
+RESCRAPE_AFTER_SECONDS = 24 * 3600
+# Index writes are batched: due every SAVE_EVERY changes (the caller flushes, e.g. in a thread) and at the end of a run
+SAVE_EVERY = 20
+
+_AD_ID_RE = re.compile(r"/ad/[^/?#]+/(\d+)")
+
+
+def ad_id(url: str) -> str:
+    """Leboncoin ad id of a listing URL; other URLs are keyed on the URL without query/fragment."""
+    url = (url or "").strip()
+    match = _AD_ID_RE.search(url)
+    if match:
+        return match.group(1)
+    return url.split("#", 1)[0].split("?", 1)[0].rstrip("/")
+
+
+def content_hash(listing_data: Dict) -> str:
+    """
+    Hash of a listing's title, price and whitespace/case-normalized text. Also
+    the analysis cache key (analyzer.AnalysisCache.key_for), so "unchanged"
+    means the same thing to the skip logic and to the cached answers.
+    """
+    def normalize(value):
+        return " ".join(str(value or "").split()).lower()
+
+    payload = json.dumps([
+        normalize(listing_data.get('title')),
+        normalize(listing_data.get('price_str')),
+        normalize(listing_data.get('raw_text')),
+    ])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SeenListings:
+    """
+    Persistent {ad id: {url, price_str, content_hash, last_scraped, last_analyzed}} index.
+
+    - should_scrape(url): False for ads scraped less than rescrape_after seconds
+      ago and for repeats of an ad within the same run
+    - has_changed(listing): after a scrape, whether the listing needs a new analysis
+    - mark_analyzed(listing): records the content that was analyzed and saved
+
+    Changes are kept in memory and never written by these calls: flush() writes
+    the index, and save_due tells when SAVE_EVERY changes are waiting. Async
+    callers run flush in a thread so the rewrite stays off the event loop.
+    """
+
+    def __init__(self, path=SEEN_LISTINGS_FILE, rescrape_after=RESCRAPE_AFTER_SECONDS):
+        self.path = path
+        self.rescrape_after = rescrape_after
+        self._entries = {}
+        self._claimed = set()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        # Serializes flushes, so an older snapshot never replaces a newer one
+        self._save_lock = threading.Lock()
+        # Work avoided / done in this process
+        self.skipped_recent = 0
+        self.skipped_duplicate = 0
+        self.unchanged = 0
+        self.changed = 0
+        self.new = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries = json.load(f).get("listings", {})
+        except Exception as e:
+            print(f"[Warning] Could not read seen listings: {e}")
+            self._entries = {}
+
+    def _save(self, entries) -> bool:
+        if not self.path:
+            return True
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".seen_listings.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"listings": entries}, f)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            print(f"[Warning] Could not save seen listings: {e}")
+            return False
+
+    def get(self, url: str) -> Optional[Dict]:
+        return self._entries.get(ad_id(url))
+
+    def should_scrape(self, url: str, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        key = ad_id(url)
+        with self._lock:
+            if key in self._claimed:
+                self.skipped_duplicate += 1
+                return False
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.get("last_scraped", 0) < self.rescrape_after:
+                self.skipped_recent += 1
+                return False
+            self._claimed.add(key)
+            return True
+
+    def has_changed(self, listing_data: Dict, now: Optional[float] = None) -> bool:
+        """
+        False when a scraped listing matches what was last analyzed (the scrape
+        is then recorded). New and changed listings are only recorded by
+        mark_analyzed, so one whose analysis fails is scraped again next run.
+        """
+        now = time.time() if now is None else now
+        key = ad_id(listing_data.get("url"))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.get("content_hash") is None:
+                self.new += 1
+                return True
+            if entry["content_hash"] != content_hash(listing_data):
+                self.changed += 1
+                return True
+            self.unchanged += 1
+            self._entries[key] = dict(entry, last_scraped=now)
+            self._unsaved += 1
+            return False
+
+    def mark_analyzed(self, listing_data: Dict, now: Optional[float] = None):
+        now = time.time() if now is None else now
+        key = ad_id(listing_data.get("url"))
+        with self._lock:
+            self._entries[key] = {
+                "url": listing_data.get("url"),
+                "price_str": listing_data.get("price_str"),
+                "content_hash": content_hash(listing_data),
+                "last_scraped": now,
+                "last_analyzed": now,
+            }
+            self._unsaved += 1
+
+    @property
+    def save_due(self) -> bool:
+        return self._unsaved >= SAVE_EVERY
+
+    def flush(self):
+        """Writes the index if it changed (the whole file: call it from a thread in async code)."""
+        with self._save_lock:
+            with self._lock:
+                if not self._unsaved:
+                    return
+                # Entries are replaced, never mutated, so a shallow copy is a consistent snapshot
+                entries, unsaved = dict(self._entries), self._unsaved
+                self._unsaved = 0
+            if not self._save(entries):
+                # Still unsaved: retried by the next flush
+                with self._lock:
+                    self._unsaved += unsaved
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        scrapes_avoided = self.skipped_recent + self.skipped_duplicate
+        return {
+            "seen": len(self._entries),
+            "new": self.new,
+            "changed": self.changed,
+            "unchanged": self.unchanged,
+            "skipped_recent": self.skipped_recent,
+            "skipped_duplicate": self.skipped_duplicate,
+            "scrapes_avoided": scrapes_avoided,
+            "analyses_avoided": scrapes_avoided + self.unchanged,
+        }
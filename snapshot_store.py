@@ -0,0 +1,293 @@
+"""
+snapshot_store.py
+Compressed, content-addressed store of the raw listing pages the scraper fetched.
+
+Each page is stored once under the SHA-256 of its HTML (zstd when the
+`zstandard` package is installed, gzip otherwise), and every capture appends
+one line {url, fetched_at, sha256, ...} to an index.jsonl journal. Stored pages
+can be replayed through parsing and analysis without a browser, or exported
+as parser regression fixtures.
+
+    python snapshot_store.py list [--url URL]
+    python snapshot_store.py export URL fixtures/my_listing.html
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from parse_pool import get_parse_pool
+from scraper import RAW_TEXT_MAX_CHARS
+
+try:
+    import zstandard
+except ImportError: # Optional: gzip is used without it
+    zstandard = None
+
+
+SNAPSHOT_DIR = "snapshots"
+INDEX_FILE = "index.jsonl"
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+_EXTENSIONS = {"gzip": ".html.gz", "zstd": ".html.zst"}
+
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("This snapshot is zstd-compressed: pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class SnapshotStore:
+    """
+    On-disk page store: <root>/blobs/<2 hex>/<sha256>.html.{zst,gz} plus <root>/index.jsonl.
+
+    - codec: "zstd" or "gzip"; defaults to zstd when available
+    """
+
+    def __init__(self, root: str = SNAPSHOT_DIR, codec: Optional[str] = None):
+        if codec is None:
+            codec = "zstd" if zstandard is not None else "gzip"
+        if codec not in _EXTENSIONS:
+            raise ValueError(f"Unknown snapshot codec: {codec}")
+        if codec == "zstd" and zstandard is None:
+            raise RuntimeError("zstd snapshots need the zstandard package")
+        self.root = root
+        self.codec = codec
+        self._lock = threading.Lock()
+
+    @property
+    def index_path(self) -> str:
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _blob_path(self, sha256: str, codec: str) -> str:
+        return os.path.join(self.root, "blobs", sha256[:2], sha256 + _EXTENSIONS[codec])
+
+    def put(self, url: str, html: str, fetched_at: Optional[str] = None) -> Dict:
+        """Stores one capture of a page and returns its index entry."""
+        data = html.encode("utf-8")
+        sha256 = hashlib.sha256(data).hexdigest()
+        entry = {
+            "url": url,
+            "fetched_at": fetched_at or datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "sha256": sha256,
+            "codec": self.codec,
+            "size": len(data),
+        }
+        with self._lock:
+            existing = self._existing_blob(sha256)
+            if existing is None:
+                path = self._blob_path(sha256, self.codec)
+                compressed = _compress(data, self.codec)
+                self._write_atomic(path, compressed)
+                entry["compressed_size"] = len(compressed)
+            else:
+                # Same page already stored (content-addressed): only the capture is recorded
+                entry["codec"], path = existing
+                entry["compressed_size"] = os.path.getsize(path)
+            self._append_index(entry)
+        return entry
+
+    def _existing_blob(self, sha256: str) -> Optional[Tuple[str, str]]:
+        for codec in _EXTENSIONS:
+            path = self._blob_path(sha256, codec)
+            if os.path.exists(path):
+                return codec, path
+        return None
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".snapshot.", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _append_index(self, entry: Dict):
+        os.makedirs(self.root, exist_ok=True)
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode("utf-8")
+        # One O_APPEND write per entry: concurrent writers never interleave within a line
+        fd = os.open(self.index_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+    def entries(self, url: Optional[str] = None, latest_only: bool = False) -> List[Dict]:
+        """Index entries in capture order (optionally one URL, or only the latest capture per URL)."""
+        if not os.path.exists(self.index_path):
+            return []
+        found = []
+        with open(self.index_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue # Torn line from an interrupted write
+                if url is None or entry.get("url") == url:
+                    found.append(entry)
+        if latest_only:
+            latest = {}
+            for entry in found:
+                latest[entry["url"]] = entry
+            found = list(latest.values())
+        return found
+
+    def latest(self, url: str) -> Optional[Dict]:
+        found = self.entries(url=url)
+        return found[-1] if found else None
+
+    def read(self, entry: Dict) -> str:
+        """The HTML of an index entry."""
+        path = self._blob_path(entry["sha256"], entry.get("codec", "gzip"))
+        with open(path, "rb") as f:
+            return _decompress(f.read(), entry.get("codec", "gzip")).decode("utf-8")
+
+    def iter_pages(self, urls=None, latest_only: bool = True) -> Iterator[Tuple[Dict, str]]:
+        """(entry, html) for the stored captures of `urls` (all URLs when None)."""
+        wanted = None if urls is None else set(urls)
+        for entry in self.entries(latest_only=latest_only):
+            if wanted is None or entry["url"] in wanted:
+                yield entry, self.read(entry)
+
+    def stats(self) -> Dict:
+        entries = self.entries()
+        blobs = {e["sha256"]: e for e in entries}
+        return {
+            "captures": len(entries),
+            "urls": len({e["url"] for e in entries}),
+            "unique_pages": len(blobs),
+            "html_bytes": sum(e["size"] for e in blobs.values()),
+            "stored_bytes": sum(e.get("compressed_size", 0) for e in blobs.values()),
+        }
+
+
+class SnapshotReplayer:
+    """
+    Stands in for AntigravityScraper in the batch pipeline: get_many_listings
+    yields listing records parsed from stored snapshots, with no browser.
+    """
+
+    def __init__(self, store: SnapshotStore, latest_only: bool = True, parse_pool=None):
+        self.store = store
+        self.latest_only = latest_only
+        # ParsePool for the extraction (default: the shared one)
+        self.parse_pool = parse_pool
+        self.replayed = 0
+
+    @property
+    def concurrency(self) -> int:
+        """Default captures in flight: two per parse worker, so the pool never waits on a read."""
+        return 2 * max(1, (self.parse_pool or get_parse_pool()).workers)
+
+    async def get_many_listings(self, urls=None, concurrency=None):
+        """
+        Yields one listing record per stored capture of `urls` (a list, an async
+        iterable, or None for every stored URL), in the same shape as the scraper's,
+        as soon as each is parsed. At most `concurrency` captures are read and
+        parsed at once (default: self.concurrency).
+        """
+        if urls is not None and hasattr(urls, "__aiter__"):
+            urls = [url async for url in urls]
+        # Ordered set: O(1) lookups, and missing URLs are reported in input order
+        wanted = None if urls is None else dict.fromkeys(u.strip() for u in urls if u and u.strip())
+        parse_pool = self.parse_pool or get_parse_pool()
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def replay_one(entry):
+            async with semaphore:
+                return await self._replay(entry, parse_pool)
+
+        found = set()
+        tasks = []
+        for entry in self.store.entries(latest_only=self.latest_only):
+            if wanted is not None and entry["url"] not in wanted:
+                continue
+            found.add(entry["url"])
+            tasks.append(asyncio.create_task(replay_one(entry)))
+        try:
+            for next_record in asyncio.as_completed(tasks):
+                record = await next_record
+                self.replayed += 1
+                yield record
+        finally:
+            # Consumer stopped early: don't leave reads and parses behind
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for url in wanted or ():
+            if url not in found:
+                yield {"url": url, "error": "No stored snapshot", "error_type": "LookupError", "elapsed_s": 0.0}
+
+    async def _replay(self, entry, parse_pool):
+        """The listing record of one stored capture (an error record on failure)."""
+        started = time.perf_counter()
+        try:
+            # Decompression and parsing are CPU work: keep them off the event loop
+            html = await asyncio.to_thread(self.store.read, entry)
+            listing = await parse_pool.parse(html)
+            record = {
+                "title": listing["title"],
+                "price_str": listing["price_str"],
+                "raw_text": listing["raw_text"][:RAW_TEXT_MAX_CHARS],
+                "url": entry["url"],
+                "extracted_from": listing["source"],
+                "snapshot": entry["sha256"],
+                "fetched_at": entry["fetched_at"],
+            }
+        except Exception as e:
+            record = {"url": entry["url"], "error": str(e) or type(e).__name__, "error_type": type(e).__name__}
+        record["elapsed_s"] = round(time.perf_counter() - started, 3)
+        return record
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Raw listing page snapshots.")
+    parser.add_argument("--root", default=SNAPSHOT_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    list_cmd = sub.add_parser("list", help="List stored captures")
+    list_cmd.add_argument("--url")
+    export = sub.add_parser("export", help="Write the latest capture of a URL as an HTML file (e.g. a test fixture)")
+    export.add_argument("url")
+    export.add_argument("dest")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.root)
+    if args.command == "list":
+        for entry in store.entries(url=args.url):
+            print(f"{entry['fetched_at']}  {entry['sha256'][:12]}  {entry['size'] // 1024:>5} KB  {entry['url']}")
+        stats = store.stats()
+        print(f"{stats['captures']} captures of {stats['urls']} URLs, {stats['unique_pages']} unique pages, "
+              f"{stats['html_bytes'] // 1024} KB of HTML stored in {stats['stored_bytes'] // 1024} KB")
+    elif args.command == "export":
+        entry = store.latest(args.url)
+        if entry is None:
+            raise SystemExit(f"No snapshot of {args.url}")
+        with open(args.dest, "w", encoding="utf-8") as f:
+            f.write(store.read(entry))
+        print(f"Wrote {entry['url']} ({entry['fetched_at']}) to {args.dest}")
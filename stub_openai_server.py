@@ -0,0 +1,306 @@
+"""
+stub_openai_server.py
+Local stand-in for the OpenAI chat completions API, for load-testing the
+analyzer (concurrency, retries, batching) without network or tokens.
+
+    python stub_openai_server.py --port 8900 --latency-ms 800 --jitter-ms 400 \\
+        --error-rate 0.05 --rate-limit-rate 0.1 --rpm 120
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 python main.py --replay --analyze-workers 8
+
+POST /v1/chat/completions answers in the OpenAI response format. The parts
+list is built from the listing in the prompt (component rules of
+local_analysis.py, used prices from price_fetcher), so answers look like real
+appraisals; batched prompts ("### Listing L1" sections) get one result per
+listing. Failures are injected on request:
+
+- latency-ms / jitter-ms: response delay (uniform in latency +/- jitter)
+- error-rate:             fraction of requests answered with a 500
+- rate-limit-rate:        fraction answered with a 429 and a Retry-After header
+- rpm:                    requests over this many per rolling minute get a 429
+- drop-rate:              fraction of listings left out of a batched answer
+
+In code (tests, bench_suite.py), StubSettings can also fix the answer to
+every prompt (`answer`) and script the next replies as (status, delay_s)
+pairs (`script`), e.g. [(429, 0), (503, 0)] before the normal answers.
+"""
+
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+from local_analysis import analyze_locally
+from price_fetcher import USED_PART_DISCOUNT, get_rule_engine
+
+
+DEFAULT_PORT = 8900
+DEFAULT_MODEL = "gpt-4o"
+# Delay the 429 answers ask for
+DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+_SINGLE_TITLE_RE = re.compile(r"^\s*Listing Title:\s*(.*)$", re.MULTILINE)
+_SINGLE_PRICE_RE = re.compile(r"^\s*Listing Price \(extracted\):\s*([\d.]+)", re.MULTILINE)
+_SINGLE_TEXT_RE = re.compile(r"^\s*Listing Text:\s*\n(.*)$", re.MULTILINE | re.DOTALL)
+_BATCH_SECTION_RE = re.compile(
+    r"^### Listing (\S+)\nTitle: ([^\n]*)\nPrice \(extracted\): ([\d.]+) EUR[^\n]*\nText:\n(.*?)(?=^### Listing |\Z)",
+    re.MULTILINE | re.DOTALL,
+)
+# Wording the real model turns into a TRASH verdict ("aucune panne" is not one)
+_BROKEN_RE = re.compile(r"\b(?:h\.?s\b|(?<!aucune )(?<!sans )panne|broken|pour pi[eè]ces)", re.IGNORECASE)
+
+
+class StubSettings:
+    """Latency and failure injection of a StubOpenAIServer (mutable while it runs)."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit_rate=0.0, rpm=None,
+                 retry_after=DEFAULT_RETRY_AFTER_SECONDS, drop_rate=0.0, seed=None, answer=None, script=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.drop_rate = drop_rate
+        self.rng = random.Random(seed)
+        # JSON object returned for every prompt instead of a generated appraisal
+        self.answer = answer
+        # (status, delay_s) of the next replies, consumed before the injected failures apply
+        self.script = list(script or [])
+
+
+def appraise(title: str, listing_price: float, raw_text: str) -> Dict:
+    """A model-style appraisal of one listing: parts recognised by the component rules, priced used."""
+    engine = get_rule_engine()
+    local, _ = analyze_locally({"title": title, "raw_text": raw_text}, listing_price)
+    parts = []
+    for part in (local or {}).get("parts", []):
+        new_price, _ = engine.classify(part["component"])
+        parts.append({
+            "component": part["component"],
+            "estimated_price": round(new_price * (1 - USED_PART_DISCOUNT)),
+            "notes": "",
+        })
+    total = sum(part["estimated_price"] for part in parts)
+    profit = total - listing_price
+    margin = round(profit / listing_price * 100, 1) if listing_price > 0 else 0
+
+    if _BROKEN_RE.search(f"{title}\n{raw_text}"):
+        verdict, reasoning = "TRASH", "The listing describes a broken or faulty machine."
+    elif listing_price > 0 and profit / listing_price > 0.5:
+        verdict, reasoning = "BUY", f"Parts resell for about {total} EUR, {margin}% over the asking price."
+    else:
+        verdict, reasoning = "PASS", f"Parts resell for about {total} EUR: not enough margin."
+    return {
+        "is_gaming_pc": bool(local and local["is_gaming_pc"]),
+        "listing_price": listing_price,
+        "parts": parts,
+        "total_estimated_value": total,
+        "profit_potential": profit,
+        "profit_percentage": margin,
+        "verdict": verdict,
+        "reasoning": reasoning,
+    }
+
+
+def answer_prompt(prompt: str, drop_rate: float = 0.0, rng: Optional[random.Random] = None) -> Dict:
+    """The JSON object the model would return for an analyzer prompt (single or batched)."""
+    rng = rng or random
+    sections = _BATCH_SECTION_RE.findall(prompt)
+    if sections:
+        results = []
+        for item_id, title, price, text in sections:
+            if drop_rate and rng.random() < drop_rate:
+                continue
+            results.append(dict(appraise(title.strip(), float(price), text.strip()), id=item_id))
+        return {"results": results}
+
+    title = _SINGLE_TITLE_RE.search(prompt)
+    price = _SINGLE_PRICE_RE.search(prompt)
+    text = _SINGLE_TEXT_RE.search(prompt)
+    return appraise(title.group(1).strip() if title else "", float(price.group(1)) if price else 0.0,
+                    text.group(1).strip() if text else "")
+
+
+class StubOpenAIServer(ThreadingHTTPServer):
+    """HTTP server for the stub API; counts what it answered in `counts`."""
+
+    daemon_threads = True
+
+    def __init__(self, address, settings: Optional[StubSettings] = None):
+        super().__init__(address, _StubHandler)
+        self.settings = settings or StubSettings()
+        self.counts = {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "in_flight": 0, "max_in_flight": 0}
+        self._lock = threading.Lock()
+        self._recent = deque()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def next_reply(self):
+        """(status code to fail this request with or None to answer it, delay in seconds)."""
+        with self._lock:
+            if self.settings.script:
+                status, delay = self.settings.script.pop(0)
+                self.counts["requests"] += 1
+                status = None if status == 200 else status
+                key = "ok" if status is None else "rate_limited" if status == 429 else "errors"
+                self.counts[key] += 1
+                return status, delay
+        return self.decide(), self.delay()
+
+    def decide(self) -> Optional[int]:
+        """Status code to fail this request with, or None to answer it."""
+        settings = self.settings
+        now = time.monotonic()
+        with self._lock:
+            self.counts["requests"] += 1
+            if settings.rpm:
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= settings.rpm:
+                    self.counts["rate_limited"] += 1
+                    return 429
+                self._recent.append(now)
+            roll = settings.rng.random()
+            if roll < settings.rate_limit_rate:
+                self.counts["rate_limited"] += 1
+                return 429
+            if roll < settings.rate_limit_rate + settings.error_rate:
+                self.counts["errors"] += 1
+                return 500
+            self.counts["ok"] += 1
+            return None
+
+    def delay(self) -> float:
+        settings = self.settings
+        with self._lock:
+            jitter = settings.rng.uniform(-settings.jitter_ms, settings.jitter_ms) if settings.jitter_ms else 0.0
+        return max(0.0, settings.latency_ms + jitter) / 1000
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in two writes: with Nagle, each reply would wait ~40ms for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str, error_type: str, headers: Optional[Dict] = None):
+        self._send_json(status, {"error": {"message": message, "type": error_type, "param": None, "code": None}},
+                        headers)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length)
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, f"Unknown path {self.path}", "invalid_request_error")
+            return
+        try:
+            request = json.loads(raw or b"{}")
+            messages: List[Dict] = request["messages"]
+        except (ValueError, KeyError, TypeError):
+            self._send_error(400, "Expected a JSON body with 'messages'", "invalid_request_error")
+            return
+
+        server: StubOpenAIServer = self.server
+        with server._lock:
+            server.counts["in_flight"] += 1
+            server.counts["max_in_flight"] = max(server.counts["max_in_flight"], server.counts["in_flight"])
+        try:
+            self._reply(server, request, messages)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client gave up (e.g. its timeout) before the reply
+        finally:
+            with server._lock:
+                server.counts["in_flight"] -= 1
+
+    def _reply(self, server, request, messages):
+        failure, delay = server.next_reply()
+        time.sleep(delay)
+        if failure == 429:
+            self._send_error(429, "Rate limit reached (stub)", "requests",
+                             {"Retry-After": f"{server.settings.retry_after:g}"})
+            return
+        if failure is not None:
+            error_type = "invalid_request_error" if failure < 500 else "server_error"
+            self._send_error(failure, f"Stub error {failure}", error_type)
+            return
+
+        prompt = "\n".join(str(m.get("content", "")) for m in messages if isinstance(m, dict))
+        with server._lock:
+            answer = server.settings.answer or answer_prompt(prompt, server.settings.drop_rate, server.settings.rng)
+        content = json.dumps(answer, ensure_ascii=False)
+        prompt_tokens = len(prompt) // 4
+        completion_tokens = len(content) // 4
+        self._send_json(200, {
+            "id": f"chatcmpl-stub-{uuid.uuid4().hex[:24]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model") or DEFAULT_MODEL,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def log_message(self, format, *args):
+        pass # Per-request lines would drown the load test output
+
+
+def start_server(port: int = 0, host: str = "127.0.0.1", settings: Optional[StubSettings] = None) -> StubOpenAIServer:
+    """Starts a stub server in a daemon thread (port 0 picks a free port); stop it with shutdown()."""
+    server = StubOpenAIServer((host, port), settings)
+    threading.Thread(target=server.serve_forever, args=(0.05,), name="stub-openai", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stub of the OpenAI chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of requests failing with a 429")
+    parser.add_argument("--rpm", type=int, help="Requests per rolling minute before every request gets a 429")
+    parser.add_argument("--retry-after", type=float, default=DEFAULT_RETRY_AFTER_SECONDS,
+                        help="Retry-After of the 429 answers (seconds)")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Fraction of listings missing from batched answers")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    settings = StubSettings(args.latency_ms, args.jitter_ms, args.error_rate, args.rate_limit_rate, args.rpm,
+                            args.retry_after, args.drop_rate, args.seed)
+    server = StubOpenAIServer((args.host, args.port), settings)
+    print(f"Stub OpenAI API on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Answered {server.counts['ok']} of {server.counts['requests']} requests "
+              f"({server.counts['rate_limited']} rate limited, {server.counts['errors']} errors)")
@@ -7,9 +7,13 @@ import unittest
 import json
 import os
 import tempfile
+import time
 from unittest.mock import patch, MagicMock
 
-from analyzer import AntigravityAnalyzer
+from openai import AsyncOpenAI, BadRequestError
+
+from analyzer import AnalysisCache, AntigravityAnalyzer
+from stub_openai_server import StubSettings, start_server
 
 
 class TestAnalyzerPriceParsing(unittest.TestCase):
@@ -308,5 +312,377 @@ class TestAnalyzerRobustness(unittest.TestCase):
         self.assertEqual(result['verdict'], 'PASS')
 
 
+def _mock_response(payload):
+    response = MagicMock()
+    response.choices[0].message.content = payload if isinstance(payload, str) else json.dumps(payload)
+    return response
+
+
+class TestAnalysisCache(unittest.TestCase):
+    """Test suite for the content-hash analysis cache."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_path = os.path.join(self.temp_dir, "analysis_cache.json")
+        self.listing = {'title': 'Gaming PC', 'price_str': '500', 'raw_text': 'RTX 3060, 16GB DDR4'}
+        self.model_answer = {
+            "is_gaming_pc": True,
+            "listing_price": 500,
+            "parts": [{"component": "Mystery part", "estimated_price": 900, "notes": ""}],
+            "verdict": "BUY",
+            "reasoning": "Test"
+        }
+
+    def tearDown(self):
+        """Clean up test fixtures."""
+        import shutil
+        shutil.rmtree(self.temp_dir)
+
+    def test_key_ignores_whitespace_and_case(self):
+        """Test that cosmetic text changes map to the same key."""
+        other = dict(self.listing, raw_text="  rtx 3060,\n 16gb   DDR4 ")
+        self.assertEqual(AnalysisCache.key_for(self.listing), AnalysisCache.key_for(other))
+        changed = dict(self.listing, price_str='450')
+        self.assertNotEqual(AnalysisCache.key_for(self.listing), AnalysisCache.key_for(changed))
+
+    @patch('analyzer.estimate_component_price')
+    @patch('analyzer.client')
+    def test_hit_skips_model_call_but_recomputes(self, mock_client, mock_estimate):
+        """Test that a cache hit reuses the answer and still reprices the parts."""
+        mock_client.chat.completions.create.return_value = _mock_response(self.model_answer)
+        mock_estimate.return_value = {'estimated_used_price_eur': 900, 'category': 'Other'}
+        analyzer = AntigravityAnalyzer(cache=AnalysisCache(self.cache_path))
+
+        first = analyzer.analyze_profitability(self.listing)
+        # Part prices changed since the first scan
+        mock_estimate.return_value = {'estimated_used_price_eur': 300, 'category': 'Other'}
+        second = analyzer.analyze_profitability(dict(self.listing))
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+        self.assertEqual(first['profit_potential'], 400)
+        self.assertEqual(second['total_estimated_value'], 300)
+        self.assertEqual(second['profit_potential'], -200)
+        self.assertEqual(analyzer.cache.stats()['hits'], 1)
+        self.assertEqual(analyzer.cache.stats()['misses'], 1)
+
+    @patch('analyzer.client')
+    def test_unparseable_answers_are_not_cached(self, mock_client):
+        """Test that a malformed model answer is retried next time."""
+        mock_client.chat.completions.create.return_value = _mock_response("Not valid JSON")
+        analyzer = AntigravityAnalyzer(cache=AnalysisCache(self.cache_path))
+        analyzer.analyze_profitability(self.listing)
+        analyzer.analyze_profitability(self.listing)
+        self.assertEqual(mock_client.chat.completions.create.call_count, 2)
+        self.assertEqual(len(analyzer.cache), 0)
+
+    def test_ttl_expiry(self):
+        """Test that expired entries count as misses and are dropped."""
+        cache = AnalysisCache(self.cache_path, ttl_seconds=60)
+        cache.put("k", {"verdict": "PASS"})
+        with patch('analyzer.time.time', return_value=time.time() + 61):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(len(cache), 0)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first."""
+        cache = AnalysisCache(self.cache_path, max_entries=2)
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+        cache.get("a")
+        cache.put("c", {"n": 3})
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), {"n": 1})
+        self.assertEqual(cache.get("c"), {"n": 3})
+
+    def test_persists_across_instances(self):
+        """Test that stored answers survive a reload."""
+        cache = AnalysisCache(self.cache_path)
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+
+        reloaded = AnalysisCache(self.cache_path)
+        self.assertEqual(reloaded.get("a"), {"n": 1})
+        self.assertEqual(reloaded.get("b"), {"n": 2})
+        self.assertEqual(reloaded.stats()['hits'], 2)
+
+    def test_put_appends_instead_of_rewriting(self):
+        """Test that each put adds one journal line and a reload keeps the last answer per key."""
+        cache = AnalysisCache(self.cache_path)
+        cache.put("a", {"n": 1})
+        cache.put("b", {"n": 2})
+        cache.put("a", {"n": 3})
+        with open(self.cache_path, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 3)
+        reloaded = AnalysisCache(self.cache_path)
+        self.assertEqual(reloaded.get("a"), {"n": 3})
+        self.assertEqual(len(reloaded), 2)
+
+    def test_superseded_lines_are_compacted(self):
+        """Test that the journal is rewritten once superseded lines pile up."""
+        cache = AnalysisCache(self.cache_path, max_entries=5)
+        for n in range(300):
+            cache.put(f"k{n % 10}", {"n": n})
+        with open(self.cache_path, encoding="utf-8") as f:
+            self.assertLessEqual(len(f.readlines()), 106)
+        reloaded = AnalysisCache(self.cache_path, max_entries=5)
+        self.assertEqual(len(reloaded), 5)
+        self.assertEqual(reloaded.get("k9"), {"n": 299})
+
+    def test_reads_former_single_object_format(self):
+        """Test that a cache file written by earlier versions still loads."""
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": [["a", {"stored_at": time.time(), "result": {"n": 1}}]]}, f)
+        cache = AnalysisCache(self.cache_path)
+        cache.put("b", {"n": 2})
+        reloaded = AnalysisCache(self.cache_path)
+        self.assertEqual((reloaded.get("a"), reloaded.get("b")), ({"n": 1}, {"n": 2}))
+
+    def test_returned_answers_are_copies(self):
+        """Test that mutating a returned answer does not corrupt the cache."""
+        cache = AnalysisCache(self.cache_path)
+        cache.put("k", {"parts": [{"component": "RTX 3060"}]})
+        cache.get("k")["parts"].clear()
+        self.assertEqual(len(cache.get("k")["parts"]), 1)
+
+
+class TestPromptCompaction(unittest.TestCase):
+    """Test suite for the listing text sent to the model."""
+
+    @patch('analyzer.client')
+    def test_prompt_carries_compacted_text(self, mock_client):
+        """Test that page chrome never reaches the model and savings are counted."""
+        mock_client.chat.completions.create.return_value = _mock_response({"parts": [], "verdict": "PASS"})
+        analyzer = AntigravityAnalyzer()
+        analyzer.analyze_profitability({
+            'title': 'PC Gamer',
+            'price_str': '600',
+            'raw_text': "Se connecter\nMes recherches\nRTX 3070, Ryzen 5 5600X\nRTX 3070, Ryzen 5 5600X\nPlan du site",
+        })
+        prompt = mock_client.chat.completions.create.call_args.kwargs['messages'][0]['content']
+        self.assertIn("RTX 3070, Ryzen 5 5600X", prompt)
+        self.assertEqual(prompt.count("RTX 3070, Ryzen 5 5600X"), 1)
+        self.assertNotIn("Se connecter", prompt)
+        self.assertGreater(analyzer.tokens_saved, 0)
+
+    @patch('analyzer.client')
+    def test_compaction_can_be_disabled(self, mock_client):
+        """Test that token_budget=None sends the scraped text unchanged."""
+        mock_client.chat.completions.create.return_value = _mock_response({"parts": [], "verdict": "PASS"})
+        AntigravityAnalyzer(token_budget=None).analyze_profitability(
+            {'title': 'PC', 'price_str': '600', 'raw_text': "Se connecter\nRTX 3070"})
+        prompt = mock_client.chat.completions.create.call_args.kwargs['messages'][0]['content']
+        self.assertIn("Se connecter\nRTX 3070", prompt)
+
+
+class TestAsyncAnalysis(unittest.IsolatedAsyncioTestCase):
+    """Test suite for analyze_profitability_async against a local stub server."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        answer = {
+            "is_gaming_pc": True,
+            "listing_price": 500,
+            "parts": [{"component": "Mystery part", "estimated_price": 800, "notes": ""}],
+            "verdict": "BUY",
+            "reasoning": "Test"
+        }
+        self.server = start_server(settings=StubSettings(answer=answer, retry_after=0))
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.listing = {'title': 'Gaming PC', 'price_str': '500', 'raw_text': 'Test'}
+
+    def make_analyzer(self, **kwargs):
+        client = AsyncOpenAI(api_key="test", base_url=self.server.base_url, max_retries=0)
+        kwargs.setdefault("backoff_base", 0.01)
+        return AntigravityAnalyzer(async_client=client, **kwargs)
+
+    @patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 800})
+    async def test_single_analysis(self, _):
+        """Test that the async path parses and finalizes like the sync one."""
+        result = await self.make_analyzer().analyze_profitability_async(self.listing)
+        self.assertEqual(result['total_estimated_value'], 800)
+        self.assertEqual(result['profit_potential'], 300)
+        self.assertEqual(result['verdict'], 'BUY')
+
+    @patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 800})
+    async def test_retries_rate_limits_and_server_errors(self, _):
+        """Test that 429 and 5xx replies are retried until a success."""
+        self.server.settings.script = [(429, 0.0), (503, 0.0), (500, 0.0)]
+        analyzer = self.make_analyzer(max_retries=3)
+        result = await analyzer.analyze_profitability_async(self.listing)
+        self.assertEqual(result['verdict'], 'BUY')
+        self.assertEqual(self.server.counts['requests'], 4)
+        self.assertEqual(analyzer.retries, 3)
+
+    async def test_gives_up_after_max_retries(self):
+        """Test that persistent failures surface after max_retries attempts."""
+        self.server.settings.script = [(503, 0.0)] * 5
+        analyzer = self.make_analyzer(max_retries=2)
+        with self.assertRaises(Exception):
+            await analyzer.analyze_profitability_async(self.listing)
+        self.assertEqual(self.server.counts['requests'], 3)
+
+    async def test_client_errors_are_not_retried(self):
+        """Test that a 400 fails immediately."""
+        self.server.settings.script = [(400, 0.0)]
+        with self.assertRaises(BadRequestError):
+            await self.make_analyzer().analyze_profitability_async(self.listing)
+        self.assertEqual(self.server.counts['requests'], 1)
+
+    @patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 800})
+    async def test_timeouts_are_retried(self, _):
+        """Test that a hung request is cut off by the per-call timeout and retried."""
+        self.server.settings.script = [(200, 1.0)]
+        analyzer = self.make_analyzer(timeout=0.2, max_retries=1)
+        started = time.perf_counter()
+        result = await analyzer.analyze_profitability_async(self.listing)
+        self.assertEqual(result['verdict'], 'BUY')
+        self.assertEqual(self.server.counts['requests'], 2)
+        self.assertLess(time.perf_counter() - started, 0.9)
+
+    @patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 800})
+    async def test_many_listings_in_parallel(self, _):
+        """Test that analyses overlap up to max_concurrency, without threads."""
+        self.server.settings.script = [(200, 0.1)] * 8
+        analyzer = self.make_analyzer(max_concurrency=4)
+        listings = [dict(self.listing, title=f"PC {i}") for i in range(8)]
+
+        started = time.perf_counter()
+        results = await analyzer.analyze_many_async(listings)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual([r['verdict'] for r in results], ['BUY'] * 8)
+        self.assertEqual(self.server.counts['max_in_flight'], 4)
+        # Two waves of 100ms instead of eight
+        self.assertLess(elapsed, 0.6)
+
+    async def test_failures_stay_in_their_slot(self):
+        """Test that one failed listing does not sink the whole batch."""
+        self.server.settings.script = [(400, 0.0)]
+        analyzer = self.make_analyzer(max_concurrency=1)
+        with patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 800}):
+            results = await analyzer.analyze_many_async([self.listing, dict(self.listing, title="Other")])
+        self.assertIsInstance(results[0], BadRequestError)
+        self.assertEqual(results[1]['verdict'], 'BUY')
+
+
+class FakeAsyncClient:
+    """Async chat-completions client answering through a handler(prompt) -> content string."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.prompts = []
+        self.chat = self
+        self.completions = self
+
+    async def create(self, messages, **kwargs):
+        prompt = messages[0]['content']
+        self.prompts.append(prompt)
+        return _mock_response(self.handler(prompt))
+
+
+def _batch_answer(prompt, skip=(), verdicts=None):
+    """Answers every '### Listing Ln' section of a batched prompt, except the ids in skip."""
+    import re
+    ids = re.findall(r"^### Listing (L\d+)$", prompt, re.MULTILINE)
+    return {"results": [
+        {"id": item_id, "listing_price": 500, "parts": [{"component": "Part", "estimated_price": 100}],
+         "verdict": (verdicts or {}).get(item_id, "PASS"), "reasoning": item_id}
+        for item_id in ids if item_id not in skip
+    ]}
+
+
+class TestBatchedAnalysis(unittest.IsolatedAsyncioTestCase):
+    """Test suite for packing several listings into one model request."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.listings = [{'title': f'PC {i}', 'price_str': '500', 'raw_text': f'RTX 30{i}0'} for i in range(5)]
+        patcher = patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_one_request_per_batch(self):
+        """Test that listings share requests and results come back in input order."""
+        client = FakeAsyncClient(lambda prompt: _batch_answer(prompt, verdicts={"L2": "TRASH"}))
+        analyzer = AntigravityAnalyzer(async_client=client)
+        results = await analyzer.analyze_batch_async(self.listings, batch_size=3)
+
+        self.assertEqual(len(client.prompts), 2)
+        self.assertEqual(client.prompts[0].count("Task:"), 1)
+        self.assertIn("### Listing L3", client.prompts[0])
+        self.assertEqual([r['reasoning'] for r in results], ["L1", "L2", "L3", "L1", "L2"])
+        self.assertEqual(results[1]['verdict'], 'TRASH')
+        # The usual per-listing post-processing ran on each result
+        self.assertEqual(results[0]['total_estimated_value'], 100)
+        self.assertEqual(results[0]['profit_potential'], -400)
+        self.assertEqual(analyzer.batch_requests, 2)
+
+    async def test_batch_size_below_one_analyzes_one_by_one(self):
+        """Test that a batch size of 0 still gives every listing a result."""
+        client = FakeAsyncClient(lambda prompt: {"parts": [], "verdict": "PASS", "reasoning": "single"})
+        analyzer = AntigravityAnalyzer(async_client=client)
+        results = await analyzer.analyze_batch_async(self.listings[:2], batch_size=0)
+
+        self.assertEqual([r['reasoning'] for r in results], ["single", "single"])
+        self.assertEqual(len(client.prompts), 2)
+
+    async def test_missing_items_are_retried_alone(self):
+        """Test that an item left out of the batch answer gets its own request."""
+        def handler(prompt):
+            if "### Listing" in prompt:
+                return _batch_answer(prompt, skip={"L2"})
+            return {"parts": [], "verdict": "PASS", "reasoning": "single"}
+
+        client = FakeAsyncClient(handler)
+        analyzer = AntigravityAnalyzer(async_client=client)
+        results = await analyzer.analyze_batch_async(self.listings[:3], batch_size=3)
+
+        self.assertEqual(len(client.prompts), 2)
+        self.assertIn("Listing Title: PC 1", client.prompts[1])
+        self.assertEqual([r['reasoning'] for r in results], ["L1", "single", "L3"])
+        self.assertEqual(analyzer.batch_item_retries, 1)
+
+    async def test_unparseable_batch_falls_back_to_single_requests(self):
+        """Test that a garbled batch answer degrades to one request per listing."""
+        def handler(prompt):
+            if "### Listing" in prompt:
+                return "not json"
+            return {"parts": [], "verdict": "BUY", "reasoning": "single"}
+
+        client = FakeAsyncClient(handler)
+        analyzer = AntigravityAnalyzer(async_client=client)
+        results = await analyzer.analyze_batch_async(self.listings[:2], batch_size=2)
+        self.assertEqual(len(client.prompts), 3)
+        self.assertEqual([r['reasoning'] for r in results], ["single", "single"])
+
+    async def test_item_failures_stay_in_their_slot(self):
+        """Test that a listing whose retry fails does not sink its batch."""
+        def handler(prompt):
+            if "### Listing" in prompt:
+                return _batch_answer(prompt, skip={"L1"})
+            raise ValueError("bad request")
+
+        analyzer = AntigravityAnalyzer(async_client=FakeAsyncClient(handler))
+        results = await analyzer.analyze_batch_async(self.listings[:2], batch_size=2)
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(results[1]['reasoning'], "L2")
+
+    def test_split_batch_output_ignores_unknown_and_duplicate_ids(self):
+        """Test that stray entries in a batched answer are dropped."""
+        analyzer = AntigravityAnalyzer()
+        response = _mock_response({"results": [
+            {"id": "L1", "parts": [], "verdict": "PASS"},
+            {"id": "L1", "parts": [], "verdict": "BUY"},
+            {"id": "L9", "parts": []},
+            {"id": "L2", "parts": "RTX 3060"},
+            "garbage",
+        ]})
+        answers = analyzer._split_batch_output(response, ["L1", "L2"])
+        self.assertEqual(answers, {"L1": {"parts": [], "verdict": "PASS"}})
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,102 @@
+"""
+test_component_rules.py
+Unit tests for the compiled component rules (component_rules.py).
+"""
+
+import json
+import os
+import random
+import tempfile
+import unittest
+
+import price_fetcher
+from component_rules import DEFAULT_RULES_FILE, KeywordAutomaton, RuleEngine, load_rule_engine
+from bench_rules import legacy_categorize_component, legacy_estimate_price_from_name, make_names
+
+
+class TestKeywordAutomaton(unittest.TestCase):
+    """Test suite for the Aho-Corasick keyword matcher."""
+
+    def test_finds_overlapping_keywords(self):
+        """Test that overlapping and nested keywords are all reported."""
+        automaton = KeywordAutomaton(["he", "she", "his", "hers", "core i", "i7", "rx"])
+        matches = {(start, end, automaton.keywords[k]) for start, end, k in automaton.iter_matches("ushers")}
+        self.assertEqual(matches, {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")})
+
+        hits = {automaton.keywords[k] for k in automaton.find("intel core i7-13700k")}
+        self.assertEqual(hits, {"core i", "i7"})
+
+    def test_no_match(self):
+        """Test that unrelated text gives no hits."""
+        automaton = KeywordAutomaton(["rtx 3060"])
+        self.assertEqual(automaton.find("rtx 306 / 3060"), set())
+
+
+class TestRuleEngine(unittest.TestCase):
+    """Test suite for the compiled price/category rules."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.engine = load_rule_engine()
+
+    def test_matches_former_if_elif_chains(self):
+        """Test that the rules file reproduces the old hand-written heuristics."""
+        with open(DEFAULT_RULES_FILE, "r", encoding="utf-8") as f:
+            config = json.load(f)
+        names = make_names(config, 3000, random.Random(7)) + [
+            "Corsair 1000W PSU", "Seasonic 850W power", "Corsair RM750W psu", "Seasonic Focus power supply",
+            "NZXT H510 Case", "Noctua NH-D15 Cooler", "Kingston 128GB DDR4", "Samsung 980 Pro 1TB NVMe",
+        ]
+        for name in names:
+            self.assertEqual(
+                self.engine.classify(name),
+                (legacy_estimate_price_from_name(name), legacy_categorize_component(name)),
+                name,
+            )
+
+    def test_first_matching_rule_wins(self):
+        """Test rule order and AND-of-OR groups."""
+        engine = RuleEngine({
+            "default_price": 1,
+            "default_category": "Misc",
+            "price_rules": [
+                {"match": [["widget"], ["pro", "max"]], "price": 30},
+                {"match": [["widget"]], "price": 10},
+            ],
+            "category_rules": [{"match": [["widget"]], "category": "Gadget"}],
+        })
+        self.assertEqual(engine.classify("Widget Max"), (30, "Gadget"))
+        self.assertEqual(engine.classify("Widget"), (10, "Gadget"))
+        self.assertEqual(engine.classify("Gizmo"), (1, "Misc"))
+
+    def test_match_reports_model_keywords(self):
+        """Test that match() tells specific model rules from generic ones."""
+        self.assertEqual(self.engine.match("RTX 3060 12GB")["model_keywords"], ["rtx 3060"])
+        self.assertEqual(self.engine.match("Radeon graphics")["model_keywords"], [])
+        self.assertTrue(self.engine.match("Radeon graphics")["matched"])
+        self.assertTrue(self.engine.match("Programme")["matched"])
+        self.assertFalse(self.engine.match("Programme", word_start=True)["matched"])
+
+    def test_rules_reload_from_file(self):
+        """Test that price_fetcher picks up an edited rules file."""
+        temp_dir = tempfile.mkdtemp()
+        original_rules_file = price_fetcher.RULES_FILE
+        try:
+            path = os.path.join(temp_dir, "rules.json")
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({
+                    "price_rules": [{"match": [["rtx 5090"]], "price": 2500}],
+                    "category_rules": [{"match": [["rtx"]], "category": "GPU"}],
+                }, f)
+            price_fetcher.reload_rules(path)
+            self.assertEqual(price_fetcher._estimate_price_from_name("RTX 5090"), 2500)
+            self.assertEqual(price_fetcher._categorize_component("RTX 5090"), "GPU")
+        finally:
+            price_fetcher.reload_rules(original_rules_file)
+            import shutil
+            shutil.rmtree(temp_dir)
+        self.assertEqual(price_fetcher._estimate_price_from_name("RTX 4090"), 1800)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+"""
+test_crawler.py
+Unit tests for search-result parsing and URL discovery (crawler.py).
+"""
+
+import asyncio
+import json
+import os
+import unittest
+from urllib.parse import parse_qs, urlparse
+
+from crawler import SEARCH_READY_SELECTOR, SearchCrawler, build_search_url, parse_search_results
+from listing_parser import NEXT_DATA_RE
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TestSearchUrl(unittest.TestCase):
+    """Test suite for search URL building."""
+
+    def test_filters_and_pagination(self):
+        """Test the category, text, price range, location and page parameters."""
+        url = build_search_url("rtx 3060", page=3, price_max=800, locations="Paris")
+        params = parse_qs(urlparse(url).query)
+        self.assertEqual(params["category"], ["15"])
+        self.assertEqual(params["text"], ["rtx 3060"])
+        self.assertEqual(params["price"], ["min-800"])
+        self.assertEqual(params["locations"], ["Paris"])
+        self.assertEqual(params["page"], ["3"])
+
+    def test_first_page_has_no_page_parameter(self):
+        """Test the plain category search."""
+        params = parse_qs(urlparse(build_search_url()).query)
+        self.assertNotIn("page", params)
+        self.assertNotIn("price", params)
+
+
+class TestParseSearchResults(unittest.TestCase):
+    """Test suite for result-card extraction."""
+
+    def test_page_state(self):
+        """Test ad ids, URLs and card prices from the page state."""
+        result = parse_search_results(html=load_fixture("search_next_data.html"))
+        self.assertEqual(result["source"], "next_data")
+        self.assertEqual(result["max_pages"], 1)
+        self.assertEqual([c["ad_id"] for c in result["cards"]], ["3101000001", "3101000002", "3101000003", "3101000004"])
+        self.assertEqual([c["price_str"] for c in result["cards"]], ["650", "2900", "240", ""])
+        self.assertEqual(result["cards"][0]["url"], "https://www.leboncoin.fr/ad/ordinateurs/3101000001")
+
+    def test_state_text_from_the_browser(self):
+        """Test the path used by the scraper, which evaluates the state script only."""
+        state = NEXT_DATA_RE.search(load_fixture("search_next_data.html")).group(1)
+        result = parse_search_results(next_data=state)
+        self.assertEqual(len(result["cards"]), 4)
+
+    def test_markup_fallback(self):
+        """Test cards read from the markup, with repeated ads listed once."""
+        result = parse_search_results(html=load_fixture("search_html_only.html"))
+        self.assertEqual(result["source"], "html")
+        self.assertEqual(
+            [(c["ad_id"], c["title"], c["price_str"]) for c in result["cards"]],
+            [
+                ("3102000001", "PC gamer RTX 2070 Super", "480"),
+                ("3102000002", "Config RTX 3080 32 Go", "1150"),
+                ("3102000003", "PC à donner", ""),
+            ],
+        )
+
+
+class FakeSearchScraper:
+    """Serves search pages by page number; pages past the end repeat the last one."""
+
+    def __init__(self, pages, failures=None):
+        self.pages = pages
+        # page number -> loads of it that fail (like a goto timeout or an anti-bot page)
+        self.failures = dict(failures or {})
+        self.requested = []
+
+    async def fetch_search_page(self, url, ready_selector):
+        assert ready_selector == SEARCH_READY_SELECTOR
+        self.requested.append(url)
+        page = int(parse_qs(urlparse(url).query).get("page", ["1"])[0])
+        if self.failures.get(page):
+            self.failures[page] -= 1
+            raise TimeoutError("Timeout 30000ms exceeded")
+        state = self.pages[min(page, len(self.pages)) - 1]
+        return {"url": url, "next_data": state, "html": None}
+
+
+def search_state(ads, max_pages=None):
+    search = {"ads": [{"list_id": ad_id, "subject": f"PC {ad_id}", "price": [price],
+                       "url": f"https://www.leboncoin.fr/ad/ordinateurs/{ad_id}"} for ad_id, price in ads]}
+    if max_pages:
+        search["max_pages"] = max_pages
+    return json.dumps({"props": {"pageProps": {"searchData": search}}})
+
+
+class TestSearchCrawler(unittest.TestCase):
+    """Test suite for streaming discovery."""
+
+    def crawl(self, crawler, **kwargs):
+        async def collect():
+            return [url async for url in crawler.discover(**kwargs)]
+        return asyncio.run(collect())
+
+    def test_price_prefilter_and_pagination(self):
+        """Test that only new ads under the threshold are queued, across pages."""
+        scraper = FakeSearchScraper([
+            search_state([(1, 300), (2, 1500), (3, 450)]),
+            search_state([(3, 450), (4, 200)]),
+            search_state([(5, 900)]),
+        ])
+        crawler = SearchCrawler(scraper, max_price=500, max_pages=10, page_interval=0)
+        urls = self.crawl(crawler, query="rtx")
+        self.assertEqual([u.rsplit("/", 1)[1] for u in urls], ["1", "3", "4"])
+        stats = crawler.stats()
+        # The 4th request repeats page 3: no new ads, so the crawl stops
+        self.assertEqual(stats["pages"], 4)
+        self.assertEqual((stats["over_price"], stats["duplicates"], stats["queued"]), (2, 2, 3))
+        self.assertIn("price=min-500", scraper.requested[0])
+
+    def test_stops_at_last_page_and_page_cap(self):
+        """Test the max_pages stop conditions."""
+        scraper = FakeSearchScraper([search_state([(1, 100)], max_pages=1), search_state([(2, 100)])])
+        self.assertEqual(len(self.crawl(SearchCrawler(scraper, page_interval=0))), 1)
+
+        scraper = FakeSearchScraper([search_state([(n, 100)]) for n in range(1, 6)])
+        self.assertEqual(len(self.crawl(SearchCrawler(scraper, max_pages=2, page_interval=0))), 2)
+
+    def test_result_pages_parsed_in_parse_pool(self):
+        """Test that result pages are parsed through the parse pool, not on the event loop."""
+        class RecordingPool:
+            calls = []
+
+            async def run(self, fn, *args):
+                RecordingPool.calls.append(fn.__name__)
+                return fn(*args)
+
+        scraper = FakeSearchScraper([search_state([(1, 100)], max_pages=1)])
+        urls = self.crawl(SearchCrawler(scraper, page_interval=0, parse_pool=RecordingPool()))
+        self.assertEqual(len(urls), 1)
+        self.assertEqual(RecordingPool.calls, ["parse_search_results"])
+
+    def test_failed_page_is_retried_once(self):
+        """Test that a result page failing once is loaded again."""
+        scraper = FakeSearchScraper([search_state([(1, 100)]), search_state([(2, 100)], max_pages=2)],
+                                    failures={2: 1})
+        crawler = SearchCrawler(scraper, page_interval=0)
+        self.assertEqual(len(self.crawl(crawler)), 2)
+        self.assertEqual(crawler.stats()["failed_pages"], 0)
+
+    def test_failing_page_stops_pagination_without_raising(self):
+        """Test that a page failing every try ends the crawl, keeping the ads found before it."""
+        scraper = FakeSearchScraper([search_state([(1, 100)]), search_state([(2, 100)]), search_state([(3, 100)])],
+                                    failures={2: 5})
+        crawler = SearchCrawler(scraper, page_interval=0)
+        urls = self.crawl(crawler)
+        self.assertEqual([u.rsplit("/", 1)[1] for u in urls], ["1"])
+        self.assertEqual((crawler.stats()["pages"], crawler.stats()["failed_pages"]), (1, 1))
+        self.assertEqual(len(scraper.requested), 3)
+        self.assertIn("Timeout", crawler.errors[0][1])
+
+    def test_streams_before_next_page(self):
+        """Test that URLs are yielded as soon as their page is parsed."""
+        scraper = FakeSearchScraper([search_state([(1, 100)]), search_state([(2, 100)])])
+        crawler = SearchCrawler(scraper, page_interval=0)
+
+        async def first():
+            async for url in crawler.discover():
+                return url
+        self.assertTrue(asyncio.run(first()).endswith("/1"))
+        self.assertEqual(len(scraper.requested), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
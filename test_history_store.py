@@ -0,0 +1,217 @@
+"""
+test_history_store.py
+Unit tests for the append-only scan history and the data.js export (history_store.py).
+"""
+
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from history_store import DATA_JS_PREFIX, INDEXES_PREFIX, SHARD_CALLBACK, HistoryIndex, HistoryStore
+
+
+def make_entry(n, verdict="PASS"):
+    # Saved without part categories, as the model-only parts lists of earlier versions
+    return {"id": f"2026-01-01T10:00:{n:02d}", "url": f"https://www.leboncoin.fr/ad/ordinateurs/{n}",
+            "title": f"PC {n}", "price": 100 + n, "profit": n, "margin": 1.0, "verdict": verdict,
+            "parts": [{"component": "RTX 3060", "estimated_price": 200}, {"component": "16GB DDR4", "estimated_price": 30}]}
+
+
+class TestHistoryStore(unittest.TestCase):
+    """Test suite for the JSON Lines journal."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.tmp.name, "history.jsonl")
+        self.data_js = os.path.join(self.tmp.name, "data.js")
+        self.store = HistoryStore(self.history, data_file=self.data_js)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_append_writes_one_line_per_result(self):
+        """Test that saving appends without rewriting earlier entries."""
+        self.store.append(make_entry(1))
+        self.store.append(make_entry(2))
+        with open(self.history, "r", encoding="utf-8") as f:
+            lines = f.readlines()
+        self.assertEqual([json.loads(line)["title"] for line in lines], ["PC 1", "PC 2"])
+
+    def test_concurrent_appends_are_not_lost(self):
+        """Test that parallel persist workers keep every entry intact."""
+        threads = [threading.Thread(target=self.store.append, args=(make_entry(n),)) for n in range(40)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(e["price"] for e in self.store.entries()), [100 + n for n in range(40)])
+
+    def test_torn_line_is_skipped_and_next_entry_kept(self):
+        """Test recovery from a run killed in the middle of a write."""
+        self.store.append(make_entry(1))
+        with open(self.history, "a", encoding="utf-8") as f:
+            f.write('{"id": "2026-01-01T10:00:02", "title": "PC')
+        store = HistoryStore(self.history, data_file=self.data_js)
+        store.append(make_entry(3))
+        self.assertEqual([e["title"] for e in store.entries()], ["PC 1", "PC 3"])
+
+    def test_legacy_data_js_is_imported(self):
+        """Test that history saved in data.js by earlier versions is kept."""
+        with open(self.data_js, "w", encoding="utf-8") as f:
+            f.write(f"{DATA_JS_PREFIX}{json.dumps([make_entry(1), make_entry(2)], indent=4)};")
+        self.store.append(make_entry(3))
+        self.assertEqual([e["title"] for e in self.store.entries()], ["PC 1", "PC 2", "PC 3"])
+
+
+class TestHistoryIndex(unittest.TestCase):
+    """Test suite for the incrementally maintained sort orders and aggregates."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.history = os.path.join(self.tmp.name, "history.jsonl")
+        self.store = HistoryStore(self.history, os.path.join(self.tmp.name, "history_data"),
+                                  data_file=os.path.join(self.tmp.name, "data.js"))
+        self.entries = [
+            dict(make_entry(0, "PASS"), date="2026-01-03 10:00", profit=-20, margin=-10.0),
+            dict(make_entry(1, "BUY"), date="2026-01-01 10:00", profit=300, margin=75.0),
+            dict(make_entry(2, "BUY"), date="2026-01-02 10:00", profit=150, margin=90.0,
+                 parts=[{"component": "Ryzen 7 7800X3D", "estimated_price": 250, "category": "CPU"},
+                        {"component": "GTX 1050", "estimated_price": 40, "category": "GPU"}]),
+            dict(make_entry(3, "TRASH"), date="2026-01-04 10:00", profit=0, margin=0.0),
+        ]
+        for entry in self.entries:
+            self.store.append(entry)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_sort_orders(self):
+        """Test the precomputed orders (highest first, newest first)."""
+        index = self.store.index()
+        self.assertEqual(index.order("date"), [3, 0, 2, 1])
+        self.assertEqual(index.order("profit"), [1, 2, 3, 0])
+        self.assertEqual(index.order("margin"), [2, 1, 3, 0])
+
+    def test_aggregates(self):
+        """Test counts per verdict, mean margin and best deals per category."""
+        stats = self.store.stats()
+        self.assertEqual(stats["count"], 4)
+        self.assertEqual(stats["verdicts"], {"PASS": 1, "BUY": 2, "TRASH": 1})
+        self.assertEqual(stats["mean_margin"], 38.75)
+        self.assertEqual(stats["best_profit"], 300)
+        self.assertEqual([deal["profit"] for deal in stats["best_deals"]["GPU"]], [300, 0, -20])
+        self.assertEqual([deal["title"] for deal in stats["best_deals"]["CPU"]], ["PC 2"])
+
+    def test_checkpoint_of_another_version_is_rejected(self):
+        """Test that a checkpoint keyed the old way (Leboncoin URL category) is not reused."""
+        state = self.store.index().to_dict()
+        state.pop("version")
+        with self.assertRaises(ValueError):
+            HistoryIndex.from_dict(state)
+
+    def test_checkpoint_catches_up_with_journal(self):
+        """Test that a reloaded index picks up entries saved after its checkpoint."""
+        self.store.export_shards()
+        with open(self.history, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(make_entry(4, "BUY"), profit=500, margin=20.0)) + "\n")
+        store = HistoryStore(self.history, self.store.export_dir, data_file=self.store.data_file)
+        self.assertEqual(store.index().order("profit")[0], 4)
+        self.assertEqual(store.stats()["count"], 5)
+
+    def test_incremental_index_matches_rebuild(self):
+        """Test that the index kept up to date on save equals one built from the journal."""
+        for n in range(5, 30):
+            self.store.append(dict(make_entry(n), profit=(n * 37) % 101, margin=float(n % 7)))
+        rebuilt = HistoryStore(self.history, data_file=self.store.data_file).index()
+        rebuilt_from_scratch = HistoryIndex()
+        for entry in self.store.entries():
+            rebuilt_from_scratch.add(entry)
+        for field in ("date", "profit", "margin"):
+            self.assertEqual(self.store.index().order(field), rebuilt_from_scratch.order(field))
+            self.assertEqual(rebuilt.order(field), rebuilt_from_scratch.order(field))
+        self.assertEqual(self.store.stats(), rebuilt_from_scratch.stats())
+
+    def test_export_writes_sort_orders(self):
+        """Test that the dashboard gets the orders and the aggregates."""
+        self.store.export_shards()
+        with open(os.path.join(self.store.export_dir, "indexes.js"), "r", encoding="utf-8") as f:
+            content = f.read()
+        orders = json.loads(content.replace(INDEXES_PREFIX, "", 1).strip().rstrip(";"))
+        self.assertEqual(orders["profit"], [1, 2, 3, 0])
+        self.assertEqual(self.store.read_manifest()["totals"]["mean_margin"], 38.75)
+
+
+def read_shard(path):
+    """Entries of an exported shard file (a SHARD_CALLBACK(index, [...]) call)."""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    return json.loads(content[content.index("[", len(SHARD_CALLBACK)):].strip().rstrip(";").rstrip(")"))
+
+
+class TestShardedExport(unittest.TestCase):
+    """Test suite for the dashboard export (manifest + shards)."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.export_dir = os.path.join(self.tmp.name, "history_data")
+        self.store = HistoryStore(os.path.join(self.tmp.name, "history.jsonl"), self.export_dir, shard_size=3,
+                                  data_file=os.path.join(self.tmp.name, "data.js"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def shard_entries(self):
+        manifest = self.store.read_manifest()
+        return [read_shard(os.path.join(self.export_dir, shard["file"])) for shard in manifest["shards"]]
+
+    def test_export_splits_into_shards(self):
+        """Test that entries are split in journal order, with totals in the manifest."""
+        entries = [make_entry(n, "BUY" if n % 2 else "PASS") for n in range(7)]
+        for entry in entries:
+            self.store.append(entry)
+        self.assertEqual(self.store.export_shards(), 3)
+        self.assertEqual(self.shard_entries(), [entries[0:3], entries[3:6], entries[6:7]])
+
+        manifest = self.store.read_manifest()
+        self.assertEqual(manifest["totals"]["count"], 7)
+        self.assertEqual(manifest["totals"]["verdicts"], {"PASS": 4, "BUY": 3})
+        self.assertEqual(manifest["totals"]["best_profit"], 6)
+        self.assertEqual([shard["count"] for shard in manifest["shards"]], [3, 3, 1])
+
+    def test_export_only_rewrites_changed_shards(self):
+        """Test that full shards are left alone and nothing is written when up to date."""
+        for n in range(4):
+            self.store.append(make_entry(n))
+        self.assertEqual(self.store.export_shards(), 2)
+        self.assertEqual(self.store.export_shards(), 0)
+
+        first_shard = os.path.join(self.export_dir, "shard-00000.js")
+        before = os.stat(first_shard).st_mtime_ns
+        for n in range(4, 8):
+            self.store.append(make_entry(n))
+        # The partial shard is completed and one new shard is added
+        self.assertEqual(self.store.export_shards(), 2)
+        self.assertEqual(os.stat(first_shard).st_mtime_ns, before)
+        self.assertEqual([len(chunk) for chunk in self.shard_entries()], [3, 3, 2])
+        self.assertEqual(self.store.read_manifest()["totals"]["count"], 8)
+
+    def test_incremental_export_matches_full_export(self):
+        """Test that exporting as results come in gives the same files as one export."""
+        for n in range(10):
+            self.store.append(make_entry(n))
+            self.store.export_shards()
+        incremental = (self.store.read_manifest(), self.shard_entries())
+        self.store.export_shards(force=True)
+        self.assertEqual((self.store.read_manifest(), self.shard_entries()), incremental)
+
+    def test_empty_history_exports_empty_manifest(self):
+        """Test the export of a history with no results yet."""
+        self.assertEqual(self.store.export_shards(), 0)
+        manifest = self.store.read_manifest()
+        self.assertEqual((manifest["totals"]["count"], manifest["shards"]), (0, []))
+
+
+if __name__ == "__main__":
+    unittest.main()
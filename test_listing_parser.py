@@ -0,0 +1,129 @@
+"""
+test_listing_parser.py
+Unit tests for listing extraction (listing_parser.py) on the saved pages in fixtures/.
+"""
+
+import json
+import os
+import unittest
+
+from listing_parser import (
+    available_parsers,
+    extract_listing,
+    extract_price_from_text,
+    listing_from_json_ld,
+    listing_from_next_data,
+    parse_listing_html,
+    parse_listing_soup,
+    resolve_parser,
+)
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TestParseListingHtml(unittest.TestCase):
+    """Test suite for the embedded-JSON extraction and its fallbacks."""
+
+    def test_next_data_page(self):
+        """Test that the Next.js page state is preferred."""
+        listing = parse_listing_html(load_fixture("listing_next_data.html"))
+        self.assertEqual(listing["source"], "next_data")
+        self.assertEqual(listing["title"], "PC Gamer RTX 3060 Ryzen 5 5600X")
+        self.assertEqual(listing["price_str"], "650")
+        self.assertIn("- Carte graphique : RTX 3060 12 Go\n", listing["raw_text"])
+        self.assertNotIn("Se connecter", listing["raw_text"])
+
+    def test_json_ld_page(self):
+        """Test the schema.org Product/Offer block."""
+        listing = parse_listing_html(load_fixture("listing_json_ld.html"))
+        self.assertEqual(listing["source"], "json_ld")
+        self.assertEqual(listing["title"], "Tour gaming RTX 4070 i7-13700K 32 Go")
+        self.assertEqual(listing["price_str"], "1450")
+        self.assertTrue(listing["raw_text"].startswith("Vends ma tour gaming."))
+
+    def test_markup_only_page_falls_back_to_soup(self):
+        """Test that pages without usable JSON still parse from the DOM."""
+        listing = parse_listing_html(load_fixture("listing_html_only.html"))
+        self.assertEqual(listing["source"], "html")
+        self.assertEqual(listing["title"], "PC portable gamer RTX 4060")
+        self.assertEqual(listing["price_str"], "720")
+
+    def test_paths_agree_on_fixtures(self):
+        """Test that JSON and DOM extraction give the same title and price."""
+        for name in ("listing_next_data.html", "listing_json_ld.html", "listing_html_only.html"):
+            html = load_fixture(name)
+            fast, slow = parse_listing_html(html), parse_listing_soup(html)
+            self.assertEqual((fast["title"], fast["price_str"]), (slow["title"], slow["price_str"]), name)
+
+    def test_broken_state_falls_back(self):
+        """Test that a truncated __NEXT_DATA__ block does not break extraction."""
+        html = load_fixture("listing_next_data.html").replace('"subject"', '"subj', 1)
+        listing = parse_listing_html(html)
+        self.assertEqual(listing["source"], "html")
+        self.assertEqual(listing["price_str"], "650")
+
+
+class TestExtractListing(unittest.TestCase):
+    """Test suite for the picklable extraction entry point and the DOM parser choice."""
+
+    def test_page_bytes(self):
+        """Test that page bytes give the same listing as the page text."""
+        html = load_fixture("listing_json_ld.html")
+        self.assertEqual(extract_listing(html.encode("utf-8")), parse_listing_html(html))
+
+    def test_page_state_text(self):
+        """Test the page state path, and None for a state without an ad."""
+        state = {"props": {"pageProps": {"ad": {"subject": "PC RTX 4070", "body": "Ryzen 7", "price": [900]}}}}
+        listing = extract_listing(next_data=json.dumps(state))
+        self.assertEqual((listing["title"], listing["price_str"], listing["source"]), ("PC RTX 4070", "900", "next_data"))
+        self.assertIsNone(extract_listing(next_data='{"props": {}}'))
+
+    def test_installed_parsers_agree(self):
+        """Test that every installed DOM parser extracts the same listing."""
+        html = load_fixture("listing_html_only.html")
+        expected = parse_listing_soup(html, "html.parser")
+        for parser in available_parsers():
+            listing = parse_listing_soup(html, parser)
+            self.assertEqual((listing["title"], listing["price_str"]), (expected["title"], expected["price_str"]), parser)
+            self.assertIn("RTX", listing["raw_text"], parser)
+
+    def test_unknown_parser(self):
+        """Test that a parser that is not installed is refused."""
+        with self.assertRaises(ValueError):
+            resolve_parser("html5lib-fast")
+
+
+class TestJsonShapes(unittest.TestCase):
+    """Test suite for the JSON walkers."""
+
+    def test_next_data_ad_found_anywhere(self):
+        """Test that the ad is found outside props.pageProps.ad, with cents-only prices."""
+        state = {"props": {"pageProps": {"initialState": {"adview": {"ad": {
+            "subject": " RTX 3080 ", "body": "Comme neuve", "price_cents": 52050}}}}}}
+        self.assertEqual(listing_from_next_data(state),
+                         {"title": "RTX 3080", "price_str": "520.5", "raw_text": "Comme neuve"})
+        self.assertIsNone(listing_from_next_data({"props": {"pageProps": {}}}))
+
+    def test_json_ld_graph_and_offer_list(self):
+        """Test @graph containers and lists of offers."""
+        data = {"@graph": [
+            {"@type": "BreadcrumbList", "name": "Accueil"},
+            {"@type": ["Product"], "name": "PC", "offers": [{"price": "1 200,00"}]},
+        ]}
+        self.assertEqual(listing_from_json_ld(data), {"title": "PC", "price_str": "1200.00", "raw_text": ""})
+        self.assertIsNone(listing_from_json_ld([{"@type": "Organization", "name": "leboncoin"}]))
+
+    def test_extract_price_from_text(self):
+        """Test the euro amount cleaner moved out of the scraper."""
+        self.assertEqual(extract_price_from_text("1 450 €"), "1450")
+        self.assertEqual(extract_price_from_text("Prix : 99,90 €"), "99.90")
+        self.assertEqual(extract_price_from_text("Gratuit"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
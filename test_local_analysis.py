@@ -0,0 +1,122 @@
+"""
+test_local_analysis.py
+Unit tests for offline listing appraisal (local_analysis.py) and its use by the analyzer.
+"""
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import price_fetcher
+from analyzer import AntigravityAnalyzer
+from local_analysis import LOCAL_CONFIDENCE_THRESHOLD, analyze_locally, extract_components
+
+
+WELL_DESCRIBED = {
+    'title': 'PC Gamer RTX 3060',
+    'price_str': '600',
+    'raw_text': "Config : RTX 3060, Ryzen 5 7600X, 16 Go DDR5, SSD 1 To NVMe\nVendu avec clavier.",
+}
+
+
+class TestExtractComponents(unittest.TestCase):
+    """Test suite for component mention extraction."""
+
+    def test_finds_plainly_stated_parts(self):
+        """Test that comma-separated parts are recognised, deduplicated and named cleanly."""
+        components = extract_components(WELL_DESCRIBED['title'], WELL_DESCRIBED['raw_text'])
+        self.assertEqual(
+            [(c['component'], c['category']) for c in components],
+            [("RTX 3060", "GPU"), ("Ryzen 5 7600X", "CPU"), ("16GB DDR5", "RAM"), ("SSD 1TB NVMe", "Storage")],
+        )
+        self.assertEqual(components[0]['model_keywords'], ["rtx 3060"])
+        self.assertEqual(components[1]['model_keywords'], ["ryzen 5 7600x"])
+
+    def test_labels_and_units(self):
+        """Test French labels and Go/To units."""
+        components = extract_components("", "Carte graphique : RTX 4070\nMémoire : 32 Go DDR4")
+        self.assertEqual([c['component'] for c in components], ["RTX 4070", "32GB DDR4"])
+
+    def test_ignores_words_containing_keywords(self):
+        """Test that keywords inside other words ('ram' in 'programme') do not count."""
+        self.assertEqual(extract_components("Bureau", "Programme de fidélité inclus"), [])
+
+
+class TestConfidence(unittest.TestCase):
+    """Test suite for the local confidence score."""
+
+    def test_well_described_listing_is_confident(self):
+        """Test that specific GPU/CPU/RAM/storage mentions clear the threshold."""
+        result, confidence = analyze_locally(WELL_DESCRIBED, 600.0)
+        self.assertGreaterEqual(confidence, LOCAL_CONFIDENCE_THRESHOLD)
+        self.assertTrue(result['is_gaming_pc'])
+        self.assertEqual(len(result['parts']), 4)
+
+    def test_vague_listing_is_not_confident(self):
+        """Test that generic mentions stay below the threshold."""
+        _, confidence = analyze_locally({'title': 'PC gamer', 'raw_text': "Processeur Ryzen, carte graphique GTX"}, 300.0)
+        self.assertLess(confidence, LOCAL_CONFIDENCE_THRESHOLD)
+
+    def test_conflicting_models_lower_confidence(self):
+        """Test that two GPU models (upgrade story, lot) defer to the model."""
+        listing = dict(WELL_DESCRIBED, raw_text=WELL_DESCRIBED['raw_text'] + "\nAncienne carte : RTX 2060 et RTX 3070 en plus")
+        _, confidence = analyze_locally(listing, 600.0)
+        self.assertLess(confidence, LOCAL_CONFIDENCE_THRESHOLD)
+
+    def test_condition_wording_and_missing_price_defer_to_model(self):
+        """Test that broken/for-parts wording or an unknown price gives zero confidence."""
+        broken = dict(WELL_DESCRIBED, raw_text=WELL_DESCRIBED['raw_text'] + "\nCarte graphique HS")
+        self.assertEqual(analyze_locally(broken, 600.0)[1], 0.0)
+        self.assertEqual(analyze_locally(WELL_DESCRIBED, 0.0)[1], 0.0)
+        self.assertEqual(analyze_locally({'title': 'Chaise', 'raw_text': 'Bois'}, 20.0), (None, 0.0))
+
+
+class TestLocalFirstAnalyzer(unittest.TestCase):
+    """Test suite for the analyzer's local-first mode."""
+
+    def setUp(self):
+        # Parts priced for real are looked up in (and saved to) a throwaway cache, not components_cache.csv
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        previous = price_fetcher.set_cache_backend(
+            price_fetcher.CsvComponentCache(os.path.join(self.tmp.name, "cache.csv")))
+        self.addCleanup(price_fetcher.set_cache_backend, previous)
+
+    @patch('analyzer.estimate_component_price', return_value={'estimated_used_price_eur': 200, 'category': 'Other'})
+    @patch('analyzer.client')
+    def test_confident_listing_skips_model(self, mock_client, _):
+        """Test that a confident listing is finalized without a model call."""
+        analyzer = AntigravityAnalyzer(local_threshold=LOCAL_CONFIDENCE_THRESHOLD)
+        result = analyzer.analyze_profitability(WELL_DESCRIBED)
+
+        mock_client.chat.completions.create.assert_not_called()
+        self.assertEqual(result['total_estimated_value'], 800)
+        self.assertEqual(result['listing_price'], 600.0)
+        self.assertEqual(result['profit_potential'], 200)
+        self.assertEqual(result['verdict'], 'PASS')
+        self.assertEqual(analyzer.resolution_stats()['local_fraction'], 1.0)
+
+    @patch('analyzer.client')
+    def test_vague_listing_falls_back_to_model(self, mock_client):
+        """Test that low confidence still asks the model and counts it."""
+        mock_client.chat.completions.create.return_value.choices[0].message.content = '{"parts": [], "verdict": "PASS"}'
+        analyzer = AntigravityAnalyzer(local_threshold=LOCAL_CONFIDENCE_THRESHOLD)
+        analyzer.analyze_profitability({'title': 'PC', 'price_str': '300', 'raw_text': 'Très bon PC de jeu'})
+        analyzer.analyze_profitability(WELL_DESCRIBED)
+
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+        stats = analyzer.resolution_stats()
+        self.assertEqual((stats['local'], stats['model']), (1, 1))
+        self.assertEqual(stats['local_fraction'], 0.5)
+
+    @patch('analyzer.client')
+    def test_local_mode_is_off_by_default(self, mock_client):
+        """Test that the default analyzer always asks the model."""
+        mock_client.chat.completions.create.return_value.choices[0].message.content = '{"parts": [], "verdict": "PASS"}'
+        AntigravityAnalyzer().analyze_profitability(WELL_DESCRIBED)
+        self.assertEqual(mock_client.chat.completions.create.call_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+"""
+test_metrics.py
+Unit tests for the timing spans and counters (metrics.py).
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+import urllib.request
+
+import metrics
+from price_fetcher import CsvComponentCache
+
+
+class MetricsTestCase(unittest.TestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+
+
+class TestRecording(MetricsTestCase):
+    """Test suite for spans and counters."""
+
+    def test_disabled_records_nothing(self):
+        """Test that spans and counters are no-ops until enabled."""
+        with metrics.span("page.goto"):
+            pass
+        metrics.incr("analysis_cache.hits")
+        self.assertEqual(metrics.snapshot(), {"counters": {}, "spans": {}})
+
+    def test_captured_spans_are_replayed(self):
+        """Test that spans captured apart (as in a worker process) land in the stats once replayed."""
+        with metrics.captured_spans() as events:
+            with metrics.span("parse.soup"):
+                pass
+        self.assertEqual([event[0] for event in events], ["parse.soup"])
+        self.assertFalse(metrics.is_enabled())
+        metrics.enable()
+        metrics.record_spans(events)
+        self.assertEqual(metrics.snapshot()["spans"]["parse.soup"]["count"], 1)
+
+    def test_spans_and_counters(self):
+        """Test span counts, errors and counter totals."""
+        metrics.enable()
+        with metrics.span("page.goto"):
+            pass
+        with self.assertRaises(ValueError):
+            with metrics.span("page.goto"):
+                raise ValueError("boom")
+        metrics.incr("openai.prompt_tokens", 120)
+        metrics.incr("openai.prompt_tokens", 30)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["spans"]["page.goto"]["count"], 2)
+        self.assertEqual(snapshot["spans"]["page.goto"]["errors"], 1)
+        self.assertEqual(snapshot["counters"], {"openai.prompt_tokens": 150})
+
+    def test_timed_decorator_sync_and_async(self):
+        """Test that decorated functions keep their results and are timed per call."""
+        @metrics.timed("parse.soup")
+        def parse(html):
+            return html.upper()
+
+        @metrics.timed("openai.completion")
+        async def complete(prompt):
+            return prompt + "!"
+
+        self.assertEqual(parse("a"), "A") # Disabled: plain call
+        metrics.enable()
+        self.assertEqual(parse("b"), "B")
+        self.assertEqual(asyncio.run(complete("hi")), "hi!")
+
+        spans = metrics.snapshot()["spans"]
+        self.assertEqual(spans["parse.soup"]["count"], 1)
+        self.assertEqual(spans["openai.completion"]["count"], 1)
+
+    def test_csv_cache_io_is_timed(self):
+        """Test that the component cache CSV reads and appends are recorded."""
+        metrics.enable()
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = CsvComponentCache(os.path.join(tmp, "cache.csv"))
+            cache.upsert({"component_name": "RTX 3060", "category": "GPU", "estimated_new_price_eur": 300,
+                          "estimated_used_price_eur": 195, "last_updated": "2026-01-01", "source": "test"})
+            CsvComponentCache(cache.path).get("RTX 3060")
+        spans = metrics.snapshot()["spans"]
+        self.assertEqual(spans["price_cache.csv_append"]["count"], 1)
+        self.assertGreaterEqual(spans["price_cache.csv_read"]["count"], 1)
+
+
+class TestExport(MetricsTestCase):
+    """Test suite for the Prometheus text and the JSONL trace."""
+
+    def test_prometheus_text(self):
+        """Test counter and histogram lines."""
+        metrics.enable()
+        metrics.incr("analysis_cache.hits", 3)
+        with metrics.span("page.goto"):
+            pass
+        text = metrics.prometheus_text()
+        self.assertIn("# TYPE lbc_analysis_cache_hits_total counter\nlbc_analysis_cache_hits_total 3\n", text)
+        self.assertIn('lbc_span_duration_seconds_bucket{span="page.goto",le="+Inf"} 1', text)
+        self.assertIn('lbc_span_duration_seconds_count{span="page.goto"} 1', text)
+        self.assertIn('lbc_span_errors_total{span="page.goto"} 0', text)
+
+    def test_http_endpoint(self):
+        """Test that /metrics serves the Prometheus text."""
+        metrics.enable()
+        metrics.incr("scraper.pages")
+        server = metrics.serve(0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+        self.assertIn("lbc_scraper_pages_total 1", body)
+
+    def test_trace_file_and_summary(self):
+        """Test one line per span, a final counters line, and the trace summary."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.jsonl")
+            metrics.enable(trace_path=path)
+            for _ in range(3):
+                with metrics.span("openai.completion"):
+                    pass
+            metrics.incr("openai.requests", 3)
+            metrics.disable()
+
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f]
+            self.assertEqual([e.get("span") for e in events[:3]], ["openai.completion"] * 3)
+            self.assertEqual(events[-1]["counters"], {"openai.requests": 3})
+
+            summary = metrics.summarize_trace(path)
+            self.assertEqual(summary["spans"]["openai.completion"]["count"], 3)
+            self.assertEqual(summary["counters"]["openai.requests"], 3)
+            self.assertTrue(metrics.format_summary(summary)[0].startswith("openai.completion"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+test_parse_pool.py
+Unit tests for listing extraction in worker processes (parse_pool.py).
+"""
+
+import asyncio
+import os
+import unittest
+
+import metrics
+from bench_parser import load_fixtures
+from listing_parser import parse_listing_html
+from parse_pool import ParsePool
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TestParsePool(unittest.IsolatedAsyncioTestCase):
+    """Test suite for ParsePool."""
+
+    async def test_processes_match_inline_parse(self):
+        """Test that worker processes return what the in-process parser does."""
+        with ParsePool(workers=2) as pool:
+            for name in ("listing_next_data.html", "listing_json_ld.html", "listing_html_only.html"):
+                html = load_fixture(name)
+                self.assertEqual(await pool.parse(html.encode("utf-8")), parse_listing_html(html), name)
+            self.assertEqual(pool.parsed, 3)
+
+    async def test_worker_spans_reach_parent_metrics(self):
+        """Test that spans timed in the worker processes are recorded in this one."""
+        metrics.reset()
+        metrics.enable()
+        self.addCleanup(metrics.reset)
+        self.addCleanup(metrics.disable)
+        with ParsePool(workers=1) as pool:
+            await pool.parse(load_fixture("listing_html_only.html"))
+        spans = metrics.snapshot()["spans"]
+        self.assertEqual(spans["parse.listing_html"]["count"], 1)
+        self.assertEqual(spans["parse.soup"]["count"], 1)
+
+    async def test_thread_mode(self):
+        """Test that workers=0 parses in a thread, without processes."""
+        with ParsePool(workers=0) as pool:
+            html = load_fixture("listing_json_ld.html")
+            self.assertEqual(await pool.parse(html), parse_listing_html(html))
+            self.assertIsNone(pool._executor)
+
+    async def test_unrecognized_state_without_page(self):
+        """Test that a page state without an ad gives None (the caller then fetches the page)."""
+        with ParsePool(workers=0) as pool:
+            self.assertIsNone(await pool.parse(next_data='{"props": {"pageProps": {}}}'))
+
+    async def test_event_loop_keeps_running_during_parses(self):
+        """Test that DOM parses of large pages don't stall other coroutines."""
+        page = load_fixtures(page_kb=600)["listing_html_only"]
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        with ParsePool(workers=2) as pool:
+            await pool.parse(page) # Worker start-up is not what is measured
+            task = asyncio.create_task(ticker())
+            await asyncio.sleep(0)
+            ticks = 0
+            results = await asyncio.gather(*(pool.parse(page) for _ in range(4)))
+            task.cancel()
+        self.assertTrue(all(r["source"] == "html" for r in results))
+        # Each parse takes hundreds of ms: parsing on the loop would leave no room for ticks
+        self.assertGreater(ticks, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
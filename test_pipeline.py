@@ -0,0 +1,247 @@
+"""
+test_pipeline.py
+Unit tests for the batch scrape -> analyze -> persist pipeline.
+"""
+
+import asyncio
+import time
+import unittest
+
+from pipeline import BatchPipeline, percentile
+from seen_listings import SeenListings
+
+
+class FakeScraper:
+    """Yields a listing dict (or an error record for URLs containing 'bad')."""
+
+    def __init__(self):
+        self.concurrency = None
+
+    async def get_many_listings(self, urls, concurrency=None):
+        self.concurrency = concurrency
+        async for url in _aiter(urls):
+            await asyncio.sleep(0)
+            if "bad" in url:
+                yield {"url": url, "error": "boom", "error_type": "RuntimeError", "elapsed_s": 0.01}
+            else:
+                yield {"url": url, "title": "PC", "price_str": "100", "raw_text": "RTX 3060", "elapsed_s": 0.02}
+
+
+async def _aiter(items):
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+        return
+    for item in items:
+        yield item
+
+
+class FakeAnalyzer:
+    def __init__(self, delay=0.0, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.calls = 0
+
+    def analyze_profitability(self, data):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.fail_on and self.fail_on in data["url"]:
+            raise RuntimeError("rate limited")
+        return {"verdict": "PASS", "listing_price": 100.0}
+
+
+class FakeAsyncAnalyzer(FakeAnalyzer):
+    """Exposes analyze_profitability_async, which the pipeline should prefer."""
+
+    def __init__(self, delay=0.0):
+        super().__init__()
+        self.async_delay = delay
+        self.async_calls = 0
+
+    async def analyze_profitability_async(self, data):
+        self.async_calls += 1
+        await asyncio.sleep(self.async_delay)
+        return {"verdict": "BUY", "listing_price": 100.0}
+
+
+class FakeBatchAnalyzer(FakeAsyncAnalyzer):
+    """Records the size of each analyze_batch_async call."""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    async def analyze_batch_async(self, listings, batch_size=5):
+        self.batches.append(len(listings))
+        await asyncio.sleep(0.01)
+        return [RuntimeError("bad item") if "/3" in d["url"] else {"verdict": "PASS"} for d in listings]
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_percentile_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile([3.0], 95), 3.0)
+        self.assertEqual(percentile([], 50), 0.0)
+
+
+class TestBatchPipeline(unittest.IsolatedAsyncioTestCase):
+
+    async def test_all_listings_flow_through_stages(self):
+        saved = []
+        pipeline = BatchPipeline(FakeScraper(), FakeAnalyzer(), lambda d, a: saved.append((d["url"], a["verdict"])),
+                                 scrape_workers=3, analyze_workers=2)
+        urls = [f"https://www.leboncoin.fr/ad/ordinateurs/{i}" for i in range(10)]
+        summary = await pipeline.run(urls)
+
+        self.assertEqual(summary["completed"], 10)
+        self.assertEqual(summary["failed"], 0)
+        self.assertEqual(sorted(u for u, _ in saved), sorted(urls))
+        self.assertEqual(pipeline.scraper.concurrency, 3)
+        self.assertEqual(summary["stages"]["analyze"]["processed"], 10)
+        self.assertEqual(summary["stages"]["scrape"]["p50_s"], 0.02)
+        self.assertGreater(summary["listings_per_min"], 0)
+
+    async def test_failures_are_counted_per_stage(self):
+        saved = []
+        pipeline = BatchPipeline(FakeScraper(), FakeAnalyzer(fail_on="/2"), lambda d, a: saved.append(d))
+        urls = ["https://x/ad/1", "https://x/ad/bad", "https://x/ad/2", "https://x/ad/3"]
+        summary = await pipeline.run(urls)
+
+        self.assertEqual(summary["completed"], 2)
+        self.assertEqual(summary["stages"]["scrape"]["failed"], 1)
+        self.assertEqual(summary["stages"]["analyze"]["failed"], 1)
+        self.assertEqual({e[0] for e in pipeline.errors}, {"scrape", "analyze"})
+
+    async def test_failed_save_is_counted_as_failed(self):
+        def persist(data, analysis):
+            if data["url"].endswith("/2"):
+                raise OSError("disk full")
+        pipeline = BatchPipeline(FakeScraper(), FakeAnalyzer(), persist)
+        summary = await pipeline.run(["https://x/ad/1", "https://x/ad/2"])
+
+        self.assertEqual(summary["completed"], 1)
+        self.assertEqual(summary["stages"]["persist"]["failed"], 1)
+        self.assertEqual(pipeline.errors, [("persist", "https://x/ad/2", "disk full")])
+
+    async def test_slow_analysis_runs_off_the_event_loop(self):
+        analyzer = FakeAnalyzer(delay=0.05)
+        pipeline = BatchPipeline(FakeScraper(), analyzer, lambda d, a: None, analyze_workers=4, queue_size=2)
+        urls = [f"https://x/ad/{i}" for i in range(8)]
+
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        beat = asyncio.create_task(heartbeat())
+        started = time.perf_counter()
+        summary = await pipeline.run(urls)
+        elapsed = time.perf_counter() - started
+        beat.cancel()
+
+        self.assertEqual(summary["completed"], 8)
+        # 8 x 50ms analyses over 4 workers should take well under the serial 400ms
+        self.assertLess(elapsed, 0.35)
+        # The loop kept running while analyses were in flight
+        self.assertGreater(ticks, 5)
+
+    async def test_async_analyzer_runs_on_the_loop(self):
+        analyzer = FakeAsyncAnalyzer(delay=0.05)
+        saved = []
+        pipeline = BatchPipeline(FakeScraper(), analyzer, lambda d, a: saved.append(a["verdict"]), analyze_workers=4)
+        started = time.perf_counter()
+        summary = await pipeline.run([f"https://x/ad/{i}" for i in range(8)])
+
+        self.assertEqual(summary["completed"], 8)
+        self.assertEqual(saved, ["BUY"] * 8)
+        self.assertEqual((analyzer.async_calls, analyzer.calls), (8, 0))
+        self.assertLess(time.perf_counter() - started, 0.35)
+
+    async def test_batched_analysis(self):
+        analyzer = FakeBatchAnalyzer()
+        saved = []
+        pipeline = BatchPipeline(FakeScraper(), analyzer, lambda d, a: saved.append(d["url"]),
+                                 analyze_workers=1, queue_size=16, analyze_batch_size=4)
+        urls = [f"https://x/ad/{i}" for i in range(10)]
+        summary = await pipeline.run(urls)
+
+        self.assertEqual(sum(analyzer.batches), 10)
+        self.assertLessEqual(max(analyzer.batches), 4)
+        self.assertLess(len(analyzer.batches), 10)
+        self.assertEqual(summary["completed"], 9)
+        self.assertEqual(summary["stages"]["analyze"]["failed"], 1)
+        self.assertEqual(summary["stages"]["analyze"]["processed"], 10)
+        self.assertNotIn("https://x/ad/3", saved)
+
+
+class TestSeenListings(unittest.IsolatedAsyncioTestCase):
+    """Pipeline runs with a seen-listing index."""
+
+    def make_pipeline(self, analyzer, seen, persisted):
+        return BatchPipeline(FakeScraper(), analyzer, lambda d, a: persisted.append(d["url"]),
+                             scrape_workers=2, analyze_workers=2, seen=seen)
+
+    async def test_repeated_and_recent_ads_are_not_scraped(self):
+        seen = SeenListings(path=None)
+        analyzer, persisted = FakeAnalyzer(), []
+        urls = [f"https://www.leboncoin.fr/ad/ordinateurs/{n}" for n in (1, 2, 1)]
+        urls.append("https://www.leboncoin.fr/ad/ordinateurs/2?utm_source=share")
+        summary = await self.make_pipeline(analyzer, seen, persisted).run(urls)
+        self.assertEqual(analyzer.calls, 2)
+        self.assertEqual(summary["seen"]["skipped_duplicate"], 2)
+
+        # Second run within the re-scrape interval: nothing is scraped
+        seen._claimed.clear()
+        summary = await self.make_pipeline(analyzer, seen, persisted).run(urls[:2])
+        self.assertEqual(summary["stages"]["scrape"]["processed"], 0)
+        self.assertEqual(summary["seen"]["skipped_recent"], 2)
+        self.assertEqual(analyzer.calls, 2)
+
+    async def test_unchanged_listing_skips_analysis(self):
+        seen = SeenListings(path=None, rescrape_after=0)
+        analyzer, persisted = FakeAnalyzer(), []
+        urls = ["https://www.leboncoin.fr/ad/ordinateurs/1"]
+        await self.make_pipeline(analyzer, seen, persisted).run(urls)
+        seen._claimed.clear()
+        summary = await self.make_pipeline(analyzer, seen, persisted).run(urls)
+        self.assertEqual(summary["stages"]["scrape"]["processed"], 1)
+        self.assertEqual(analyzer.calls, 1)
+        self.assertEqual(persisted, urls)
+        self.assertEqual(summary["seen"]["unchanged"], 1)
+        self.assertEqual(summary["seen"]["analyses_avoided"], 1)
+
+    async def test_failed_save_is_retried_next_run(self):
+        seen = SeenListings(path=None, rescrape_after=0)
+        urls = ["https://www.leboncoin.fr/ad/ordinateurs/1"]
+
+        def failing_persist(data, analysis):
+            raise OSError("disk full")
+        await BatchPipeline(FakeScraper(), FakeAnalyzer(), failing_persist, seen=seen).run(urls)
+        self.assertIsNone(seen.get(urls[0]))
+        seen._claimed.clear()
+        analyzer, persisted = FakeAnalyzer(), []
+        await self.make_pipeline(analyzer, seen, persisted).run(urls)
+        self.assertEqual(analyzer.calls, 1)
+        self.assertEqual(persisted, urls)
+
+    async def test_failed_analysis_is_retried_next_run(self):
+        seen = SeenListings(path=None)
+        persisted = []
+        urls = ["https://www.leboncoin.fr/ad/ordinateurs/1"]
+        await self.make_pipeline(FakeAnalyzer(fail_on="ordinateurs"), seen, persisted).run(urls)
+        seen._claimed.clear()
+        analyzer = FakeAnalyzer()
+        await self.make_pipeline(analyzer, seen, persisted).run(urls)
+        self.assertEqual(analyzer.calls, 1)
+        self.assertEqual(persisted, urls)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+"""
+test_preprocess.py
+Unit tests for listing text compaction (preprocess.py).
+"""
+
+import unittest
+
+from preprocess import compact_listing_text, estimate_tokens
+
+
+PAGE_TEXT = """Se connecter
+Déposer une annonce
+Mes recherches
+Accepter & Fermer
+Nous utilisons des cookies pour améliorer votre expérience
+PC Gamer complet
+PC Gamer complet
+Vends mon PC, très peu servi.
+Carte graphique : RTX 3060 12 Go
+Processeur Ryzen 5 5600X
+16 Go DDR4 3200 MHz
+Boitier NZXT H510
+Remise en main propre uniquement à Lyon.
+Paiement en espèces, pas d'échange.
+Annonces similaires
+Chaise de bureau
+Table basse en chêne
+© leboncoin 2006 - 2026
+Plan du site"""
+
+
+class TestCompactListingText(unittest.TestCase):
+    """Test suite for boilerplate removal, relevance filtering and the token budget."""
+
+    def test_drops_boilerplate_and_duplicates(self):
+        """Test that page chrome and repeated lines are removed."""
+        text, stats = compact_listing_text(PAGE_TEXT)
+        lines = text.splitlines()
+        self.assertEqual(lines.count("PC Gamer complet"), 1)
+        for chrome in ("Se connecter", "Déposer une annonce", "Plan du site", "Annonces similaires"):
+            self.assertNotIn(chrome, lines)
+        self.assertNotIn("cookies", text)
+        self.assertEqual(stats["tokens_saved"], stats["tokens_before"] - stats["tokens_after"])
+        self.assertGreater(stats["tokens_saved"], 0)
+
+    def test_keeps_hardware_spans_and_context(self):
+        """Test that hardware lines survive, with neighbours, and unrelated lines do not."""
+        text, _ = compact_listing_text(PAGE_TEXT)
+        for line in ("Carte graphique : RTX 3060 12 Go", "Processeur Ryzen 5 5600X",
+                     "16 Go DDR4 3200 MHz", "Boitier NZXT H510", "Remise en main propre uniquement à Lyon."):
+            self.assertIn(line, text)
+        self.assertNotIn("Table basse", text)
+        self.assertNotIn("Paiement en espèces", text)
+
+    def test_keywords_match_on_word_boundaries(self):
+        """Test that short keywords do not fire inside other words."""
+        text, stats = compact_listing_text("Programme de fidélité\nParamètres du compte\nLivraison\nRTX 3070 comme neuve")
+        self.assertEqual(text, "Livraison\nRTX 3070 comme neuve")
+        self.assertEqual(stats["segments_total"], 4)
+
+    def test_keywords_do_not_match_word_prefixes(self):
+        """Test that a keyword at the start of a longer word ('tour', 'hs') does not fire."""
+        text, _ = compact_listing_text("Tournevis offert\nVirement HSBC accepté\nLivraison\nRTX 3070 comme neuve")
+        self.assertEqual(text, "Livraison\nRTX 3070 comme neuve")
+        text, _ = compact_listing_text("Tournevis offert\nVirement accepté\nLivraison\nCarte défectueuse, artefacts")
+        self.assertEqual(text, "Livraison\nCarte défectueuse, artefacts")
+
+    def test_condition_lines_are_kept(self):
+        """Test that the broken/for-parts wording the verdict relies on is never filtered out."""
+        text, _ = compact_listing_text("Livraison possible\n\nAttention\n\n\nVendu pour pièces, ne démarre plus\n\nMerci")
+        self.assertIn("Vendu pour pièces, ne démarre plus", text)
+
+    def test_token_budget(self):
+        """Test that the budget is enforced, densest hardware lines first, in original order."""
+        text, stats = compact_listing_text(PAGE_TEXT, token_budget=20)
+        self.assertLessEqual(stats["tokens_after"], 20)
+        self.assertIn("16 Go DDR4 3200 MHz", text)
+        lines = text.splitlines()
+        self.assertEqual(lines, [line for line in dict.fromkeys(PAGE_TEXT.splitlines()) if line in lines])
+
+    def test_long_paragraph_is_split(self):
+        """Test that a one-line page dump is filtered sentence by sentence."""
+        filler = "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10
+        text, _ = compact_listing_text(filler + "Config : RTX 4070, Ryzen 7 7700X. " + filler)
+        self.assertIn("RTX 4070", text)
+        self.assertLess(len(text), 200)
+
+    def test_unrecognised_text_is_kept_within_budget(self):
+        """Test that text without any known keyword is not dropped entirely."""
+        text, _ = compact_listing_text("Ordinateur de jeu\nTrès bon état général")
+        self.assertIn("Ordinateur de jeu", text)
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(compact_listing_text("")[0], "")
+
+
+if __name__ == "__main__":
+    unittest.main()
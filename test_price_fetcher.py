@@ -227,6 +227,333 @@ class TestPriceFetcher(unittest.TestCase):
         self.assertEqual(result["estimated_used_price_eur"], expected_used_price)
 
 
+class TestComponentCacheIndex(unittest.TestCase):
+    """Test suite for the in-memory index over the cache CSV."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.original_cache_file = price_fetcher.CACHE_FILE
+        self.temp_dir = tempfile.mkdtemp()
+        price_fetcher.CACHE_FILE = os.path.join(self.temp_dir, "test_index_cache.csv")
+
+    def tearDown(self):
+        """Clean up after tests."""
+        price_fetcher.CACHE_FILE = self.original_cache_file
+        if os.path.exists(self.temp_dir):
+            import shutil
+            shutil.rmtree(self.temp_dir)
+
+    def test_lookups_do_not_reread_unchanged_file(self):
+        """Test that repeated lookups are served from memory."""
+        ensure_cache_exists()
+        save_cache_entry("RTX 3070", "GPU", 500.0)
+        get_cache_entry("RTX 3070")
+
+        with patch("builtins.open", side_effect=AssertionError("cache file re-read")):
+            for _ in range(100):
+                self.assertIsNotNone(get_cache_entry("rtx  3070"))
+                self.assertIsNone(get_cache_entry("RTX 3080"))
+
+    def test_reload_when_file_changes_on_disk(self):
+        """Test that edits made outside the module are picked up."""
+        ensure_cache_exists()
+        save_cache_entry("RTX 3070", "GPU", 500.0)
+        self.assertIsNone(get_cache_entry("Hand Added Cooler"))
+
+        with open(price_fetcher.CACHE_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=price_fetcher.CACHE_FIELDS)
+            writer.writerow({
+                "component_name": "Hand Added Cooler",
+                "category": "Cooler",
+                "estimated_new_price_eur": 60,
+                "estimated_used_price_eur": 39.0,
+                "last_updated": datetime.now().isoformat(),
+                "source": "manual",
+            })
+
+        cached = get_cache_entry("hand added cooler")
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached["source"], "manual")
+
+    def test_returned_rows_are_copies(self):
+        """Test that callers can't corrupt the shared index."""
+        ensure_cache_exists()
+        save_cache_entry("RTX 3070", "GPU", 500.0)
+        get_cache_entry("RTX 3070")["category"] = "Broken"
+        get_all_cached_components()[0]["category"] = "Broken"
+        self.assertEqual(get_cache_entry("RTX 3070")["category"], "GPU")
+
+
+class TestCacheJournal(unittest.TestCase):
+    """Test suite for append-only and write-behind cache writes."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.original_cache_file = price_fetcher.CACHE_FILE
+        self.temp_dir = tempfile.mkdtemp()
+        price_fetcher.CACHE_FILE = os.path.join(self.temp_dir, "test_journal_cache.csv")
+
+    def tearDown(self):
+        """Clean up after tests."""
+        price_fetcher.flush_cache()
+        price_fetcher.CACHE_FILE = self.original_cache_file
+        if os.path.exists(self.temp_dir):
+            import shutil
+            shutil.rmtree(self.temp_dir)
+
+    def _file_rows(self):
+        with open(price_fetcher.CACHE_FILE, "r", newline="", encoding="utf-8") as f:
+            return list(csv.DictReader(f))
+
+    def test_update_is_appended_and_last_row_wins(self):
+        """Test that updates append a row instead of rewriting the file."""
+        ensure_cache_exists()
+        save_cache_entry("RTX 3060", "GPU", 350.0)
+        save_cache_entry("rtx 3060", "GPU", 300.0)
+
+        self.assertEqual(len(self._file_rows()), 2)
+        cached = get_cache_entry("RTX 3060")
+        self.assertEqual(float(cached["estimated_new_price_eur"]), 300.0)
+        # The original name is kept on update
+        self.assertEqual(cached["component_name"], "RTX 3060")
+        self.assertEqual(len(get_all_cached_components()), 1)
+
+    def test_write_behind_flushes_once(self):
+        """Test that write-behind mode buffers entries and writes them in one batch."""
+        ensure_cache_exists()
+        with patch.object(price_fetcher.CsvComponentCache, "_append",
+                          autospec=True, side_effect=price_fetcher.CsvComponentCache._append) as append:
+            with price_fetcher.write_behind():
+                for i in range(8):
+                    save_cache_entry(f"Part {i}", "Other", 10.0 + i)
+                # Buffered entries are visible but not on disk yet
+                self.assertIsNotNone(get_cache_entry("Part 3"))
+                self.assertEqual(self._file_rows(), [])
+            self.assertEqual(append.call_count, 1)
+        self.assertEqual(len(self._file_rows()), 8)
+
+    def test_compaction_is_atomic_and_drops_superseded_rows(self):
+        """Test that the journal is compacted through a temp file + rename."""
+        ensure_cache_exists()
+        with patch.object(price_fetcher, "CACHE_COMPACT_MIN_SUPERSEDED", 5):
+            with patch.object(price_fetcher.os, "replace", wraps=os.replace) as replace:
+                for i in range(10):
+                    save_cache_entry("RTX 3060", "GPU", 300.0 + i)
+                self.assertTrue(replace.called)
+        rows = self._file_rows()
+        self.assertLess(len(rows), 10)
+        self.assertEqual(float(get_cache_entry("RTX 3060")["estimated_new_price_eur"]), 309.0)
+        self.assertEqual(os.listdir(self.temp_dir), ["test_journal_cache.csv"])
+
+    def test_torn_last_line_is_ignored(self):
+        """Test that an interrupted append doesn't break the cache."""
+        ensure_cache_exists()
+        save_cache_entry("RTX 3060", "GPU", 350.0)
+        with open(price_fetcher.CACHE_FILE, "a", encoding="utf-8") as f:
+            f.write("RTX 4090,GPU,18")
+
+        self.assertIsNone(get_cache_entry("RTX 4090"))
+        save_cache_entry("RTX 4070", "GPU", 700.0)
+        self.assertIsNotNone(get_cache_entry("RTX 3060"))
+        self.assertIsNotNone(get_cache_entry("RTX 4070"))
+
+
+class TestSqliteBackend(unittest.TestCase):
+    """Test suite for the SQLite cache backend."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.original_cache_file = price_fetcher.CACHE_FILE
+        self.temp_dir = tempfile.mkdtemp()
+        price_fetcher.CACHE_FILE = os.path.join(self.temp_dir, "test_cache.csv")
+        self.db_path = os.path.join(self.temp_dir, "test_cache.db")
+        self.backend = price_fetcher.SqliteComponentCache(self.db_path)
+        self.previous_backend = price_fetcher.set_cache_backend(self.backend)
+
+    def tearDown(self):
+        """Clean up after tests."""
+        price_fetcher.set_cache_backend(self.previous_backend)
+        self.backend.close()
+        price_fetcher.CACHE_FILE = self.original_cache_file
+        if os.path.exists(self.temp_dir):
+            import shutil
+            shutil.rmtree(self.temp_dir)
+
+    def test_save_and_retrieve_entry(self):
+        """Test the public API on top of SQLite."""
+        save_cache_entry("RTX 4090", "GPU", 1800.0, source="test")
+        cached = get_cache_entry("rtx 4090")
+        self.assertEqual(cached["component_name"], "RTX 4090")
+        self.assertEqual(float(cached["estimated_used_price_eur"]), 1170.0)
+        self.assertFalse(os.path.exists(price_fetcher.CACHE_FILE))
+
+        result = estimate_component_price("RTX 4090")
+        self.assertTrue(result["cached"])
+
+    def test_wal_mode_and_indexes(self):
+        """Test that the database uses WAL and indexes name and last_updated."""
+        save_cache_entry("RTX 4090", "GPU", 1800.0)
+        conn = self.backend._connection()
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        indexes = {row[1] for row in conn.execute("PRAGMA index_list('components')")}
+        self.assertIn("idx_components_last_updated", indexes)
+        plan = " ".join(str(tuple(r)) for r in conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM components WHERE normalized_name = ?", ("rtx 4090",)))
+        self.assertIn("INDEX", plan.upper())
+
+    def test_upsert_many_updates_existing(self):
+        """Test batched upserts keep one row per component."""
+        now = datetime.now().isoformat()
+        rows = [
+            {"component_name": f"Part {i}", "category": "Other", "estimated_new_price_eur": i,
+             "estimated_used_price_eur": i * 0.65, "last_updated": now, "source": "test"}
+            for i in range(50)
+        ]
+        self.backend.upsert_many(rows)
+        self.backend.upsert_many([dict(rows[0], estimated_new_price_eur=999, component_name="PART 0")])
+        self.assertEqual(len(get_all_cached_components()), 50)
+        cached = get_cache_entry("part 0")
+        self.assertEqual(float(cached["estimated_new_price_eur"]), 999.0)
+        self.assertEqual(cached["component_name"], "Part 0")
+
+    def test_paging(self):
+        """Test that results can be paged instead of loaded at once."""
+        with price_fetcher.write_behind():
+            for i in range(25):
+                save_cache_entry(f"Part {i}", "Other", 10.0)
+        pages = list(price_fetcher.iter_cached_components(page_size=10))
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        page = get_all_cached_components(limit=10, offset=20)
+        self.assertEqual([r["component_name"] for r in page], [f"Part {i}" for i in range(20, 25)])
+
+    def test_stale_components_use_last_updated(self):
+        """Test the expiry scan on last_updated."""
+        save_cache_entry("Fresh", "Other", 10.0)
+        old = (datetime.now() - timedelta(days=40)).isoformat()
+        self.backend.upsert_many([{"component_name": "Old", "category": "Other", "estimated_new_price_eur": 1,
+                                   "estimated_used_price_eur": 0.65, "last_updated": old, "source": "test"}])
+        stale = price_fetcher.get_stale_components()
+        self.assertEqual([r["component_name"] for r in stale], ["Old"])
+        self.assertIsNone(get_cache_entry("Old"))
+
+    def test_concurrent_writers(self):
+        """Test that writers in several threads don't lose entries."""
+        import threading
+
+        def worker(n):
+            for i in range(20):
+                save_cache_entry(f"Worker-{n} part-{i}", "Other", 10.0)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(get_all_cached_components()), 80)
+
+    def test_migrate_csv_to_sqlite(self):
+        """Test the one-shot CSV import."""
+        price_fetcher.set_cache_backend(price_fetcher.CsvComponentCache())
+        save_cache_entry("RTX 3060", "GPU", 350.0)
+        save_cache_entry("Ryzen 5 7600x", "CPU", 230.0)
+        price_fetcher.set_cache_backend(self.backend)
+
+        db_path = os.path.join(self.temp_dir, "migrated.db")
+        count = price_fetcher.migrate_csv_to_sqlite(price_fetcher.CACHE_FILE, db_path)
+        self.assertEqual(count, 2)
+
+        migrated = price_fetcher.SqliteComponentCache(db_path)
+        try:
+            self.assertEqual(migrated.get("ryzen 5 7600x")["category"], "CPU")
+            self.assertEqual(len(migrated.rows()), 2)
+        finally:
+            migrated.close()
+
+
+class TestNameMatching(unittest.TestCase):
+    """Test suite for canonical and near-duplicate component name matching."""
+
+    def setUp(self):
+        """Set up test fixtures."""
+        self.original_cache_file = price_fetcher.CACHE_FILE
+        self.temp_dir = tempfile.mkdtemp()
+        price_fetcher.CACHE_FILE = os.path.join(self.temp_dir, "test_names_cache.csv")
+
+    def tearDown(self):
+        """Clean up after tests."""
+        price_fetcher.CACHE_FILE = self.original_cache_file
+        if os.path.exists(self.temp_dir):
+            import shutil
+            shutil.rmtree(self.temp_dir)
+
+    def test_canonical_names(self):
+        """Test token normalization, unit folding and token-set sorting."""
+        normalize = price_fetcher._normalize_name
+        self.assertEqual(normalize("Seasonic 850W 80plus Bronze"), normalize("Seasonic 850 W 80 Plus Bronze"))
+        self.assertEqual(normalize("Seasonic 850W 80+ Bronze"), normalize("seasonic 850w 80 plus bronze"))
+        self.assertEqual(normalize("2x1TB SSD"), normalize("SSD 2x1TB"))
+        self.assertEqual(normalize("SSD 2 x 1 To"), normalize("2x1TB SSD"))
+        self.assertEqual(normalize("16 Go DDR4"), normalize("DDR4 16GB"))
+        self.assertNotEqual(normalize("RTX 3060 Ti"), normalize("RTX 3060"))
+        self.assertNotEqual(normalize("RX 6800 XT"), normalize("RX 6800"))
+
+    def test_exact_lookup_ignores_word_order_and_units(self):
+        """Test that canonical variants hit the same cache entry."""
+        ensure_cache_exists()
+        save_cache_entry("2x1TB SSD", "Storage", 80.0)
+        cached = get_cache_entry("SSD 2 x 1 To")
+        self.assertIsNotNone(cached)
+        self.assertEqual(cached["component_name"], "2x1TB SSD")
+
+    def test_near_duplicate_feeds_estimate(self):
+        """Test that a near-duplicate name is served from the cache instead of a new row."""
+        ensure_cache_exists()
+        save_cache_entry("Seasonic 850W 80plus Bronze", "PSU", 150.0)
+        result = estimate_component_price("SeaSonic 850W 80 Plus Bronze PSU")
+        self.assertTrue(result["cached"])
+        self.assertEqual(result["component_name"], "Seasonic 850W 80plus Bronze")
+        self.assertEqual(len(get_all_cached_components()), 1)
+
+    def test_different_models_never_near_match(self):
+        """Test that names differing in a model token are not merged."""
+        ensure_cache_exists()
+        save_cache_entry("Asus RTX 3060", "GPU", 350.0)
+        self.assertIsNone(price_fetcher.find_similar_cache_entry("Asus RTX 3060 Ti"))
+        self.assertIsNone(price_fetcher.find_similar_cache_entry("Asus RTX 3070"))
+        self.assertIsNone(price_fetcher.find_similar_cache_entry("RTX 3060 12GB"))
+        self.assertIsNotNone(price_fetcher.find_similar_cache_entry("RTX 3060"))
+
+    def test_near_match_on_sqlite(self):
+        """Test near-duplicate lookups through the SQLite model_key index."""
+        backend = price_fetcher.SqliteComponentCache(os.path.join(self.temp_dir, "names.db"))
+        previous = price_fetcher.set_cache_backend(backend)
+        try:
+            save_cache_entry("Seasonic 850W 80plus Bronze", "PSU", 150.0)
+            self.assertEqual(get_cache_entry("Seasonic 850 W 80 Plus Bronze")["component_name"],
+                             "Seasonic 850W 80plus Bronze")
+            self.assertIsNotNone(price_fetcher.find_similar_cache_entry("SeaSonic 850W 80 Plus Bronze PSU"))
+            self.assertIsNone(price_fetcher.find_similar_cache_entry("Seasonic 750W 80 Plus Bronze"))
+        finally:
+            price_fetcher.set_cache_backend(previous)
+            backend.close()
+
+    def test_hit_rate_report(self):
+        """Test the before/after hit rate replay of a cache file."""
+        ensure_cache_exists()
+        for name in ["Seasonic 850W 80plus Bronze", "2x1TB SSD", "RTX 3060"]:
+            save_cache_entry(name, "Other", 50.0)
+        with open(price_fetcher.CACHE_FILE, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=price_fetcher.CACHE_FIELDS)
+            for name in ["Seasonic 850W 80 Plus Bronze", "SSD 2x1TB", "SeaSonic 850W 80 Plus Bronze PSU"]:
+                writer.writerow({"component_name": name, "category": "Other", "estimated_new_price_eur": 50,
+                                 "estimated_used_price_eur": 32.5, "last_updated": datetime.now().isoformat(),
+                                 "source": "test"})
+        report = price_fetcher.measure_name_hit_rate()
+        self.assertEqual(report["lookups"], 6)
+        self.assertEqual(report["exact_hits"], 0)
+        self.assertEqual(report["canonical_hits"], 3)
+
+
 class TestPriceParsingInAnalyzer(unittest.TestCase):
     """Test suite for price parsing logic from analyzer.py."""
 
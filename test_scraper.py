@@ -1,5 +1,471 @@
 import asyncio
-from scraper import AntigravityScraper
+import json
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import scraper
+from listing_parser import NEXT_DATA_RE
+from parse_pool import ParsePool
+from scraper import LISTING_READY_SELECTOR, AntigravityScraper, _DomainRateLimiter, _is_blocked
+from snapshot_store import SnapshotReplayer, SnapshotStore
+
+_real_sleep = asyncio.sleep
+
+
+LISTING_HTML = """
+<html><body>
+<h1>PC Gamer RTX 3060</h1>
+<div data-qa-id="adview_price"><span>450 €</span></div>
+<div data-qa-id="adview_description_container"><p>Ryzen 5 5600X, RTX 3060, 16GB DDR4</p></div>
+</body></html>
+"""
+
+
+# Subresources every fake navigation requests: (url, resource_type, response bytes)
+PAGE_RESOURCES = [
+    ("https://www.leboncoin.fr/_next/static/app.js", "script", 3000),
+    ("https://img.leboncoin.fr/api/v1/photo.jpg", "image", 250000),
+    ("https://www.leboncoin.fr/fonts/brand.woff2", "font", 40000),
+    ("https://www.googletagmanager.com/gtm.js", "script", 90000),
+    ("https://static.criteo.net/js/ld/publishertag.js", "script", 60000),
+]
+
+
+class FakeRequest:
+    def __init__(self, url, resource_type, size):
+        self.url = url
+        self.resource_type = resource_type
+        self.size = size
+
+    async def sizes(self):
+        return {"responseBodySize": self.size, "responseHeadersSize": 100}
+
+
+class FakeRoute:
+    def __init__(self, request):
+        self.request = request
+        self.outcome = None
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def continue_(self):
+        self.outcome = "continued"
+
+
+class FakePage:
+    def __init__(self, html=LISTING_HTML, fail_urls=(), delays=None, context=None, resources=(), ready=True):
+        self.html = html
+        self.fail_urls = set(fail_urls)
+        self.delays = delays or {}
+        self.context = context
+        self.resources = resources
+        self.ready = ready
+        self.closed = False
+        self.visited = []
+        self.clicks = 0
+        self.handlers = {}
+        self.waited_for = []
+
+    def on(self, event, handler):
+        self.handlers.setdefault(event, []).append(handler)
+
+    async def goto(self, url, **kwargs):
+        self.visited.append(url)
+        if url in self.delays:
+            await _real_sleep(self.delays[url])
+        if url in self.fail_urls:
+            raise RuntimeError("Target crashed")
+        for resource in [(url, "document", 20000)] + list(self.resources):
+            request = FakeRequest(*resource)
+            route = FakeRoute(request)
+            if self.context is not None and self.context.route_handler is not None:
+                await self.context.route_handler(route)
+                self.context.routed.append(route)
+            if route.outcome != "aborted":
+                for handler in self.handlers.get("requestfinished", []):
+                    handler(request)
+
+    async def wait_for_selector(self, selector, timeout=None):
+        self.waited_for.append((selector, timeout))
+        if not self.ready:
+            raise TimeoutError(f"Timeout {timeout}ms exceeded")
+
+    async def click(self, selector, timeout=None):
+        self.clicks += 1
+        raise TimeoutError("no banner")
+
+    async def evaluate(self, script):
+        # Like the browser: the __NEXT_DATA__ script text, if the page has one
+        match = NEXT_DATA_RE.search(self.html)
+        return match.group(1) if match else None
+
+    async def content(self):
+        return self.html
+
+    def is_closed(self):
+        return self.closed
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+        self.route_handler = None
+        self.routed = []
+
+    async def route(self, pattern, handler):
+        self.route_handler = handler
+
+    async def new_page(self):
+        page = FakePage(fail_urls=self.browser.fail_urls, delays=self.browser.delays, context=self,
+                        resources=self.browser.resources, ready=self.browser.ready)
+        self.browser.pages.append(page)
+        return page
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowser:
+    def __init__(self, fail_urls=(), delays=None, resources=(), ready=True):
+        self.fail_urls = fail_urls
+        self.delays = delays
+        self.resources = resources
+        self.ready = ready
+        self.contexts = []
+        self.pages = []
+        self.closed = False
+
+    async def new_context(self, **kwargs):
+        context = FakeContext(self)
+        self.contexts.append(context)
+        return context
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePlaywright:
+    """Stands in for async_playwright() so the pool can be tested without Chromium."""
+
+    def __init__(self, fail_urls=(), delays=None, resources=(), ready=True):
+        self.browser = FakeBrowser(fail_urls, delays, resources, ready)
+        self.launches = 0
+        self.stopped = False
+        self.chromium = self
+
+    def __call__(self):
+        return self
+
+    async def start(self):
+        return self
+
+    async def launch(self, **kwargs):
+        self.launches += 1
+        return self.browser
+
+    async def stop(self):
+        self.stopped = True
+
+
+def no_sleep():
+    """Patches out the human-like pause so tests run instantly."""
+    real_sleep = asyncio.sleep
+
+    async def fake_sleep(delay, *args, **kwargs):
+        await real_sleep(0)
+
+    return patch.object(scraper.asyncio, "sleep", fake_sleep)
+
+
+class TestScraperPool(unittest.IsolatedAsyncioTestCase):
+    """Tests for the pooled browser session of AntigravityScraper."""
+
+    async def test_session_reuses_one_browser(self):
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=2) as s:
+                for i in range(5):
+                    data = await s.get_listing_data(f"https://www.leboncoin.fr/ad/ordinateurs/{i}")
+                    self.assertEqual(data["title"], "PC Gamer RTX 3060")
+                    self.assertEqual(data["price_str"], "450")
+        self.assertEqual(fake.launches, 1)
+        self.assertEqual(len(fake.browser.contexts), 1)
+        self.assertTrue(fake.browser.closed)
+        self.assertTrue(fake.stopped)
+        # The cookie banner is only tried once per context
+        self.assertEqual(fake.browser.pages[0].clicks, 1)
+
+    async def test_one_shot_mode_without_session(self):
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            s = AntigravityScraper()
+            data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+        self.assertIsNotNone(data)
+        self.assertFalse(s.is_running)
+        self.assertTrue(fake.browser.closed)
+
+    async def test_pages_recycled_after_max_navigations(self):
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=1, max_navigations_per_page=2) as s:
+                for i in range(5):
+                    await s.get_listing_data(f"https://www.leboncoin.fr/ad/ordinateurs/{i}")
+                stats = s.pool_stats()
+        self.assertEqual(stats["pages_created"], 3)
+        self.assertEqual(stats["pages_recycled"], 2)
+        self.assertEqual(stats["acquisitions"], 5)
+
+    async def test_crashed_page_is_recycled(self):
+        bad_url = "https://www.leboncoin.fr/ad/ordinateurs/666"
+        fake = FakePlaywright(fail_urls={bad_url})
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=1) as s:
+                self.assertIsNone(await s.get_listing_data(bad_url))
+                self.assertIsNotNone(await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1"))
+                stats = s.pool_stats()
+        self.assertEqual(stats["pages_recycled"], 1)
+        self.assertEqual(stats["pages_created"], 2)
+        self.assertTrue(fake.browser.contexts[0].closed)
+
+    async def test_pool_bounds_concurrent_pages(self):
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=2) as s:
+                urls = [f"https://www.leboncoin.fr/ad/ordinateurs/{i}" for i in range(6)]
+                results = await asyncio.gather(*(s.get_listing_data(u) for u in urls))
+                stats = s.pool_stats()
+        self.assertTrue(all(results))
+        self.assertLessEqual(stats["pages_created"], 2)
+        self.assertEqual(stats["acquisitions"], 6)
+
+
+class TestBatchScraping(unittest.IsolatedAsyncioTestCase):
+    """Tests for AntigravityScraper.get_many_listings."""
+
+    async def test_results_stream_as_they_finish(self):
+        slow = "https://www.leboncoin.fr/ad/ordinateurs/1"
+        fast = "https://www.leboncoin.fr/ad/ordinateurs/2"
+        fake = FakePlaywright(delays={slow: 0.2})
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            s = AntigravityScraper(pool_size=2, per_domain_interval=0)
+            urls = [r["url"] async for r in s.get_many_listings([slow, fast], concurrency=2)]
+        self.assertEqual(urls, [fast, slow])
+        self.assertTrue(fake.browser.closed)
+
+    async def test_failed_page_yields_error_record(self):
+        bad = "https://www.leboncoin.fr/ad/ordinateurs/666"
+        good = "https://www.leboncoin.fr/ad/ordinateurs/1"
+        fake = FakePlaywright(fail_urls={bad})
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=2, per_domain_interval=0) as s:
+                records = {r["url"]: r async for r in s.get_many_listings([bad, good])}
+        self.assertEqual(records[bad]["error"], "Target crashed")
+        self.assertEqual(records[bad]["error_type"], "RuntimeError")
+        self.assertEqual(records[good]["title"], "PC Gamer RTX 3060")
+        self.assertNotIn("error", records[good])
+
+    async def test_failing_url_source_keeps_launched_pages(self):
+        urls = [f"https://www.leboncoin.fr/ad/ordinateurs/{n}" for n in range(3)]
+
+        async def source():
+            for url in urls:
+                yield url
+            raise RuntimeError("search page failed")
+
+        fake = FakePlaywright(delays={u: 0.05 for u in urls})
+        records = []
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper(pool_size=3) as s:
+                with self.assertRaises(RuntimeError):
+                    async for record in s.get_many_listings(source()):
+                        records.append(record)
+        self.assertEqual(sorted(r["url"] for r in records), urls)
+        self.assertFalse([r for r in records if "error" in r])
+
+    async def test_accepts_async_iterable(self):
+        async def url_stream():
+            for i in range(4):
+                yield f"https://www.leboncoin.fr/ad/ordinateurs/{i}"
+
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            async with AntigravityScraper(pool_size=2, per_domain_interval=0) as s:
+                records = [r async for r in s.get_many_listings(url_stream(), concurrency=3)]
+        self.assertEqual(len(records), 4)
+
+    async def test_early_exit_cancels_pending_pages(self):
+        urls = [f"https://www.leboncoin.fr/ad/ordinateurs/{i}" for i in range(10)]
+        fake = FakePlaywright(delays={u: 0.05 for u in urls})
+        with patch.object(scraper, "async_playwright", fake), no_sleep():
+            s = AntigravityScraper(pool_size=2, per_domain_interval=0)
+            batch = s.get_many_listings(urls)
+            async for _ in batch:
+                break
+            await batch.aclose()
+        self.assertFalse(s.is_running)
+        self.assertLess(sum(len(p.visited) for p in fake.browser.pages), 10)
+
+    async def test_rate_limiter_spaces_same_domain(self):
+        delays = []
+
+        async def record_sleep(delay, *args, **kwargs):
+            delays.append(round(delay, 2))
+
+        limiter = _DomainRateLimiter(1.0)
+        with patch.object(scraper.asyncio, "sleep", record_sleep):
+            await limiter.wait("https://www.leboncoin.fr/ad/1")
+            await limiter.wait("https://www.leboncoin.fr/ad/2")
+            await limiter.wait("https://www.leboncoin.fr/ad/3")
+            await limiter.wait("https://example.com/other")
+        self.assertEqual(len(delays), 2)
+        self.assertAlmostEqual(delays[0], 1.0, places=1)
+        self.assertAlmostEqual(delays[1], 2.0, places=1)
+
+
+class TestLightweightNavigation(unittest.IsolatedAsyncioTestCase):
+    """Tests for request blocking, selector waits and per-page traffic stats."""
+
+    def test_blocking_rules(self):
+        self.assertTrue(_is_blocked("image", "https://img.leboncoin.fr/a.jpg"))
+        self.assertTrue(_is_blocked("font", "https://www.leboncoin.fr/f.woff2"))
+        self.assertTrue(_is_blocked("script", "https://www.googletagmanager.com/gtm.js"))
+        self.assertTrue(_is_blocked("xhr", "https://bidder.criteo.com/cdb"))
+        self.assertFalse(_is_blocked("script", "https://www.leboncoin.fr/_next/static/app.js"))
+        self.assertFalse(_is_blocked("document", "https://notcriteo.com/"))
+
+    async def test_heavy_and_tracker_requests_are_aborted(self):
+        fake = FakePlaywright(resources=PAGE_RESOURCES)
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper() as s:
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+                stats = s.transfer_stats()
+
+        outcomes = {route.request.url: route.outcome for route in fake.browser.contexts[0].routed}
+        self.assertEqual(outcomes["https://www.leboncoin.fr/ad/ordinateurs/1"], "continued")
+        self.assertEqual(outcomes["https://www.leboncoin.fr/_next/static/app.js"], "continued")
+        self.assertEqual(list(outcomes.values()).count("aborted"), 4)
+        # Only the document and the first-party script were downloaded
+        self.assertEqual(data["page_stats"]["bytes"], 20000 + 3000 + 2 * 100)
+        self.assertEqual(data["page_stats"]["requests"], 2)
+        self.assertEqual(data["page_stats"]["blocked_requests"], 4)
+        self.assertEqual(stats["pages"], 1)
+        self.assertEqual(stats["total_bytes"], 23200)
+
+    async def test_blocking_can_be_disabled(self):
+        fake = FakePlaywright(resources=PAGE_RESOURCES)
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper(block_resources=False) as s:
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+        self.assertIsNone(fake.browser.contexts[0].route_handler)
+        self.assertEqual(data["page_stats"]["requests"], 6)
+        self.assertEqual(data["page_stats"]["blocked_requests"], 0)
+
+    async def test_waits_for_listing_selectors_instead_of_sleeping(self):
+        sleeps = []
+
+        async def record_sleep(delay, *args, **kwargs):
+            sleeps.append(delay)
+
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake), patch.object(scraper.asyncio, "sleep", record_sleep):
+            async with AntigravityScraper(ready_timeout_ms=4000) as s:
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+        self.assertEqual(data["title"], "PC Gamer RTX 3060")
+        self.assertEqual(sleeps, [])
+        self.assertEqual(fake.browser.pages[0].waited_for, [(LISTING_READY_SELECTOR, 4000)])
+
+    async def test_selector_timeout_still_parses_page(self):
+        fake = FakePlaywright(ready=False)
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper() as s:
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+        self.assertEqual(data["price_str"], "450")
+
+    async def test_page_state_skips_dom_serialization(self):
+        state = {"props": {"pageProps": {"ad": {"subject": "PC RTX 4070", "body": "Ryzen 7", "price": [900]}}}}
+        html = f'<html><body><h1>Other</h1><script id="__NEXT_DATA__" type="application/json">{json.dumps(state)}</script></body></html>'
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper() as s:
+                pooled = await s._acquire_page()
+                pooled.page.html = html
+                pooled.page.content = None  # must not be called
+                await s._release_page(pooled)
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+        self.assertEqual((data["title"], data["price_str"], data["raw_text"]), ("PC RTX 4070", "900", "Ryzen 7"))
+        self.assertEqual(data["extracted_from"], "next_data")
+
+    async def test_unrecognized_page_state_falls_back_to_full_page(self):
+        html = LISTING_HTML.replace(
+            "</body>", '<script id="__NEXT_DATA__" type="application/json">{"props": {"pageProps": {}}}</script></body>')
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper(pool_size=1, parse_pool=ParsePool(workers=0)) as s:
+                pooled = await s._acquire_page()
+                pooled.page.html = html
+                await s._release_page(pooled)
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+                visited = pooled.page.visited
+        self.assertEqual((data["title"], data["price_str"]), ("PC Gamer RTX 3060", "450"))
+        self.assertEqual(data["extracted_from"], "html")
+        self.assertEqual(len(visited), 2)
+
+    async def test_traffic_counters_reset_between_listings(self):
+        fake = FakePlaywright(resources=PAGE_RESOURCES)
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper(pool_size=1) as s:
+                await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/1")
+                data = await s.get_listing_data("https://www.leboncoin.fr/ad/ordinateurs/2")
+                stats = s.transfer_stats()
+        self.assertEqual(data["page_stats"]["bytes"], 23200)
+        self.assertEqual(stats["pages"], 2)
+        self.assertEqual(stats["mean_bytes"], 23200)
+
+
+class TestSearchPages(unittest.IsolatedAsyncioTestCase):
+    """Search-result pages fetched on the shared page pool."""
+
+    async def test_fetch_search_page_returns_page_state(self):
+        state = '{"props": {"pageProps": {"searchData": {"ads": []}}}}'
+        fake = FakePlaywright()
+        with patch.object(scraper, "async_playwright", fake):
+            async with AntigravityScraper(pool_size=1) as s:
+                pooled = await s._acquire_page()
+                pooled.page.html = f'<script id="__NEXT_DATA__" type="application/json">{state}</script>'
+                await s._release_page(pooled)
+                page = await s.fetch_search_page("https://www.leboncoin.fr/recherche?category=15", "li")
+        self.assertEqual(page["next_data"], state)
+        self.assertIsNone(page["html"])
+        self.assertEqual(fake.browser.pages[0].waited_for[-1][0], "li")
+
+    async def test_fetch_search_page_needs_a_session(self):
+        with self.assertRaises(RuntimeError):
+            await AntigravityScraper().fetch_search_page("https://www.leboncoin.fr/recherche", "li")
+
+
+class TestSnapshots(unittest.IsolatedAsyncioTestCase):
+    """Raw HTML kept by the scraper and replayed without a browser."""
+
+    async def test_scraped_pages_are_stored_and_replayable(self):
+        with tempfile.TemporaryDirectory() as root:
+            store = SnapshotStore(root)
+            url = "https://www.leboncoin.fr/ad/ordinateurs/1"
+            with patch.object(scraper, "async_playwright", FakePlaywright()):
+                async with AntigravityScraper(snapshot_store=store) as s:
+                    data = await s.get_listing_data(url)
+
+            entry = store.latest(url)
+            self.assertEqual(data["snapshot"], entry["sha256"])
+            self.assertEqual(store.read(entry), LISTING_HTML)
+
+            replayed = [r async for r in SnapshotReplayer(store).get_many_listings([url])]
+        self.assertEqual(len(replayed), 1)
+        for key in ("title", "price_str", "raw_text", "extracted_from"):
+            self.assertEqual(replayed[0][key], data[key])
+
 
 async def test():
     scraper = AntigravityScraper()
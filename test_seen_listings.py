@@ -0,0 +1,96 @@
+"""
+test_seen_listings.py
+Unit tests for the seen-listing index (seen_listings.py).
+"""
+
+import os
+import tempfile
+import unittest
+
+from seen_listings import SAVE_EVERY, SeenListings, ad_id, content_hash
+
+URL = "https://www.leboncoin.fr/ad/ordinateurs/3082027877"
+LISTING = {"url": URL, "title": "PC Gamer RTX 3060", "price_str": "650", "raw_text": "Ryzen 5 5600X, RTX 3060"}
+
+
+class TestAdId(unittest.TestCase):
+    """Test suite for listing keys."""
+
+    def test_ad_id_from_url_variants(self):
+        """Test that tracking parameters and other categories map to the same ad id."""
+        self.assertEqual(ad_id(URL), "3082027877")
+        self.assertEqual(ad_id(URL + "?utm_source=share#photos"), "3082027877")
+        self.assertEqual(ad_id("https://www.leboncoin.fr/ad/informatique/3082027877"), "3082027877")
+
+    def test_other_urls_keyed_without_query(self):
+        """Test the fallback key for URLs without an ad id."""
+        self.assertEqual(ad_id("https://example.com/listing/abc/?ref=1"), "https://example.com/listing/abc")
+
+    def test_content_hash_ignores_whitespace_and_case(self):
+        """Test that cosmetic differences do not count as changes."""
+        reformatted = dict(LISTING, raw_text="  ryzen 5 5600X,\n RTX 3060 ")
+        self.assertEqual(content_hash(LISTING), content_hash(reformatted))
+        self.assertNotEqual(content_hash(LISTING), content_hash(dict(LISTING, price_str="600")))
+
+    def test_content_hash_is_the_analysis_cache_key(self):
+        """Test that the skip logic and the answer cache agree on what "unchanged" means."""
+        from analyzer import AnalysisCache
+        self.assertEqual(content_hash(LISTING), AnalysisCache.key_for(LISTING))
+
+
+class TestSeenListings(unittest.TestCase):
+    """Test suite for the skip/re-scrape decisions."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "seen_listings.json")
+        self.seen = SeenListings(self.path, rescrape_after=3600)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_new_listing_is_scraped_and_analyzed(self):
+        """Test that unknown ads go through."""
+        self.assertTrue(self.seen.should_scrape(URL, now=1000))
+        self.assertTrue(self.seen.has_changed(LISTING, now=1000))
+        self.assertEqual(self.seen.stats()["new"], 1)
+
+    def test_recent_listing_is_not_scraped_until_interval(self):
+        """Test the re-scrape schedule."""
+        self.seen.mark_analyzed(LISTING, now=1000)
+        self.seen.flush()
+        seen = SeenListings(self.path, rescrape_after=3600)
+        self.assertFalse(seen.should_scrape(URL, now=2000))
+        self.assertTrue(seen.should_scrape(URL, now=1000 + 3600))
+        self.assertEqual(seen.stats()["skipped_recent"], 1)
+
+    def test_changes_are_only_written_by_flush(self):
+        """Test that recording changes never writes the file; save_due asks for a flush."""
+        for n in range(SAVE_EVERY):
+            self.assertFalse(self.seen.save_due)
+            self.seen.mark_analyzed(dict(LISTING, url=f"https://www.leboncoin.fr/ad/ordinateurs/{n}"), now=1000)
+        self.assertFalse(os.path.exists(self.path))
+        self.assertTrue(self.seen.save_due)
+        self.seen.flush()
+        self.assertFalse(self.seen.save_due)
+        self.assertEqual(len(SeenListings(self.path)), SAVE_EVERY)
+
+    def test_price_or_description_change_triggers_analysis(self):
+        """Test change detection after a re-scrape."""
+        self.seen.mark_analyzed(LISTING, now=1000)
+        self.assertFalse(self.seen.has_changed(dict(LISTING), now=9000))
+        self.assertTrue(self.seen.has_changed(dict(LISTING, price_str="550"), now=9000))
+        self.assertTrue(self.seen.has_changed(dict(LISTING, raw_text="RTX 3060 HS"), now=9000))
+        stats = self.seen.stats()
+        self.assertEqual((stats["unchanged"], stats["changed"]), (1, 2))
+        self.assertEqual(self.seen.get(URL)["last_scraped"], 9000)
+
+    def test_same_ad_twice_in_a_run(self):
+        """Test that an ad queued twice is scraped once."""
+        self.assertTrue(self.seen.should_scrape(URL))
+        self.assertFalse(self.seen.should_scrape(URL + "?ref=home"))
+        self.assertEqual(self.seen.stats()["scrapes_avoided"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+test_snapshot_store.py
+Unit tests for the raw page snapshot store and replay (snapshot_store.py).
+"""
+
+import asyncio
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from listing_parser import parse_listing_html
+from snapshot_store import SnapshotReplayer, SnapshotStore
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+URL = "https://www.leboncoin.fr/ad/ordinateurs/3082027877"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class TestSnapshotStore(unittest.TestCase):
+    """Test suite for content-addressed storage and the capture index."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.tmp.name, codec="gzip")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        """Test that a stored page reads back unchanged, compressed on disk."""
+        html = load_fixture("listing_next_data.html")
+        entry = self.store.put(URL, html)
+        self.assertEqual(self.store.read(entry), html)
+        blob = os.path.join(self.tmp.name, "blobs", entry["sha256"][:2], entry["sha256"] + ".html.gz")
+        with open(blob, "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()).decode("utf-8"), html)
+        self.assertLess(entry["compressed_size"], entry["size"])
+
+    def test_identical_pages_stored_once(self):
+        """Test that captures of the same HTML share one blob but are all indexed."""
+        html = load_fixture("listing_json_ld.html")
+        first = self.store.put(URL, html, fetched_at="2026-01-01T10:00:00+00:00")
+        second = self.store.put(URL, html, fetched_at="2026-01-02T10:00:00+00:00")
+        self.assertEqual(first["sha256"], second["sha256"])
+        stats = self.store.stats()
+        self.assertEqual((stats["captures"], stats["urls"], stats["unique_pages"]), (2, 1, 1))
+        blob_dir = os.path.join(self.tmp.name, "blobs", first["sha256"][:2])
+        self.assertEqual(len(os.listdir(blob_dir)), 1)
+
+    def test_latest_capture_per_url(self):
+        """Test that the newest capture of a URL wins."""
+        self.store.put(URL, "<h1>old</h1>", fetched_at="2026-01-01T10:00:00+00:00")
+        self.store.put("https://www.leboncoin.fr/ad/ordinateurs/2", "<h1>other</h1>")
+        self.store.put(URL, "<h1>new</h1>", fetched_at="2026-01-02T10:00:00+00:00")
+        self.assertEqual(self.store.read(self.store.latest(URL)), "<h1>new</h1>")
+        self.assertEqual(len(self.store.entries(url=URL)), 2)
+        self.assertEqual(len(self.store.entries(latest_only=True)), 2)
+        self.assertIsNone(self.store.latest("https://www.leboncoin.fr/ad/ordinateurs/404"))
+
+    def test_torn_index_line_is_skipped(self):
+        """Test that a half-written index line does not break reading."""
+        self.store.put(URL, "<h1>ok</h1>")
+        with open(self.store.index_path, "a", encoding="utf-8") as f:
+            f.write('{"url": "https://www.leboncoin.fr/ad/ordi')
+        self.assertEqual(len(self.store.entries()), 1)
+
+    def test_index_is_json_lines(self):
+        """Test the index format: one JSON object per capture."""
+        self.store.put(URL, "<h1>a</h1>")
+        with open(self.store.index_path, "r", encoding="utf-8") as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(set(entry), {"url", "fetched_at", "sha256", "codec", "size", "compressed_size"})
+
+    def test_unknown_codec_rejected(self):
+        """Test that only zstd and gzip are accepted."""
+        with self.assertRaises(ValueError):
+            SnapshotStore(self.tmp.name, codec="brotli")
+
+
+class TestSnapshotReplay(unittest.TestCase):
+    """Test suite for replaying stored pages through the parser."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SnapshotStore(self.tmp.name, codec="gzip")
+        self.store.put(URL, load_fixture("listing_next_data.html"))
+        self.store.put("https://www.leboncoin.fr/ad/ordinateurs/2", load_fixture("listing_html_only.html"))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def replay(self, urls=None):
+        async def collect():
+            return [r async for r in SnapshotReplayer(self.store).get_many_listings(urls)]
+        return asyncio.run(collect())
+
+    def test_replays_every_stored_url(self):
+        """Test that replay without URLs parses every stored page."""
+        # Records come back as they are parsed, not in index order
+        records = {r["url"]: r for r in self.replay()}
+        self.assertEqual(records["https://www.leboncoin.fr/ad/ordinateurs/2"]["extracted_from"], "html")
+        self.assertEqual(records[URL]["extracted_from"], "next_data")
+        self.assertEqual(records[URL]["title"], "PC Gamer RTX 3060 Ryzen 5 5600X")
+        self.assertEqual(records[URL]["price_str"], "650")
+        self.assertIn("elapsed_s", records[URL])
+
+    def test_missing_snapshot_yields_error_record(self):
+        """Test that URLs never stored come back as pipeline error records."""
+        records = self.replay([URL, "https://www.leboncoin.fr/ad/ordinateurs/404"])
+        self.assertEqual(records[0]["url"], URL)
+        self.assertEqual(records[1]["error_type"], "LookupError")
+
+    def test_captures_parsed_concurrently(self):
+        """Test that up to `concurrency` captures are in the parse pool at once."""
+        for n in range(3, 9):
+            self.store.put(f"https://www.leboncoin.fr/ad/ordinateurs/{n}", load_fixture("listing_json_ld.html"))
+
+        class SlowPool:
+            workers = 4
+            in_flight = peak = 0
+
+            async def parse(self, html=None, next_data=None):
+                SlowPool.in_flight += 1
+                SlowPool.peak = max(SlowPool.peak, SlowPool.in_flight)
+                await asyncio.sleep(0.02)
+                SlowPool.in_flight -= 1
+                return parse_listing_html(html)
+
+        async def collect():
+            replayer = SnapshotReplayer(self.store, parse_pool=SlowPool())
+            return [r async for r in replayer.get_many_listings(concurrency=4)]
+        records = asyncio.run(collect())
+        self.assertEqual(len(records), 8)
+        self.assertEqual(SlowPool.peak, 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
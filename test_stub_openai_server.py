@@ -0,0 +1,110 @@
+"""
+test_stub_openai_server.py
+End-to-end tests of the analyzer against the local OpenAI stub (stub_openai_server.py).
+"""
+
+import asyncio
+import os
+import tempfile
+import unittest
+
+from openai import RateLimitError
+
+import price_fetcher
+from analyzer import AntigravityAnalyzer
+from stub_openai_server import StubSettings, answer_prompt, start_server
+
+LISTING = {
+    "url": "https://www.leboncoin.fr/ad/ordinateurs/3082027877",
+    "title": "PC Gamer RTX 3060",
+    "price_str": "400",
+    "raw_text": "Processeur Ryzen 5 5600X, carte graphique RTX 3060 12 Go, 16 Go DDR4, SSD 1 To. Aucune panne.",
+}
+
+
+class StubServerTestCase(unittest.TestCase):
+    def setUp(self):
+        # Part prices are looked up in (and saved to) a throwaway cache
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        previous = price_fetcher.set_cache_backend(
+            price_fetcher.CsvComponentCache(os.path.join(self.tmp.name, "cache.csv")))
+        self.addCleanup(price_fetcher.set_cache_backend, previous)
+
+    def start(self, **settings):
+        server = start_server(settings=StubSettings(seed=1, **settings))
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def make_analyzer(self, server, **kwargs):
+        return AntigravityAnalyzer(base_url=server.base_url, backoff_base=0.01, backoff_max=0.05, **kwargs)
+
+
+class TestAnswers(unittest.TestCase):
+    """Test suite for the generated appraisals."""
+
+    def test_single_prompt_lists_the_parts(self):
+        """Test that the parts named in the listing come back priced."""
+        answer = answer_prompt(AntigravityAnalyzer(client=object())._build_prompt(LISTING))
+        components = " ".join(part["component"] for part in answer["parts"])
+        self.assertIn("RTX 3060", components)
+        self.assertIn("Ryzen 5 5600X", components)
+        self.assertTrue(all(part["estimated_price"] >= 0 for part in answer["parts"]))
+        self.assertEqual(answer["listing_price"], 400.0)
+        self.assertNotEqual(answer["verdict"], "TRASH") # "Aucune panne" is not a fault
+
+    def test_batch_prompt_one_result_per_listing(self):
+        """Test ids and the TRASH verdict in a batched answer."""
+        broken = dict(LISTING, title="PC HS pour pièces")
+        prompt = AntigravityAnalyzer(client=object())._build_batch_prompt([LISTING, broken], ["L1", "L2"])
+        results = answer_prompt(prompt)["results"]
+        self.assertEqual([r["id"] for r in results], ["L1", "L2"])
+        self.assertEqual(results[1]["verdict"], "TRASH")
+
+
+class TestAnalyzerAgainstStub(StubServerTestCase):
+    """Test suite for the analyzer's client paths over HTTP."""
+
+    def test_sync_and_async_analysis(self):
+        """Test that both clients built from base_url reach the stub."""
+        server = self.start()
+        analyzer = self.make_analyzer(server)
+        result = analyzer.analyze_profitability(LISTING)
+        self.assertTrue(result["parts"])
+        result = asyncio.run(analyzer.analyze_profitability_async(LISTING))
+        self.assertTrue(result["parts"])
+        self.assertEqual(server.counts["ok"], 2)
+
+    def test_rate_limits_are_retried(self):
+        """Test that 429s are retried until the retry budget runs out."""
+        server = self.start(rate_limit_rate=1.0)
+        analyzer = self.make_analyzer(server, max_retries=2)
+        with self.assertRaises(RateLimitError):
+            asyncio.run(analyzer.analyze_profitability_async(LISTING))
+        self.assertEqual(server.counts["rate_limited"], 3)
+        self.assertEqual(analyzer.retries, 2)
+
+    def test_errors_recovered_under_concurrency(self):
+        """Test that concurrent analyses all complete despite injected 500s."""
+        server = self.start(error_rate=0.3, latency_ms=20)
+        analyzer = self.make_analyzer(server, max_concurrency=4, max_retries=10)
+        listings = [dict(LISTING, url=f"{LISTING['url']}{n}") for n in range(12)]
+        results = asyncio.run(analyzer.analyze_many_async(listings))
+        self.assertFalse([r for r in results if isinstance(r, Exception)])
+        self.assertEqual(server.counts["ok"], 12)
+        self.assertEqual(analyzer.retries, server.counts["errors"])
+
+    def test_batch_with_dropped_listings(self):
+        """Test that listings left out of a batched answer are analyzed on their own."""
+        server = self.start(drop_rate=0.5)
+        analyzer = self.make_analyzer(server)
+        listings = [dict(LISTING, url=f"{LISTING['url']}{n}") for n in range(6)]
+        results = asyncio.run(analyzer.analyze_batch_async(listings, batch_size=6))
+        self.assertTrue(all(isinstance(r, dict) and r["parts"] for r in results))
+        self.assertEqual(analyzer.batch_requests, 1)
+        self.assertEqual(server.counts["ok"], 1 + analyzer.batch_item_retries)
+
+
+if __name__ == "__main__":
+    unittest.main()